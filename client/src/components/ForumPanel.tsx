@@ -1,4 +1,5 @@
 import { useState, useEffect } from 'react';
+import { useRealtime } from '../realtime';
 import { ThumbsUp, MessageCircle, Trash2, Send, Image as ImageIcon, X, PlusCircle } from 'lucide-react';
 
 interface UserInfo {
@@ -50,16 +51,19 @@ export default function ForumPanel() {
   
   // Comment inputs
   const [commentInputs, setCommentInputs] = useState<{[key: string]: string}>({});
+  
+  // Full comment lists loaded on demand (the feed only carries the latest few)
+  const [expandedComments, setExpandedComments] = useState<{[key: string]: Comment[]}>({});
 
   useEffect(() => {
     loadCurrentUser();
     loadPosts();
-    
-    // Auto-refresh every 10 seconds
-    const interval = setInterval(loadPosts, 10000);
-    return () => clearInterval(interval);
   }, []);
 
+  // Refresh the feed when someone posts (and after every reconnect)
+  useRealtime('open', () => loadPosts());
+  useRealtime('post', () => loadPosts());
+
   const loadCurrentUser = async () => {
     try {
       const token = localStorage.getItem('token');
@@ -150,6 +154,22 @@ export default function ForumPanel() {
     }
   };
 
+  const loadComments = async (postId: string) => {
+    try {
+      const token = localStorage.getItem('token');
+      const response = await fetch(`${API_BASE}/forum/posts/${postId}/comments`, {
+        headers: { Authorization: `Bearer ${token}` },
+      });
+      
+      if (response.ok) {
+        const data = await response.json();
+        setExpandedComments(prev => ({ ...prev, [postId]: data }));
+      }
+    } catch (error) {
+      console.error('Failed to load comments:', error);
+    }
+  };
+
   const addComment = async (postId: string) => {
     const content = commentInputs[postId];
     if (!content?.trim()) return;
@@ -168,6 +188,9 @@ export default function ForumPanel() {
       if (response.ok) {
         setCommentInputs({ ...commentInputs, [postId]: '' });
         loadPosts();
+        if (expandedComments[postId]) {
+          loadComments(postId);
+        }
       }
     } catch (error) {
       console.error('Failed to add comment:', error);
@@ -203,6 +226,13 @@ export default function ForumPanel() {
       });
       
       if (response.ok) {
+        setExpandedComments(prev => {
+          const next: {[key: string]: Comment[]} = {};
+          for (const [postId, comments] of Object.entries(prev)) {
+            next[postId] = comments.filter(c => c.id !== commentId);
+          }
+          return next;
+        });
         loadPosts();
       }
     } catch (error) {
@@ -614,7 +644,23 @@ export default function ForumPanel() {
               {/* Comments Section */}
               {post.comments.length > 0 && (
                 <div style={{ marginTop: '20px', paddingTop: '20px', borderTop: '1px solid #f3f4f6' }}>
-                  {post.comments.map(comment => (
+                  {!expandedComments[post.id] && post.comments_count > post.comments.length && (
+                    <button
+                      onClick={() => loadComments(post.id)}
+                      style={{
+                        background: 'none',
+                        border: 'none',
+                        cursor: 'pointer',
+                        color: '#667eea',
+                        fontWeight: '500',
+                        fontSize: '14px',
+                        padding: '0 0 12px 0'
+                      }}
+                    >
+                      View all {post.comments_count} comments
+                    </button>
+                  )}
+                  {(expandedComments[post.id] ?? post.comments).map(comment => (
                     <div key={comment.id} style={{
                       marginBottom: '16px',
                       padding: '12px',
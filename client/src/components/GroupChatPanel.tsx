@@ -1,5 +1,6 @@
 import { useState, useEffect, useRef } from 'react';
 import { Users, Plus, Send, UserPlus, LogOut, Clock, X } from 'lucide-react';
+import { useRealtime } from '../realtime';
 
 interface UserInfo {
   id: string;
@@ -68,17 +69,20 @@ export default function GroupChatPanel() {
     loadCurrentUser();
     loadGroups();
     loadAvailableUsers();
-    
-    // Auto-refresh
-    const interval = setInterval(() => {
-      if (selectedGroup) {
-        loadMessages(selectedGroup.id, false);
-      }
-      loadGroups();
-    }, 5000);
-    
-    return () => clearInterval(interval);
-  }, [selectedGroup]);
+  }, []);
+
+  // Live updates instead of polling; resync after every (re)connect
+  useRealtime('open', () => {
+    loadGroups();
+    if (selectedGroup) {
+      loadMessages(selectedGroup.id, false);
+    }
+  });
+
+  useRealtime('group_message', (message: GroupMessage) => {
+    if (message.group_id !== selectedGroup?.id) return;
+    setMessages(prev => prev.some(m => m.id === message.id) ? prev : [...prev, message]);
+  });
 
   useEffect(() => {
     scrollToBottom();
@@ -106,7 +110,8 @@ export default function GroupChatPanel() {
   const loadGroups = async () => {
     try {
       const token = localStorage.getItem('token');
-      const response = await fetch(`${API_BASE}/groups/`, {
+      // The sidebar only needs counts; members are loaded for the open group
+      const response = await fetch(`${API_BASE}/groups/?include_members=false`, {
         headers: { Authorization: `Bearer ${token}` },
       });
       if (response.ok) {
@@ -151,8 +156,24 @@ export default function GroupChatPanel() {
     }
   };
 
+  const loadGroupDetails = async (groupId: string) => {
+    try {
+      const token = localStorage.getItem('token');
+      const response = await fetch(`${API_BASE}/groups/${groupId}`, {
+        headers: { Authorization: `Bearer ${token}` },
+      });
+      if (response.ok) {
+        const data = await response.json();
+        setSelectedGroup(current => current?.id === groupId ? data : current);
+      }
+    } catch (error) {
+      console.error('Failed to load group:', error);
+    }
+  };
+
   const selectGroup = (group: Group) => {
     setSelectedGroup(group);
+    loadGroupDetails(group.id);
     loadMessages(group.id);
   };
 
@@ -202,18 +223,7 @@ export default function GroupChatPanel() {
       
       if (response.ok) {
         loadGroups();
-        // Reload selected group
-        const updatedGroup = groups.find(g => g.id === selectedGroup.id);
-        if (updatedGroup) {
-          const token = localStorage.getItem('token');
-          const groupResponse = await fetch(`${API_BASE}/groups/${selectedGroup.id}`, {
-            headers: { Authorization: `Bearer ${token}` },
-          });
-          if (groupResponse.ok) {
-            const data = await groupResponse.json();
-            setSelectedGroup(data);
-          }
-        }
+        loadGroupDetails(selectedGroup.id);
       }
     } catch (error) {
       console.error('Failed to add member:', error);
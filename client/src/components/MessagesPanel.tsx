@@ -1,5 +1,6 @@
 import { useState, useEffect, useRef } from 'react';
 import { Send, MessageSquare, User, Clock } from 'lucide-react';
+import { useRealtime } from '../realtime';
 
 interface UserInfo {
   id: string;
@@ -40,27 +41,36 @@ export default function MessagesPanel() {
   const [currentUserId, setCurrentUserId] = useState<string>('');
   const [showNewChat, setShowNewChat] = useState(false);
   
+  // Keyset cursors for the open chat: newest message seen / next older page
+  const syncCursorRef = useRef<string | null>(null);
+  const [olderCursor, setOlderCursor] = useState<string | null>(null);
+  
   const messagesEndRef = useRef<HTMLDivElement>(null);
 
   useEffect(() => {
     loadCurrentUser();
     loadConversations();
     loadAllUsers();
-    
-    // Auto-refresh every 5 seconds
-    const interval = setInterval(() => {
-      if (selectedUser) {
-        loadMessages(selectedUser.id, false);
-      }
-      loadConversations();
-    }, 5000);
-    
-    return () => clearInterval(interval);
-  }, [selectedUser]);
+  }, []);
+
+  // Live updates instead of polling; resync after every (re)connect
+  useRealtime('open', () => {
+    if (selectedUser) {
+      syncMessages(selectedUser.id);
+    }
+    loadConversations();
+  });
+
+  useRealtime('message', (message: Message) => {
+    if (selectedUser && (message.sender_id === selectedUser.id || message.receiver_id === selectedUser.id)) {
+      syncMessages(selectedUser.id);
+    }
+    loadConversations();
+  });
 
   useEffect(() => {
     scrollToBottom();
-  }, [messages]);
+  }, [messages.length > 0 ? messages[messages.length - 1].id : null]);
 
   const scrollToBottom = () => {
     messagesEndRef.current?.scrollIntoView({ behavior: 'smooth' });
@@ -120,6 +130,8 @@ export default function MessagesPanel() {
       });
       if (response.ok) {
         const data = await response.json();
+        syncCursorRef.current = response.headers.get('X-Sync-Cursor');
+        setOlderCursor(response.headers.get('X-Next-Cursor'));
         setMessages(data);
         // Refresh conversations to update unread count
         if (showLoading) loadConversations();
@@ -131,6 +143,50 @@ export default function MessagesPanel() {
     }
   };
 
+  // Fetch only messages newer than the last one we have
+  const syncMessages = async (userId: string) => {
+    if (!syncCursorRef.current) {
+      return loadMessages(userId, false);
+    }
+    try {
+      const token = localStorage.getItem('token');
+      const since = encodeURIComponent(syncCursorRef.current);
+      const response = await fetch(`${API_BASE}/messages/${userId}?since=${since}`, {
+        headers: { Authorization: `Bearer ${token}` },
+      });
+      if (response.ok) {
+        const data: Message[] = await response.json();
+        syncCursorRef.current = response.headers.get('X-Sync-Cursor') || syncCursorRef.current;
+        if (data.length > 0) {
+          setMessages(prev => {
+            const seen = new Set(prev.map(m => m.id));
+            return [...prev, ...data.filter(m => !seen.has(m.id))];
+          });
+        }
+      }
+    } catch (error) {
+      console.error('Failed to sync messages:', error);
+    }
+  };
+
+  const loadOlderMessages = async () => {
+    if (!selectedUser || !olderCursor) return;
+    try {
+      const token = localStorage.getItem('token');
+      const before = encodeURIComponent(olderCursor);
+      const response = await fetch(`${API_BASE}/messages/${selectedUser.id}?before=${before}`, {
+        headers: { Authorization: `Bearer ${token}` },
+      });
+      if (response.ok) {
+        const data: Message[] = await response.json();
+        setOlderCursor(response.headers.get('X-Next-Cursor'));
+        setMessages(prev => [...data, ...prev]);
+      }
+    } catch (error) {
+      console.error('Failed to load older messages:', error);
+    }
+  };
+
   const sendMessage = async () => {
     if (!newMessage.trim() || !selectedUser) return;
     
@@ -150,7 +206,7 @@ export default function MessagesPanel() {
       
       if (response.ok) {
         setNewMessage('');
-        loadMessages(selectedUser.id, false);
+        syncMessages(selectedUser.id);
         loadConversations();
       }
     } catch (error) {
@@ -159,6 +215,8 @@ export default function MessagesPanel() {
   };
 
   const selectUser = (user: UserInfo) => {
+    syncCursorRef.current = null;
+    setOlderCursor(null);
     setSelectedUser(user);
     setShowNewChat(false);
     loadMessages(user.id);
@@ -364,7 +422,25 @@ export default function MessagesPanel() {
                   <p style={{ fontSize: '14px' }}>Start the conversation!</p>
                 </div>
               ) : (
-                messages.map(msg => {
+                <>
+                {olderCursor && (
+                  <div style={{ textAlign: 'center', marginBottom: '16px' }}>
+                    <button
+                      onClick={loadOlderMessages}
+                      style={{
+                        background: 'none',
+                        border: 'none',
+                        cursor: 'pointer',
+                        color: '#667eea',
+                        fontWeight: '500',
+                        fontSize: '14px'
+                      }}
+                    >
+                      Load older messages
+                    </button>
+                  </div>
+                )}
+                {messages.map(msg => {
                   const isOwn = msg.sender_id === currentUserId;
                   return (
                     <div
@@ -398,7 +474,8 @@ export default function MessagesPanel() {
                       </div>
                     </div>
                   );
-                })
+                })}
+                </>
               )}
               <div ref={messagesEndRef} />
             </div>
@@ -14,6 +14,7 @@ import MyResourcesPanel from '../components/MyResourcesPanel';
 import ResourceTransactionsPanel from '../components/ResourceTransactionsPanel';
 import ResourcePoolPanel from '../components/ResourcePoolPanel';
 import ConversationSidebar, { Conversation } from '../components/ConversationSidebar';
+import { useRealtime } from '../realtime';
 import { MessageSquare, BarChart3, Key, Settings, LogOut, Zap, DollarSign, Mail, Users, UserCircle, UsersRound, Store, Package, Receipt, ChevronDown, Database } from 'lucide-react';
 
 interface DashboardProps {
@@ -41,6 +42,10 @@ export default function Dashboard({ token, user, onLogout }: DashboardProps) {
   
   // User menu state
   const [showUserMenu, setShowUserMenu] = useState(false);
+  
+  // Unread direct messages (pushed by the server)
+  const [unreadMessages, setUnreadMessages] = useState(0);
+  useRealtime('unread_count', (data: { unread_count: number }) => setUnreadMessages(data.unread_count));
 
   useEffect(() => {
     const handleResize = () => {
@@ -487,6 +492,19 @@ export default function Dashboard({ token, user, onLogout }: DashboardProps) {
                 >
                   <Icon size={isMobile ? 16 : 18} />
                   {!isMobile && label}
+                  {tab === 'messages' && unreadMessages > 0 && (
+                    <span style={{
+                      background: '#ef4444',
+                      color: 'white',
+                      borderRadius: '10px',
+                      padding: '0 6px',
+                      fontSize: '11px',
+                      fontWeight: '600',
+                      lineHeight: '18px'
+                    }}>
+                      {unreadMessages}
+                    </span>
+                  )}
                 </button>
               </div>
             );
@@ -0,0 +1,71 @@
+/**
+ * Real-time events (Server-Sent Events)
+ *
+ * One EventSource per tab, shared by every panel. Panels subscribe to the
+ * event types they care about instead of polling. 'open' fires on every
+ * (re)connect so panels can resync whatever they missed while offline.
+ */
+import { useEffect, useRef } from 'react';
+
+// Use full URL for production to bypass proxy issues
+const API_BASE = import.meta.env.VITE_API_BASE ||
+  (typeof window !== 'undefined' && window.location.hostname !== 'localhost'
+    ? `http://${window.location.hostname}:8000/api`
+    : '/api');
+
+export type RealtimeEvent = 'open' | 'message' | 'unread_count' | 'group_message' | 'post';
+
+type Handler = (data: any) => void;
+
+const EVENT_TYPES: RealtimeEvent[] = ['message', 'unread_count', 'group_message', 'post'];
+const handlers: { [type: string]: Set<Handler> } = {};
+let source: EventSource | null = null;
+let sourceToken: string | null = null;
+
+function emit(type: RealtimeEvent, data: any) {
+  handlers[type]?.forEach(handler => handler(data));
+}
+
+function connect() {
+  const token = localStorage.getItem('token');
+  if (source && sourceToken === token) return;
+  source?.close();
+  source = null;
+  sourceToken = token;
+  if (!token) return;
+
+  source = new EventSource(`${API_BASE}/realtime/events?token=${encodeURIComponent(token)}`);
+  source.onopen = () => emit('open', null);
+  for (const type of EVENT_TYPES) {
+    source.addEventListener(type, (e) => emit(type, JSON.parse((e as MessageEvent).data)));
+  }
+}
+
+function disconnectIfIdle() {
+  const listening = Object.values(handlers).some(set => set.size > 0);
+  if (!listening && source) {
+    source.close();
+    source = null;
+    sourceToken = null;
+  }
+}
+
+export function subscribe(type: RealtimeEvent, handler: Handler): () => void {
+  (handlers[type] ??= new Set()).add(handler);
+  connect();
+  return () => {
+    handlers[type].delete(handler);
+    disconnectIfIdle();
+  };
+}
+
+/**
+ * Subscribe a component to an event type for its lifetime.
+ * The latest handler is always called, so it can use current state.
+ */
+export function useRealtime(type: RealtimeEvent, handler: Handler) {
+  const handlerRef = useRef(handler);
+  handlerRef.current = handler;
+
+  useEffect(() => subscribe(type, (data) => handlerRef.current(data)), [type]);
+}
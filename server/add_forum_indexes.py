@@ -0,0 +1,48 @@
+"""
+Add forum indexes used by the batched feed queries
+
+- comments (post_id, created_at)
+- post_likes (user_id, post_id)
+
+New databases get them from init_db(); this script adds them to existing
+ones. Works on both SQLite and PostgreSQL.
+"""
+
+from sqlalchemy import create_engine, inspect
+from config import settings
+from models_forum import Comment, PostLike
+
+
+INDEX_NAMES = {
+    "ix_comments_post_created",
+    "ix_post_likes_user_post",
+}
+
+INDEXES = [
+    index
+    for model in (Comment, PostLike)
+    for index in model.__table__.indexes
+    if index.name in INDEX_NAMES
+]
+
+
+def migrate():
+    print("🔧 Adding forum feed indexes...")
+
+    engine = create_engine(settings.database_url)
+    inspector = inspect(engine)
+
+    for index in INDEXES:
+        table = index.table.name
+        existing = {ix["name"] for ix in inspector.get_indexes(table)}
+        if index.name in existing:
+            print(f"  ⏭️  {index.name} already exists")
+            continue
+        index.create(bind=engine)
+        print(f"  ✅ Created {index.name} on {table}")
+
+    print("✅ Migration completed successfully!")
+
+
+if __name__ == "__main__":
+    migrate()
@@ -0,0 +1,43 @@
+"""
+Add group membership indexes
+
+- group_members (group_id, joined_at)
+- group_members (user_id, group_id)
+
+New databases get them from init_db(); this script adds them to existing
+ones. Works on both SQLite and PostgreSQL.
+"""
+
+from sqlalchemy import create_engine, inspect
+from config import settings
+from models_group import GroupMember
+
+
+INDEX_NAMES = {
+    "ix_group_members_group_joined",
+    "ix_group_members_user_group",
+}
+
+INDEXES = [index for index in GroupMember.__table__.indexes if index.name in INDEX_NAMES]
+
+
+def migrate():
+    print("🔧 Adding group membership indexes...")
+
+    engine = create_engine(settings.database_url)
+    inspector = inspect(engine)
+
+    for index in INDEXES:
+        table = index.table.name
+        existing = {ix["name"] for ix in inspector.get_indexes(table)}
+        if index.name in existing:
+            print(f"  ⏭️  {index.name} already exists")
+            continue
+        index.create(bind=engine)
+        print(f"  ✅ Created {index.name} on {table}")
+
+    print("✅ Migration completed successfully!")
+
+
+if __name__ == "__main__":
+    migrate()
@@ -0,0 +1,43 @@
+"""
+Add direct message indexes
+
+- messages (sender_id, receiver_id, created_at)
+- messages (receiver_id, is_read)
+
+New databases get them from init_db(); this script adds them to existing
+ones. Works on both SQLite and PostgreSQL.
+"""
+
+from sqlalchemy import create_engine, inspect
+from config import settings
+from models_message import Message
+
+
+INDEX_NAMES = {
+    "ix_messages_sender_receiver_created",
+    "ix_messages_receiver_read",
+}
+
+INDEXES = [index for index in Message.__table__.indexes if index.name in INDEX_NAMES]
+
+
+def migrate():
+    print("🔧 Adding direct message indexes...")
+
+    engine = create_engine(settings.database_url)
+    inspector = inspect(engine)
+
+    for index in INDEXES:
+        table = index.table.name
+        existing = {ix["name"] for ix in inspector.get_indexes(table)}
+        if index.name in existing:
+            print(f"  ⏭️  {index.name} already exists")
+            continue
+        index.create(bind=engine)
+        print(f"  ✅ Created {index.name} on {table}")
+
+    print("✅ Migration completed successfully!")
+
+
+if __name__ == "__main__":
+    migrate()
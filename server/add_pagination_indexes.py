@@ -0,0 +1,75 @@
+"""
+Add composite indexes for keyset (cursor) pagination
+
+- usage_logs (user_id, timestamp, id)
+- credit_transactions (user_id, created_at, id)
+- posts (created_at, id)
+- pool_usage_logs (created_at, id)
+
+New databases get them from init_db(); this script adds them to existing
+ones. Works on both SQLite and PostgreSQL.
+
+On SQLite it also rewrites pool_usage_logs.created_at values stored by the
+old server default ('YYYY-MM-DD HH:MM:SS') to the microsecond format
+SQLAlchemy binds cursors with. Otherwise rows from the cursor's second sort
+below it as text and paging repeats the same page.
+"""
+
+from sqlalchemy import create_engine, inspect, text
+from config import settings
+from models import UsageLog
+from models_credit import CreditTransaction
+from models_forum import Post
+from models_resource_pool import PoolUsageLog
+
+
+INDEX_NAMES = {
+    "ix_usage_logs_user_timestamp_id",
+    "ix_credit_transactions_user_created_id",
+    "ix_posts_created_id",
+    "ix_pool_usage_logs_created_id",
+}
+
+INDEXES = [
+    index
+    for model in (UsageLog, CreditTransaction, Post, PoolUsageLog)
+    for index in model.__table__.indexes
+    if index.name in INDEX_NAMES
+]
+
+
+def normalize_pool_usage_timestamps(engine) -> int:
+    """Pad second-precision created_at strings to '.000000' (SQLite only)"""
+    if engine.dialect.name != "sqlite":
+        return 0
+    with engine.begin() as conn:
+        return conn.execute(text(
+            "UPDATE pool_usage_logs SET created_at = created_at || '.000000' "
+            "WHERE length(created_at) = 19"
+        )).rowcount
+
+
+def migrate():
+    print("🔧 Adding keyset pagination indexes...")
+
+    engine = create_engine(settings.database_url)
+    inspector = inspect(engine)
+
+    for index in INDEXES:
+        table = index.table.name
+        existing = {ix["name"] for ix in inspector.get_indexes(table)}
+        if index.name in existing:
+            print(f"  ⏭️  {index.name} already exists")
+            continue
+        index.create(bind=engine)
+        print(f"  ✅ Created {index.name} on {table}")
+
+    normalized = normalize_pool_usage_timestamps(engine)
+    if normalized:
+        print(f"  ✅ Normalized {normalized} pool_usage_logs timestamps")
+
+    print("✅ Migration completed successfully!")
+
+
+if __name__ == "__main__":
+    migrate()
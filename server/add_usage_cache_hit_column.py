@@ -0,0 +1,29 @@
+"""
+Add cache_hit column to usage_logs table
+
+Records whether a chat response was served from the completion cache.
+Works on both SQLite and PostgreSQL.
+"""
+
+from sqlalchemy import create_engine, inspect, text
+from config import settings
+
+
+def migrate():
+    print("🔧 Adding cache_hit column to usage_logs table...")
+
+    engine = create_engine(settings.database_url)
+    columns = {col["name"] for col in inspect(engine).get_columns("usage_logs")}
+
+    if "cache_hit" in columns:
+        print("  ⏭️  cache_hit column already exists")
+        return
+
+    with engine.begin() as conn:
+        conn.execute(text("ALTER TABLE usage_logs ADD COLUMN cache_hit BOOLEAN DEFAULT FALSE"))
+
+    print("✅ Migration completed successfully!")
+
+
+if __name__ == "__main__":
+    migrate()
@@ -0,0 +1,79 @@
+"""
+Backfill usage_daily_rollups from usage_logs
+
+Rebuilds the rollups for every day (or only days since --since YYYY-MM-DD)
+with one INSERT ... SELECT ... GROUP BY. Run once after upgrading, or any
+time the rollups need to be recomputed. Works on both SQLite and PostgreSQL.
+
+Usage:
+    python backfill_usage_rollups.py
+    python backfill_usage_rollups.py --since 2025-01-01
+"""
+import argparse
+from datetime import datetime
+from sqlalchemy import create_engine, func, cast, Date, select, insert, delete, literal_column
+from config import settings
+from database import Base
+from models import UsageLog, UsageDailyRollup
+
+
+def day_expression(dialect_name: str):
+    # CAST(... AS DATE) is not a real date conversion on SQLite
+    if dialect_name == "sqlite":
+        return func.date(UsageLog.timestamp)
+    return cast(UsageLog.timestamp, Date)
+
+
+def backfill(since: datetime = None):
+    print("🔧 Backfilling usage_daily_rollups from usage_logs...")
+
+    engine = create_engine(settings.database_url)
+    Base.metadata.create_all(bind=engine, tables=[UsageDailyRollup.__table__])
+
+    day = day_expression(engine.dialect.name)
+    if engine.dialect.name == "postgresql":
+        row_id = func.gen_random_uuid().cast(UsageDailyRollup.id.type)
+    else:
+        row_id = func.lower(func.hex(func.randomblob(16)))
+
+    source = select(
+        row_id,
+        UsageLog.user_id,
+        day.label("day"),
+        UsageLog.model_name,
+        func.coalesce(UsageLog.task_type, literal_column("'text-generation'")),
+        func.count(UsageLog.id),
+        func.coalesce(func.sum(UsageLog.input_tokens), 0),
+        func.coalesce(func.sum(UsageLog.output_tokens), 0),
+        func.coalesce(func.sum(UsageLog.total_tokens), 0),
+    )
+    clear = delete(UsageDailyRollup)
+    if since:
+        source = source.where(UsageLog.timestamp >= since)
+        clear = clear.where(UsageDailyRollup.day >= since.date())
+    source = source.group_by(
+        UsageLog.user_id,
+        day,
+        UsageLog.model_name,
+        func.coalesce(UsageLog.task_type, literal_column("'text-generation'")),
+    )
+
+    with engine.begin() as conn:
+        removed = conn.execute(clear).rowcount
+        inserted = conn.execute(
+            insert(UsageDailyRollup).from_select(
+                ["id", "user_id", "day", "model_name", "task_type",
+                 "requests", "input_tokens", "output_tokens", "total_tokens"],
+                source
+            )
+        ).rowcount
+
+    print(f"  🗑️  Removed {removed} old rollup rows")
+    print(f"✅ Backfill completed: {inserted} rollup rows")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rebuild usage rollups from usage_logs")
+    parser.add_argument("--since", help="Only rebuild days from this date (YYYY-MM-DD)")
+    args = parser.parse_args()
+    backfill(datetime.strptime(args.since, "%Y-%m-%d") if args.since else None)
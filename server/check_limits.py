@@ -1,11 +1,12 @@
 """
 User quota/limit checking utilities
 """
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from sqlalchemy import func
-from models import User, UserLimit, UsageLog
-from datetime import datetime, timedelta
+from models import User, UserLimit
 from fastapi import HTTPException, status
+from quota_counters import quota_counters
 
 
 def check_user_limits(user: User, db: Session, estimated_tokens: int = 0):
@@ -31,32 +32,37 @@ def check_user_limits(user: User, db: Session, estimated_tokens: int = 0):
     if not user_limit or not user_limit.is_limited:
         return
     
-    # Calculate time boundaries
-    now = datetime.utcnow()
-    today_start = datetime(now.year, now.month, now.day)
-    month_start = datetime(now.year, now.month, 1)
-    
-    # Query today's usage
-    today_usage = db.query(
-        func.count(UsageLog.id).label('requests'),
-        func.sum(UsageLog.total_tokens).label('tokens')
-    ).filter(
-        UsageLog.user_id == user.id,
-        UsageLog.timestamp >= today_start
-    ).first()
-    
-    # Query this month's usage
-    month_usage = db.query(
-        func.sum(UsageLog.total_tokens).label('tokens')
-    ).filter(
-        UsageLog.user_id == user.id,
-        UsageLog.timestamp >= month_start
-    ).first()
-    
-    # Extract values (handle None)
-    today_requests = today_usage.requests or 0
-    today_tokens = today_usage.tokens or 0
-    month_tokens = month_usage.tokens or 0
+    # Current day/month usage from the quota counters (O(1))
+    usage = quota_counters.get_usage(user.id, db)
+    _enforce_limits(user_limit, usage, estimated_tokens)
+
+
+async def check_user_limits_async(user: User, db: AsyncSession, estimated_tokens: int = 0):
+    """
+    check_user_limits() for async routes
+    
+    The quota counter read (Redis) runs in a worker thread instead of on
+    the event loop.
+    """
+    if user.is_admin:
+        return
+    
+    user_limit = (await db.execute(
+        select(UserLimit).where(UserLimit.user_id == user.id)
+    )).scalar_one_or_none()
+    
+    if not user_limit or not user_limit.is_limited:
+        return
+    
+    usage = await quota_counters.get_usage_async(user.id, db)
+    _enforce_limits(user_limit, usage, estimated_tokens)
+
+
+def _enforce_limits(user_limit: UserLimit, usage: dict, estimated_tokens: int):
+    """Raise 429 when the usage (plus the upcoming request) exceeds a limit"""
+    today_requests = usage["today_requests"]
+    today_tokens = usage["today_tokens"]
+    month_tokens = usage["month_tokens"]
     
     # Check daily request limit
     if user_limit.max_requests_per_day > 0:  # 0 means unlimited
@@ -111,32 +117,13 @@ def get_user_remaining_quota(user: User, db: Session) -> dict:
             "monthly_tokens_remaining": -1
         }
     
-    # Calculate time boundaries
-    now = datetime.utcnow()
-    today_start = datetime(now.year, now.month, now.day)
-    month_start = datetime(now.year, now.month, 1)
-    
-    # Query today's usage
-    today_usage = db.query(
-        func.count(UsageLog.id).label('requests'),
-        func.sum(UsageLog.total_tokens).label('tokens')
-    ).filter(
-        UsageLog.user_id == user.id,
-        UsageLog.timestamp >= today_start
-    ).first()
-    
-    # Query this month's usage
-    month_usage = db.query(
-        func.sum(UsageLog.total_tokens).label('tokens')
-    ).filter(
-        UsageLog.user_id == user.id,
-        UsageLog.timestamp >= month_start
-    ).first()
+    # Current day/month usage from the quota counters (O(1))
+    usage = quota_counters.get_usage(user.id, db)
     
     # Calculate remaining quotas
-    today_requests = today_usage.requests or 0
-    today_tokens = today_usage.tokens or 0
-    month_tokens = month_usage.tokens or 0
+    today_requests = usage["today_requests"]
+    today_tokens = usage["today_tokens"]
+    month_tokens = usage["month_tokens"]
     
     return {
         "unlimited": False,
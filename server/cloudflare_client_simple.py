@@ -3,62 +3,51 @@ Cloudflare Workers AI API client - SIMPLIFIED VERSION
 Only includes verified working models
 """
 import httpx
+import json
 import time
-import tiktoken
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, AsyncGenerator
 from config import settings
+from http_client import get_http_client, get_task_timeout
+from tokenizer_service import tokenizer_service
+from model_registry import model_registry
 
 
-# Verified working models - tested and confirmed available
-AVAILABLE_MODELS = [
-    # Text Generation - Core Models (Verified Working)
-    {"id": "@cf/openai/gpt-oss-120b", "name": "GPT OSS 120B", "provider": "OpenAI", "task": "text-generation", "description": "OpenAI's open-weight model for powerful reasoning and agentic tasks", "capabilities": ["batch"], "status": "active"},
-    {"id": "@cf/openai/gpt-oss-20b", "name": "GPT OSS 20B", "provider": "OpenAI", "task": "text-generation", "description": "Lower latency model for local or specialized use-cases", "capabilities": [], "status": "active"},
-    {"id": "@cf/meta/llama-3.1-8b-instruct", "name": "Llama 3.1 8B Instruct", "provider": "Meta", "task": "text-generation", "description": "Fast and reliable, multilingual dialogue", "capabilities": [], "status": "active"},
-    {"id": "@cf/meta/llama-3-8b-instruct", "name": "Llama 3 8B Instruct", "provider": "Meta", "task": "text-generation", "description": "Stable version, good for general use", "capabilities": [], "status": "active"},
-    {"id": "@cf/meta/llama-2-7b-chat-fp16", "name": "Llama 2 7B Chat FP16", "provider": "Meta", "task": "text-generation", "description": "Stable, widely compatible", "capabilities": [], "status": "active"},
-    {"id": "@cf/mistral/mistral-7b-instruct-v0.1", "name": "Mistral 7B Instruct", "provider": "MistralAI", "task": "text-generation", "description": "High quality, good for complex tasks", "capabilities": [], "status": "active"},
-    
-    # Automatic Speech Recognition
-    {"id": "@cf/openai/whisper-large-v3-turbo", "name": "Whisper Large V3 Turbo", "provider": "OpenAI", "task": "automatic-speech-recognition", "description": "High-quality speech recognition and translation", "capabilities": [], "status": "active"},
-    
-    # Image-to-Text - Vision Models
-    {"id": "@cf/unum/uform-gen2-qwen-500m", "name": "UForm-Gen2 Qwen 500M", "provider": "Unum", "task": "image-to-text", "description": "Small and fast model for image captioning and visual Q&A", "capabilities": ["vision"], "status": "beta"},
-    
-    # Text-to-Image - Verified Models
-    {"id": "@cf/black-forest-labs/flux-1-schnell", "name": "FLUX.1 Schnell", "provider": "Black Forest Labs", "task": "text-to-image", "description": "12B parameter model, very fast image generation (4 steps)", "capabilities": [], "status": "active"},
-]
-
-
+# Models come from the shared registry (model_catalog.json); only enabled models are served
 def get_available_models():
     """Get list of available models"""
-    return AVAILABLE_MODELS
+    return model_registry.all()
 
 
 def get_model_by_id(model_id: str) -> Optional[Dict]:
     """Get model configuration by ID"""
-    for model in AVAILABLE_MODELS:
-        if model["id"] == model_id:
-            return model
-    return None
+    return model_registry.get(model_id)
 
 
 def get_models_by_task(task: str) -> List[Dict]:
     """Get models filtered by task type"""
-    return [m for m in AVAILABLE_MODELS if m["task"] == task]
+    return model_registry.by_task(task)
 
 
 def estimate_tokens(text: str) -> int:
     """
     Estimate token count for text
-    Using tiktoken with cl100k_base encoding (similar to GPT-3.5/4)
+    Using tiktoken with cl100k_base encoding (similar to GPT-3.5/4), memoized
     """
-    try:
-        encoding = tiktoken.get_encoding("cl100k_base")
-        return len(encoding.encode(text))
-    except Exception:
-        # Fallback: rough estimate of 1 token ≈ 4 characters
-        return len(text) // 4
+    return tokenizer_service.count_tokens(text)
+
+
+async def estimate_tokens_async(text: str) -> int:
+    """Estimate token count, counting large inputs off the event loop"""
+    return await tokenizer_service.count_tokens_async(text)
+
+
+async def estimate_messages_tokens(messages: List[Dict[str, str]]) -> int:
+    """
+    Estimate input tokens for a conversation
+    Counted per message so resent history and system prompts hit the cache
+    """
+    counts = await tokenizer_service.count_tokens_batch([msg.get("content", "") for msg in messages])
+    return sum(counts)
 
 
 async def call_cloudflare_ai(
@@ -116,24 +105,24 @@ async def call_cloudflare_ai(
             "input": input_text
         }
         
-        input_tokens = estimate_tokens(input_text)
+        input_tokens = await estimate_tokens_async(input_text)
         
         try:
-            async with httpx.AsyncClient(timeout=60.0) as client:
-                response = await client.post(url, json=payload, headers=headers)
-                
-                if not response.is_success:
-                    error_text = response.text
-                    if response.status_code == 401:
-                        raise Exception("Invalid API key or Account ID.")
-                    elif response.status_code == 404:
-                        raise Exception(f"Model '{model}' not found.")
-                    elif response.status_code == 429:
-                        raise Exception("Rate limit exceeded. Please wait and try again.")
-                    else:
-                        raise Exception(f"Cloudflare AI API error ({response.status_code}): {error_text}")
-                
-                data = response.json()
+            client = get_http_client()
+            response = await client.post(url, json=payload, headers=headers, timeout=get_task_timeout(model_info["task"]))
+            
+            if not response.is_success:
+                error_text = response.text
+                if response.status_code == 401:
+                    raise Exception("Invalid API key or Account ID.")
+                elif response.status_code == 404:
+                    raise Exception(f"Model '{model}' not found.")
+                elif response.status_code == 429:
+                    raise Exception("Rate limit exceeded. Please wait and try again.")
+                else:
+                    raise Exception(f"Cloudflare AI API error ({response.status_code}): {error_text}")
+            
+            data = response.json()
         except httpx.TimeoutException:
             raise Exception("Request timed out. Please try again.")
         except httpx.RequestError as e:
@@ -161,7 +150,7 @@ async def call_cloudflare_ai(
         # Extract token usage from API response
         usage = data.get("usage", {})
         input_tokens = usage.get("prompt_tokens", input_tokens)
-        output_tokens = usage.get("completion_tokens", estimate_tokens(response_text))
+        output_tokens = usage.get("completion_tokens") or await estimate_tokens_async(response_text)
         total_tokens = usage.get("total_tokens", input_tokens + output_tokens)
         response_time_ms = (time.time() - start_time) * 1000
         
@@ -185,24 +174,24 @@ async def call_cloudflare_ai(
             "num_steps": 4  # Default for FLUX.1-schnell
         }
         
-        input_tokens = estimate_tokens(prompt)
+        input_tokens = await estimate_tokens_async(prompt)
         
         try:
-            async with httpx.AsyncClient(timeout=120.0) as client:  # Longer timeout for image generation
-                response = await client.post(url, json=payload, headers=headers)
-                
-                if not response.is_success:
-                    error_text = response.text
-                    if response.status_code == 401:
-                        raise Exception("Invalid API key or Account ID.")
-                    elif response.status_code == 404:
-                        raise Exception(f"Model '{model}' not found.")
-                    elif response.status_code == 429:
-                        raise Exception("Rate limit exceeded. Please wait and try again.")
-                    else:
-                        raise Exception(f"Image generation failed ({response.status_code}): {error_text}")
-                
-                data = response.json()
+            client = get_http_client()
+            response = await client.post(url, json=payload, headers=headers, timeout=get_task_timeout(model_info["task"]))
+            
+            if not response.is_success:
+                error_text = response.text
+                if response.status_code == 401:
+                    raise Exception("Invalid API key or Account ID.")
+                elif response.status_code == 404:
+                    raise Exception(f"Model '{model}' not found.")
+                elif response.status_code == 429:
+                    raise Exception("Rate limit exceeded. Please wait and try again.")
+                else:
+                    raise Exception(f"Image generation failed ({response.status_code}): {error_text}")
+            
+            data = response.json()
         except httpx.TimeoutException:
             raise Exception("Image generation timed out. Please try again.")
         except httpx.RequestError as e:
@@ -254,21 +243,21 @@ async def call_cloudflare_ai(
         input_tokens = len(audio_array) // 1000  # Rough estimate: 1 token per KB
         
         try:
-            async with httpx.AsyncClient(timeout=120.0) as client:
-                response = await client.post(url, json=payload, headers=headers)
-                
-                if not response.is_success:
-                    error_text = response.text
-                    if response.status_code == 401:
-                        raise Exception("Invalid API key or Account ID.")
-                    elif response.status_code == 404:
-                        raise Exception(f"Model '{model}' not found.")
-                    elif response.status_code == 429:
-                        raise Exception("Rate limit exceeded. Please wait and try again.")
-                    else:
-                        raise Exception(f"Audio transcription failed ({response.status_code}): {error_text}")
-                
-                data = response.json()
+            client = get_http_client()
+            response = await client.post(url, json=payload, headers=headers, timeout=get_task_timeout(model_info["task"]))
+            
+            if not response.is_success:
+                error_text = response.text
+                if response.status_code == 401:
+                    raise Exception("Invalid API key or Account ID.")
+                elif response.status_code == 404:
+                    raise Exception(f"Model '{model}' not found.")
+                elif response.status_code == 429:
+                    raise Exception("Rate limit exceeded. Please wait and try again.")
+                else:
+                    raise Exception(f"Audio transcription failed ({response.status_code}): {error_text}")
+            
+            data = response.json()
         except httpx.TimeoutException:
             raise Exception("Audio transcription timed out. Please try again.")
         except httpx.RequestError as e:
@@ -279,7 +268,7 @@ async def call_cloudflare_ai(
         if not response_text:
             raise Exception("Model returned no transcription.")
         
-        output_tokens = estimate_tokens(response_text)
+        output_tokens = await estimate_tokens_async(response_text)
         response_time_ms = (time.time() - start_time) * 1000
         
         return {
@@ -319,24 +308,24 @@ async def call_cloudflare_ai(
             "max_tokens": max_tokens
         }
         
-        input_tokens = estimate_tokens(prompt)
+        input_tokens = await estimate_tokens_async(prompt)
         
         try:
-            async with httpx.AsyncClient(timeout=120.0) as client:
-                response = await client.post(url, json=payload, headers=headers)
-                
-                if not response.is_success:
-                    error_text = response.text
-                    if response.status_code == 401:
-                        raise Exception("Invalid API key or Account ID.")
-                    elif response.status_code == 404:
-                        raise Exception(f"Model '{model}' not found.")
-                    elif response.status_code == 429:
-                        raise Exception("Rate limit exceeded. Please wait and try again.")
-                    else:
-                        raise Exception(f"Vision analysis failed ({response.status_code}): {error_text}")
-                
-                data = response.json()
+            client = get_http_client()
+            response = await client.post(url, json=payload, headers=headers, timeout=get_task_timeout(model_info["task"]))
+            
+            if not response.is_success:
+                error_text = response.text
+                if response.status_code == 401:
+                    raise Exception("Invalid API key or Account ID.")
+                elif response.status_code == 404:
+                    raise Exception(f"Model '{model}' not found.")
+                elif response.status_code == 429:
+                    raise Exception("Rate limit exceeded. Please wait and try again.")
+                else:
+                    raise Exception(f"Vision analysis failed ({response.status_code}): {error_text}")
+            
+            data = response.json()
         except httpx.TimeoutException:
             raise Exception("Vision analysis timed out. Please try again.")
         except httpx.RequestError as e:
@@ -347,7 +336,7 @@ async def call_cloudflare_ai(
         if not response_text:
             raise Exception("Model returned no description.")
         
-        output_tokens = estimate_tokens(response_text)
+        output_tokens = await estimate_tokens_async(response_text)
         response_time_ms = (time.time() - start_time) * 1000
         
         return {
@@ -370,27 +359,26 @@ async def call_cloudflare_ai(
         payload["max_tokens"] = max_tokens
     
     # Calculate input tokens
-    input_text = " ".join([msg.get("content", "") for msg in messages])
-    input_tokens = estimate_tokens(input_text)
+    input_tokens = await estimate_messages_tokens(messages)
     
     # Make request with error handling
     try:
-        async with httpx.AsyncClient(timeout=60.0) as client:
-            response = await client.post(url, json=payload, headers=headers)
-            
-            if not response.is_success:
-                error_text = response.text
-                # Provide helpful error message
-                if response.status_code == 401:
-                    raise Exception("Invalid API key or Account ID. Please check your Cloudflare credentials.")
-                elif response.status_code == 404:
-                    raise Exception(f"Model '{model}' not found. It may have been deprecated or requires special access.")
-                elif response.status_code == 429:
-                    raise Exception("Rate limit exceeded. Please wait a moment and try again.")
-                else:
-                    raise Exception(f"Cloudflare AI API error ({response.status_code}): {error_text}")
-            
-            data = response.json()
+        client = get_http_client()
+        response = await client.post(url, json=payload, headers=headers, timeout=get_task_timeout(model_info["task"]))
+        
+        if not response.is_success:
+            error_text = response.text
+            # Provide helpful error message
+            if response.status_code == 401:
+                raise Exception("Invalid API key or Account ID. Please check your Cloudflare credentials.")
+            elif response.status_code == 404:
+                raise Exception(f"Model '{model}' not found. It may have been deprecated or requires special access.")
+            elif response.status_code == 429:
+                raise Exception("Rate limit exceeded. Please wait a moment and try again.")
+            else:
+                raise Exception(f"Cloudflare AI API error ({response.status_code}): {error_text}")
+        
+        data = response.json()
     except httpx.TimeoutException:
         raise Exception("Request timed out. The model may be overloaded. Please try again.")
     except httpx.RequestError as e:
@@ -408,7 +396,7 @@ async def call_cloudflare_ai(
         raise Exception("Model returned empty response. Please try a different model or rephrase your prompt.")
     
     # Calculate output tokens
-    output_tokens = estimate_tokens(response_text)
+    output_tokens = await estimate_tokens_async(response_text)
     total_tokens = input_tokens + output_tokens
     
     # Calculate response time
@@ -422,3 +410,131 @@ async def call_cloudflare_ai(
         "response_time_ms": response_time_ms
     }
 
+
+async def stream_cloudflare_ai(
+    messages: List[Dict[str, str]],
+    model: str,
+    temperature: float = 0.7,
+    max_tokens: int = 2048
+) -> AsyncGenerator[Dict, None]:
+    """
+    Stream a text generation from Cloudflare Workers AI (stream: true upstream)
+    Yields:
+        {"token": str, "output_tokens": int} for every delta as it arrives
+        (output_tokens is the running total so far), then a final
+        {"done": True, "response": str, "input_tokens": int, "output_tokens": int,
+         "total_tokens": int, "response_time_ms": float}
+    Output tokens are counted incrementally and replaced by the upstream
+    usage event when the model reports one.
+    Non text-generation models fall back to a single non-streamed chunk.
+    """
+    start_time = time.time()
+    
+    model_info = get_model_by_id(model)
+    if not model_info:
+        raise ValueError(f"Model '{model}' not found in available models. Please select from the available list.")
+    
+    if model_info["task"] != "text-generation":
+        result = await call_cloudflare_ai(messages, model, temperature, max_tokens)
+        yield {"token": result["response"], "output_tokens": result["output_tokens"]}
+        yield {"done": True, **result}
+        return
+    
+    headers = {
+        "Content-Type": "application/json",
+        "Authorization": f"Bearer {settings.cloudflare_api_key}"
+    }
+    
+    # GPT OSS models use the Responses API with 'input' instead of 'messages'
+    is_responses_api = "gpt-oss" in model
+    if is_responses_api:
+        url = f"{settings.cloudflare_api_base}/accounts/{settings.cloudflare_account_id}/ai/v1/responses"
+        input_text = ""
+        for msg in reversed(messages):
+            if msg["role"] == "user":
+                input_text = msg["content"]
+                break
+        if not input_text:
+            raise ValueError("Please provide a message for the model.")
+        payload = {
+            "model": model,
+            "input": input_text,
+            "stream": True
+        }
+        input_tokens = await estimate_tokens_async(input_text)
+    else:
+        url = f"{settings.cloudflare_api_base}/accounts/{settings.cloudflare_account_id}/ai/run/{model}"
+        payload = {
+            "messages": messages,
+            "stream": True,
+            "temperature": temperature,
+            "max_tokens": max_tokens
+        }
+        input_tokens = await estimate_messages_tokens(messages)
+    
+    output_tokens = 0
+    usage = None
+    response_text = ""
+    
+    try:
+        client = get_http_client()
+        async with client.stream("POST", url, json=payload, headers=headers, timeout=get_task_timeout(model_info["task"])) as response:
+            if not response.is_success:
+                error_text = (await response.aread()).decode("utf-8", errors="replace")
+                if response.status_code == 401:
+                    raise Exception("Invalid API key or Account ID. Please check your Cloudflare credentials.")
+                elif response.status_code == 404:
+                    raise Exception(f"Model '{model}' not found. It may have been deprecated or requires special access.")
+                elif response.status_code == 429:
+                    raise Exception("Rate limit exceeded. Please wait a moment and try again.")
+                else:
+                    raise Exception(f"Cloudflare AI API error ({response.status_code}): {error_text}")
+            
+            async for line in response.aiter_lines():
+                line = line.strip()
+                if not line.startswith("data:"):
+                    continue
+                data = line[5:].strip()
+                if not data or data == "[DONE]":
+                    continue
+                try:
+                    event = json.loads(data)
+                except ValueError:
+                    continue
+                
+                if is_responses_api:
+                    # Responses API: response.output_text.delta ... response.completed
+                    event_type = event.get("type")
+                    delta = event.get("delta", "") if event_type == "response.output_text.delta" else ""
+                    if event_type == "response.completed":
+                        usage = event.get("response", {}).get("usage")
+                else:
+                    delta = event.get("response") or ""
+                    if event.get("usage"):
+                        usage = event["usage"]
+                
+                if delta:
+                    response_text += delta
+                    output_tokens += tokenizer_service.count_tokens(delta, cache=False)
+                    yield {"token": delta, "output_tokens": output_tokens}
+    except httpx.TimeoutException:
+        raise Exception("Request timed out. The model may be overloaded. Please try again.")
+    except httpx.RequestError as e:
+        raise Exception(f"Network error: {str(e)}")
+    
+    if not response_text:
+        raise Exception("Model returned empty response. Please try a different model or rephrase your prompt.")
+    
+    # Bill from the upstream usage event when present
+    if usage:
+        input_tokens = usage.get("prompt_tokens", usage.get("input_tokens", input_tokens))
+        output_tokens = usage.get("completion_tokens", usage.get("output_tokens", output_tokens))
+    
+    yield {
+        "done": True,
+        "response": response_text,
+        "input_tokens": input_tokens,
+        "output_tokens": output_tokens,
+        "total_tokens": input_tokens + output_tokens,
+        "response_time_ms": (time.time() - start_time) * 1000
+    }
@@ -0,0 +1,119 @@
+"""
+Response cache for deterministic chat completions
+
+Requests with temperature == 0 are keyed on a canonical hash of the model,
+messages and generation parameters. Two tiers:
+- in-process LRU with TTL (per worker)
+- optional Redis tier shared across workers (reuses rate_limit.redis_client)
+"""
+import asyncio
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional
+from config import settings
+from rate_limit import redis_client, redis_available
+
+
+class CompletionCache:
+    """Two-tier (local LRU + Redis) cache of completion results"""
+
+    REDIS_PREFIX = "completion_cache:"
+
+    def __init__(self, max_entries: int, ttl_seconds: int):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._local: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def is_cacheable(temperature: float, task_type: str, messages: List[Dict]) -> bool:
+        """Only deterministic text generation without attachments is cached"""
+        if not settings.completion_cache_enabled:
+            return False
+        if temperature != 0 or task_type != "text-generation":
+            return False
+        return not any("image" in msg or "audio" in msg for msg in messages)
+
+    @staticmethod
+    def make_key(model: str, messages: List[Dict], temperature: float, max_tokens: int) -> str:
+        """Canonical hash of everything that determines the completion"""
+        canonical = json.dumps(
+            {
+                "model": model,
+                "messages": [{"role": m.get("role"), "content": m.get("content")} for m in messages],
+                "temperature": temperature,
+                "max_tokens": max_tokens,
+            },
+            sort_keys=True,
+            separators=(",", ":"),
+            ensure_ascii=False,
+        )
+        return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+    def _get_local(self, key: str) -> Optional[Dict]:
+        with self._lock:
+            entry = self._local.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.time():
+                del self._local[key]
+                return None
+            self._local.move_to_end(key)
+            return value
+
+    def _put_local(self, key: str, value: Dict):
+        with self._lock:
+            self._local[key] = (time.time() + self.ttl_seconds, value)
+            self._local.move_to_end(key)
+            while len(self._local) > self.max_entries:
+                self._local.popitem(last=False)
+
+    def _get_redis(self, key: str) -> Optional[Dict]:
+        raw = redis_client.get(self.REDIS_PREFIX + key)
+        return json.loads(raw) if raw else None
+
+    def _put_redis(self, key: str, value: Dict):
+        redis_client.setex(self.REDIS_PREFIX + key, self.ttl_seconds, json.dumps(value))
+
+    async def get(self, key: str) -> Optional[Dict]:
+        """Look up a cached result (local tier first, then Redis)"""
+        value = self._get_local(key)
+        if value is not None:
+            return value
+
+        if redis_available and settings.completion_cache_use_redis:
+            try:
+                value = await asyncio.to_thread(self._get_redis, key)
+            except Exception as e:
+                print(f"⚠️  Completion cache Redis lookup failed: {e}")
+                value = None
+            if value is not None:
+                self._put_local(key, value)
+        return value
+
+    async def set(self, key: str, result: Dict):
+        """Store a completion result in both tiers"""
+        value = {
+            "response": result["response"],
+            "input_tokens": result["input_tokens"],
+            "output_tokens": result["output_tokens"],
+            "total_tokens": result["total_tokens"],
+        }
+        self._put_local(key, value)
+
+        if redis_available and settings.completion_cache_use_redis:
+            try:
+                await asyncio.to_thread(self._put_redis, key, value)
+            except Exception as e:
+                print(f"⚠️  Completion cache Redis write failed: {e}")
+
+
+# Application-wide completion cache
+completion_cache = CompletionCache(
+    max_entries=settings.completion_cache_max_entries,
+    ttl_seconds=settings.completion_cache_ttl
+)
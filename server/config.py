@@ -12,9 +12,63 @@ class Settings(BaseSettings):
     cloudflare_account_id: str
     cloudflare_api_base: str = "https://api.cloudflare.com/client/v4"
     
+    # Upstream HTTP client (shared connection pool)
+    upstream_http2: bool = True
+    upstream_max_connections: int = 100
+    upstream_max_keepalive_connections: int = 20
+    upstream_keepalive_expiry: float = 30.0  # seconds
+    upstream_connect_timeout: float = 10.0  # seconds
+    upstream_text_timeout: float = 60.0  # seconds, text generation
+    upstream_media_timeout: float = 120.0  # seconds, image/audio/vision
+    
+    # Model catalog
+    model_catalog_path: str = ""  # Defaults to model_catalog.json next to the server code
+    model_catalog_check_interval: float = 30.0  # Seconds between hot-reload checks (0 = off)
+    
+    # Completion cache (temperature == 0 chat requests)
+    completion_cache_enabled: bool = False
+    completion_cache_ttl: int = 3600  # seconds
+    completion_cache_max_entries: int = 1024  # In-process LRU size
+    completion_cache_use_redis: bool = True  # Share hits across workers when Redis is available
+    completion_cache_discount: float = 0.9  # Fraction taken off the normal price on a cache hit
+    
+    # Tokenizer
+    tokenizer_cache_size: int = 4096  # Memoized token counts (LRU entries)
+    tokenizer_offload_chars: int = 4000  # Inputs this long are counted in a worker thread
+    tokenizer_workers: int = 4
+    
     # Database
     database_url: str = "sqlite:///./app.db"
     
+    # Usage logging (write-behind queue)
+    usage_log_batch_size: int = 200  # Flush when this many records are buffered
+    usage_log_flush_interval: float = 2.0  # ...or after this many seconds
+    usage_log_spool_dir: str = ""  # Crash spool, defaults to usage_spool/ next to the server code
+    
+    # Quota counters
+    quota_reconcile_interval: float = 600.0  # Seconds between reconciles against usage_logs (0 = off)
+    
+    # Marketplace
+    order_book_ttl: float = 30.0  # Seconds a worker may serve a per-model order book without reloading
+    
+    # Resource pool routing
+    pool_router_refresh_interval: float = 30.0  # Seconds between scoreboard reloads from the database (0 = off)
+    pool_health_ewma_alpha: float = 0.2  # Weight of the newest sample in latency / error-rate EWMAs
+    pool_circuit_failure_threshold: int = 5  # Consecutive failures that open a key's circuit
+    pool_circuit_error_rate: float = 0.5  # ...or EWMA error rate (after pool_circuit_min_samples requests)
+    pool_circuit_min_samples: int = 10
+    pool_circuit_cooldown: float = 30.0  # Seconds an open circuit waits before half-open probes
+    pool_circuit_half_open_probes: int = 1  # Concurrent trial requests while half-open
+    pool_throttle_burst_seconds: float = 10.0  # Token bucket size, in seconds of a key's max_requests_per_minute
+    pool_throttle_use_redis: bool = True  # Share buckets across workers when Redis is available
+    pool_attempt_timeout: float = 60.0  # Seconds before a pool attempt counts as failed and is retried
+    pool_hedge_after_ms: float = 0.0  # Send a hedged duplicate to another key after this long (0 = off)
+    pool_stats_flush_interval: float = 5.0  # Seconds between batched pool key statistics writes
+    
+    # Real-time push
+    realtime_queue_size: int = 100  # Pending events per connection before dropping
+    realtime_heartbeat_interval: float = 15.0  # Seconds between keep-alive comments
+    
     # JWT
     jwt_secret_key: str
     jwt_algorithm: str = "HS256"
@@ -3,12 +3,13 @@ Credit management service
 Handles credit transactions, balance checks, and billing
 """
 from sqlalchemy.orm import Session
-from sqlalchemy import desc
+from sqlalchemy import desc, select, update
 from typing import Optional, List
 from datetime import datetime, timedelta
 from models import User
 from models_credit import UserCredit, CreditTransaction, ModelPricing, TransactionType
 from fastapi import HTTPException
+from pagination import after_cursor
 
 
 class CreditService:
@@ -116,29 +117,137 @@ class CreditService:
         )
     
     @staticmethod
-    def consume(
+    def debit(
         user_id: str,
         amount: float,
         description: str,
         reference_id: Optional[str],
-        db: Session
-    ) -> CreditTransaction:
-        """Consume credits from user account"""
-        if amount <= 0:
-            raise ValueError("Consumption amount must be positive")
+        db: Session,
+        commit: bool = True
+    ) -> Optional[CreditTransaction]:
+        """
+        Atomically debit credits and record the ledger entry
+        
+        The balance check and decrement are one conditional UPDATE, so
+        concurrent charges cannot overdraw the account. The ledger insert
+        commits in the same transaction (pass commit=False to leave the
+        commit to a caller settling several ledgers at once).
+        A zero amount charges nothing and returns None.
+        """
+        if amount < 0:
+            raise ValueError("Debit amount must not be negative")
+        if amount == 0:
+            return None  # e.g. a 0-token request: no ledger row
         
-        # Check balance before consuming
-        if not CreditService.check_sufficient_balance(user_id, amount, db):
-            balance = CreditService.get_balance(user_id, db)
+        row = db.execute(
+            update(UserCredit)
+            .where(UserCredit.user_id == user_id, UserCredit.balance >= amount)
+            .values(
+                balance=UserCredit.balance - amount,
+                total_consumed=UserCredit.total_consumed + amount,
+                updated_at=datetime.utcnow()
+            )
+            .returning(UserCredit.id, UserCredit.balance)
+            .execution_options(synchronize_session="fetch")
+        ).first()
+        
+        if row is None:
+            # No account yet or not enough credits (slow path, errors only).
+            # Read-only: the caller may be mid-transaction and will roll back.
+            balance = db.execute(
+                select(UserCredit.balance).where(UserCredit.user_id == user_id)
+            ).scalar() or 0.0
             raise HTTPException(
                 status_code=402,
                 detail=f"Insufficient credits. Balance: {balance:.4f}, Required: {amount:.4f}"
             )
         
-        return CreditService.add_transaction(
+        user_credit_id, balance_after = row
+        transaction = CreditTransaction(
+            user_credit_id=user_credit_id,
             user_id=user_id,
-            type=TransactionType.CONSUMPTION,
+            type=TransactionType.CONSUMPTION.value,
             amount=-amount,  # Negative for consumption
+            balance_before=balance_after + amount,
+            balance_after=balance_after,
+            description=description,
+            reference_id=reference_id
+        )
+        db.add(transaction)
+        if commit:
+            db.commit()
+        
+        return transaction
+    
+    @staticmethod
+    def credit(
+        user_id: str,
+        amount: float,
+        type: TransactionType,
+        description: str,
+        reference_id: Optional[str],
+        db: Session,
+        commit: bool = True
+    ) -> CreditTransaction:
+        """
+        Atomically add credits and record the ledger entry
+        
+        Counterpart of debit(): one increment UPDATE instead of a
+        read-modify-write, so concurrent credits to the same account
+        never lose updates. Creates the account if needed.
+        """
+        if amount <= 0:
+            raise ValueError("Credit amount must be positive")
+        
+        values = dict(balance=UserCredit.balance + amount, updated_at=datetime.utcnow())
+        if type in [TransactionType.DEPOSIT, TransactionType.BONUS]:
+            values["total_deposited"] = UserCredit.total_deposited + amount
+        increment = (
+            update(UserCredit)
+            .where(UserCredit.user_id == user_id)
+            .values(**values)
+            .returning(UserCredit.id, UserCredit.balance)
+            .execution_options(synchronize_session="fetch")
+        )
+        
+        row = db.execute(increment).first()
+        if row is None:
+            db.add(UserCredit(user_id=user_id, balance=0.0, total_deposited=0.0, total_consumed=0.0))
+            db.flush()
+            row = db.execute(increment).first()
+        
+        user_credit_id, balance_after = row
+        transaction = CreditTransaction(
+            user_credit_id=user_credit_id,
+            user_id=user_id,
+            type=type.value,
+            amount=amount,
+            balance_before=balance_after - amount,
+            balance_after=balance_after,
+            description=description,
+            reference_id=reference_id
+        )
+        db.add(transaction)
+        if commit:
+            db.commit()
+        
+        return transaction
+    
+    @staticmethod
+    def consume(
+        user_id: str,
+        amount: float,
+        description: str,
+        reference_id: Optional[str],
+        db: Session
+    ) -> CreditTransaction:
+        """Consume credits from user account"""
+        if amount <= 0:
+            raise ValueError("Consumption amount must be positive")
+        
+        return CreditService.debit(
+            user_id=user_id,
+            amount=amount,
             description=description or f"Consumed {amount} credits",
             reference_id=reference_id,
             db=db
@@ -222,15 +331,21 @@ class CreditService:
         user_id: str,
         db: Session,
         limit: int = 100,
-        offset: int = 0
+        offset: int = 0,
+        cursor: Optional[str] = None
     ) -> List[CreditTransaction]:
-        """Get user's transaction history"""
-        return db.query(CreditTransaction)\
-            .filter(CreditTransaction.user_id == user_id)\
-            .order_by(desc(CreditTransaction.created_at))\
-            .limit(limit)\
-            .offset(offset)\
-            .all()
+        """
+        Get user's transaction history (newest first)
+        With a cursor (see pagination.py) the page starts after it and offset is ignored.
+        """
+        query = db.query(CreditTransaction).filter(CreditTransaction.user_id == user_id)
+        if cursor:
+            query = query.filter(after_cursor(CreditTransaction.created_at, CreditTransaction.id, cursor))
+        query = query.order_by(desc(CreditTransaction.created_at), desc(CreditTransaction.id))
+        if not cursor:
+            query = query.offset(offset)
+        
+        return query.limit(limit).all()
     
     @staticmethod
     def get_model_pricing(model_id: str, db: Session) -> Optional[ModelPricing]:
@@ -247,8 +362,9 @@ class CreditService:
         output_tokens: int,
         has_image: bool,
         usage_log_id: str,
-        db: Session
-    ) -> CreditTransaction:
+        db: Session,
+        discount: float = 0.0
+    ) -> Optional[CreditTransaction]:
         """
         Calculate cost based on model pricing and charge user
         
@@ -260,9 +376,10 @@ class CreditService:
             has_image: Whether request included image
             usage_log_id: Reference to usage log
             db: Database session
+            discount: Fraction taken off the price (e.g. completion cache hits)
             
         Returns:
-            Credit transaction record
+            Credit transaction record (None if there is nothing to charge)
         """
         # Get model pricing
         pricing = CreditService.get_model_pricing(model_id, db)
@@ -274,15 +391,21 @@ class CreditService:
         
         # Calculate cost
         cost = pricing.calculate_cost(input_tokens, output_tokens, has_image)
+        if discount:
+            cost = round(cost * (1.0 - discount), 4)
+            if cost <= 0:
+                return None  # Fully discounted, nothing to charge
         
         # Create description
         description = f"{pricing.model_name}: {input_tokens} in + {output_tokens} out tokens"
         if has_image:
             description += " + image"
+        if discount:
+            description += f" (cached, {discount * 100:.0f}% off)"
         description += f" = {cost:.4f} credits"
         
-        # Charge user
-        return CreditService.consume(
+        # Charge user (single conditional UPDATE + ledger insert)
+        return CreditService.debit(
             user_id=user_id,
             amount=cost,
             description=description,
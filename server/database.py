@@ -2,6 +2,7 @@
 Database configuration and session management
 """
 from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from config import settings
@@ -16,6 +17,34 @@ engine = create_engine(
 # Create SessionLocal class
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+
+def get_async_database_url(url: str) -> str:
+    """
+    Map the configured (sync) database URL to its async driver
+    sqlite -> aiosqlite, postgresql/psycopg2 -> asyncpg
+    """
+    if url.startswith("sqlite:"):
+        return url.replace("sqlite:", "sqlite+aiosqlite:", 1)
+    for prefix in ("postgresql+psycopg2://", "postgresql://", "postgres://"):
+        if url.startswith(prefix):
+            return "postgresql+asyncpg://" + url[len(prefix):]
+    return url
+
+
+# Async engine for async route handlers (same database, non-blocking driver)
+async_engine = create_async_engine(
+    get_async_database_url(settings.database_url),
+    echo=True  # Set to False in production
+)
+
+# expire_on_commit=False so attributes stay readable after commit without implicit IO
+AsyncSessionLocal = async_sessionmaker(
+    bind=async_engine,
+    class_=AsyncSession,
+    autoflush=False,
+    expire_on_commit=False
+)
+
 # Create Base class for models
 Base = declarative_base()
 
@@ -31,17 +60,26 @@ def get_db():
         db.close()
 
 
+async def get_async_db():
+    """
+    Dependency to get async database session
+    Use in async def routes so queries don't block the event loop
+    """
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
 def init_db():
     """
     Initialize database (create all tables)
     """
-    from models import User, UserLimit, UsageLog  # Import models to register them
+    from models import User, UserLimit, UsageLog, UsageDailyRollup  # Import models to register them
     from models_credit import UserCredit, CreditTransaction, ModelPricing  # Import credit models
     from models_message import Message  # Import message model
     from models_forum import Post, Comment, PostLike  # Import forum models
     from models_profile import UserProfile  # Import profile model
     from models_group import ChatGroup, GroupMember, GroupMessage  # Import group chat models
-    from models_marketplace import ResourceListing, ResourceTransaction, ResourceReview, APIKeyVault  # Import marketplace models
+    from models_marketplace import ResourceListing, ResourceTransaction, ResourceReview, APIKeyVault, PlatformLedgerEntry  # Import marketplace models
     from models_resource_pool import PoolResource, PoolDeposit, PoolUsageLog, PoolLedger, PoolRouterConfig  # Import resource pool models
     Base.metadata.create_all(bind=engine)
     print("✅ Database initialized successfully")
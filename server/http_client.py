@@ -0,0 +1,77 @@
+"""
+Shared upstream HTTP client
+
+One application-wide httpx.AsyncClient so that calls to api.cloudflare.com
+reuse pooled keep-alive connections instead of paying a TCP+TLS handshake
+on every request. Created in the FastAPI startup hook, closed at shutdown.
+"""
+import httpx
+from typing import Optional
+from config import settings
+
+# HTTP/2 needs the optional 'h2' package (pip install httpx[http2])
+try:
+    import h2  # noqa: F401
+    http2_available = True
+except ImportError:
+    http2_available = False
+
+_client: Optional[httpx.AsyncClient] = None
+
+# Per-task read timeouts (seconds)
+TASK_TIMEOUTS = {
+    "text-generation": settings.upstream_text_timeout,
+    "text-to-image": settings.upstream_media_timeout,
+    "automatic-speech-recognition": settings.upstream_media_timeout,
+    "image-to-text": settings.upstream_media_timeout,
+}
+
+
+def _build_client() -> httpx.AsyncClient:
+    """Create the pooled client from settings"""
+    limits = httpx.Limits(
+        max_connections=settings.upstream_max_connections,
+        max_keepalive_connections=settings.upstream_max_keepalive_connections,
+        keepalive_expiry=settings.upstream_keepalive_expiry
+    )
+    timeout = httpx.Timeout(
+        settings.upstream_text_timeout,
+        connect=settings.upstream_connect_timeout
+    )
+    use_http2 = settings.upstream_http2 and http2_available
+    if settings.upstream_http2 and not http2_available:
+        print("⚠️  HTTP/2 requested but 'h2' is not installed, using HTTP/1.1")
+    return httpx.AsyncClient(limits=limits, timeout=timeout, http2=use_http2)
+
+
+def init_http_client() -> httpx.AsyncClient:
+    """Create the shared client (called from the startup hook)"""
+    global _client
+    if _client is None or _client.is_closed:
+        _client = _build_client()
+        print(f"✅ Upstream HTTP client ready (max {settings.upstream_max_connections} connections)")
+    return _client
+
+
+async def close_http_client():
+    """Close the shared client and release pooled connections (called at shutdown)"""
+    global _client
+    if _client is not None and not _client.is_closed:
+        await _client.aclose()
+    _client = None
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """
+    Get the shared client
+    Lazily created when used outside the app lifecycle (scripts, tests)
+    """
+    if _client is None or _client.is_closed:
+        return init_http_client()
+    return _client
+
+
+def get_task_timeout(task: str) -> httpx.Timeout:
+    """Get the request timeout for a model task type"""
+    read_timeout = TASK_TIMEOUTS.get(task, settings.upstream_text_timeout)
+    return httpx.Timeout(read_timeout, connect=settings.upstream_connect_timeout)
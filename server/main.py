@@ -4,8 +4,15 @@ FastAPI main application
 from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
 from config import settings
-from database import init_db
-from routers import auth_router, ai_router, usage_router, admin_router, credit_router, message_router, forum_router, profile_router, group_router, marketplace_router, resource_pool_router, admin_pricing_router
+from database import init_db, async_engine
+from http_client import init_http_client, close_http_client
+from tokenizer_service import tokenizer_service
+from usage_log_queue import usage_log_queue
+from quota_counters import quota_counters
+from realtime import event_hub
+from smart_router import scoreboard
+from resource_stats import resource_stats
+from routers import auth_router, ai_router, usage_router, admin_router, credit_router, message_router, forum_router, profile_router, group_router, marketplace_router, resource_pool_router, admin_pricing_router, realtime_router
 from rate_limit import limiter, rate_limit_exceeded_handler
 from slowapi.errors import RateLimitExceeded
 
@@ -23,6 +30,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "X-Sync-Cursor"],  # Keyset pagination cursors
 )
 
 # Add rate limiting
@@ -42,16 +50,37 @@ app.include_router(marketplace_router.router, prefix=settings.api_v1_prefix)
 app.include_router(resource_pool_router.router, prefix=settings.api_v1_prefix)
 app.include_router(admin_pricing_router.router, prefix=settings.api_v1_prefix)
 app.include_router(admin_router.router)
+app.include_router(realtime_router.router)
 
 
 @app.on_event("startup")
-def startup_event():
+async def startup_event():
     """Initialize database on startup"""
     print("🚀 Starting Prism AI Platform...")
     init_db()
+    init_http_client()
+    await usage_log_queue.start()
+    quota_counters.start()
+    event_hub.start()
+    scoreboard.start()
+    resource_stats.start()
     print(f"✅ Prism AI ready on http://{settings.host}:{settings.port}")
 
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Drain buffered usage logs and release pooled connections on shutdown"""
+    await event_hub.stop()
+    await scoreboard.stop()
+    await resource_stats.stop()
+    await quota_counters.stop()
+    await usage_log_queue.stop()
+    await close_http_client()
+    tokenizer_service.shutdown()
+    await async_engine.dispose()
+    print("👋 Prism AI shut down")
+
+
 @app.get("/")
 def root():
     """Root endpoint"""
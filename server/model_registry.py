@@ -0,0 +1,136 @@
+"""
+Model registry - single source of truth for the Cloudflare AI model catalog
+
+Loads model_catalog.json once and keeps precomputed indexes:
+- O(1) lookup by model id
+- per-task and per-capability lists
+- the serialized /ai/models payload with its ETag
+
+The catalog file can be edited while the server is running; the registry
+picks up changes on its next periodic mtime check or on an explicit reload().
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Dict, List, Optional
+from config import settings
+
+
+DEFAULT_CATALOG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "model_catalog.json")
+
+
+class _CatalogSnapshot:
+    """Immutable set of indexes built from one version of the catalog file"""
+
+    def __init__(self, models: List[Dict], mtime: float):
+        self.mtime = mtime
+        self.all_models = models
+        self.enabled_models = [m for m in models if m.get("enabled", True)]
+        self.by_id = {m["id"]: m for m in models}
+
+        self.by_task: Dict[str, List[Dict]] = {}
+        self.by_task_all: Dict[str, List[Dict]] = {}
+        self.by_capability: Dict[str, List[Dict]] = {}
+        for model in models:
+            self.by_task_all.setdefault(model["task"], []).append(model)
+        for model in self.enabled_models:
+            self.by_task.setdefault(model["task"], []).append(model)
+            for capability in model.get("capabilities") or []:
+                self.by_capability.setdefault(capability, []).append(model)
+
+        # Prebuilt /ai/models response (public fields only)
+        public_models = [
+            {k: v for k, v in m.items() if k != "enabled"}
+            for m in self.enabled_models
+        ]
+        self.models_payload = json.dumps(public_models, ensure_ascii=False).encode("utf-8")
+        self.etag = '"' + hashlib.sha256(self.models_payload).hexdigest()[:32] + '"'
+
+
+class ModelRegistry:
+    """
+    Indexed, hot-reloadable model catalog
+
+    Readers always see a complete snapshot; reload() builds a new one and swaps it in.
+    """
+
+    def __init__(self, catalog_path: str, check_interval: float):
+        self.catalog_path = catalog_path
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._last_check = 0.0
+        self._snapshot = self._load()
+
+    def _load(self) -> _CatalogSnapshot:
+        mtime = os.path.getmtime(self.catalog_path)
+        with open(self.catalog_path, "r", encoding="utf-8") as f:
+            models = json.load(f)
+
+        for model in models:
+            if "id" not in model or "task" not in model:
+                raise ValueError(f"Invalid model catalog entry (id and task are required): {model}")
+
+        return _CatalogSnapshot(models, mtime)
+
+    def reload(self, force: bool = True) -> bool:
+        """
+        Reload the catalog file
+        Returns True if a new catalog was loaded. A broken file keeps the current catalog.
+        """
+        with self._lock:
+            self._last_check = time.time()
+            try:
+                if not force and os.path.getmtime(self.catalog_path) == self._snapshot.mtime:
+                    return False
+                self._snapshot = self._load()
+            except Exception as e:
+                print(f"⚠️  Model catalog reload failed, keeping current catalog: {e}")
+                return False
+        print(f"✅ Model catalog loaded: {len(self._snapshot.enabled_models)} enabled models")
+        return True
+
+    @property
+    def snapshot(self) -> _CatalogSnapshot:
+        # Cheap periodic mtime check for hot reload
+        if self.check_interval > 0 and time.time() - self._last_check >= self.check_interval:
+            self.reload(force=False)
+        return self._snapshot
+
+    def get(self, model_id: str, include_disabled: bool = False) -> Optional[Dict]:
+        """Get model configuration by ID"""
+        model = self.snapshot.by_id.get(model_id)
+        if model is None or (not include_disabled and not model.get("enabled", True)):
+            return None
+        return model
+
+    def all(self, include_disabled: bool = False) -> List[Dict]:
+        """Get all models (enabled only by default)"""
+        snapshot = self.snapshot
+        return snapshot.all_models if include_disabled else snapshot.enabled_models
+
+    def by_task(self, task: str, include_disabled: bool = False) -> List[Dict]:
+        """Get models for a task type (enabled only by default)"""
+        snapshot = self.snapshot
+        index = snapshot.by_task_all if include_disabled else snapshot.by_task
+        return index.get(task, [])
+
+    def by_capability(self, capability: str) -> List[Dict]:
+        """Get enabled models with a capability (e.g. "vision", "function-calling")"""
+        return self.snapshot.by_capability.get(capability, [])
+
+    @property
+    def models_payload(self) -> bytes:
+        return self.snapshot.models_payload
+
+    @property
+    def etag(self) -> str:
+        return self.snapshot.etag
+
+
+# Application-wide registry
+model_registry = ModelRegistry(
+    catalog_path=settings.model_catalog_path or DEFAULT_CATALOG_PATH,
+    check_interval=settings.model_catalog_check_interval
+)
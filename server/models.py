@@ -1,7 +1,7 @@
 """
 SQLAlchemy database models
 """
-from sqlalchemy import Column, String, Integer, Float, DateTime, Boolean, ForeignKey, Text
+from sqlalchemy import Column, String, Integer, Float, DateTime, Date, Boolean, ForeignKey, Text, Index, UniqueConstraint
 from sqlalchemy.orm import relationship
 from datetime import datetime
 import uuid
@@ -60,6 +60,10 @@ class UserLimit(Base):
 
 class UsageLog(Base):
     __tablename__ = "usage_logs"
+    __table_args__ = (
+        # Keyset pagination: WHERE user_id = ? AND (timestamp, id) < (?, ?) ORDER BY timestamp DESC, id DESC
+        Index("ix_usage_logs_user_timestamp_id", "user_id", "timestamp", "id"),
+    )
     
     id = Column(String, primary_key=True, default=generate_uuid)
     user_id = Column(String, ForeignKey("users.id"), nullable=False, index=True)
@@ -73,6 +77,7 @@ class UsageLog(Base):
     request_data = Column(Text, nullable=True)  # Store request for debugging
     has_image = Column(Boolean, default=False)  # Whether request included an image
     has_audio = Column(Boolean, default=False)  # Whether request included audio
+    cache_hit = Column(Boolean, default=False)  # Whether response was served from the completion cache
     
     # Relationships
     user = relationship("User", back_populates="usage_logs")
@@ -80,3 +85,25 @@ class UsageLog(Base):
     def __repr__(self):
         return f"<UsageLog(user_id='{self.user_id}', model='{self.model_name}', task='{self.task_type}', tokens={self.total_tokens})>"
 
+
+class UsageDailyRollup(Base):
+    """Pre-aggregated usage per (user, UTC day, model, task), kept in step with usage_logs"""
+    __tablename__ = "usage_daily_rollups"
+    __table_args__ = (
+        UniqueConstraint("user_id", "day", "model_name", "task_type", name="uq_usage_rollup_key"),
+        Index("ix_usage_rollup_user_day", "user_id", "day"),
+        Index("ix_usage_rollup_day", "day"),
+    )
+    
+    id = Column(String, primary_key=True, default=generate_uuid)
+    user_id = Column(String, ForeignKey("users.id"), nullable=False)
+    day = Column(Date, nullable=False)
+    model_name = Column(String, nullable=False)
+    task_type = Column(String, nullable=False, default="text-generation")
+    requests = Column(Integer, default=0)
+    input_tokens = Column(Integer, default=0)
+    output_tokens = Column(Integer, default=0)
+    total_tokens = Column(Integer, default=0)
+    
+    def __repr__(self):
+        return f"<UsageDailyRollup(user_id='{self.user_id}', day='{self.day}', model='{self.model_name}', requests={self.requests})>"
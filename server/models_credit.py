@@ -1,7 +1,7 @@
 """
 Extended database models for Credit billing system
 """
-from sqlalchemy import Column, String, Integer, Float, DateTime, Boolean, ForeignKey, Text, Enum
+from sqlalchemy import Column, String, Integer, Float, DateTime, Boolean, ForeignKey, Text, Enum, Index
 from sqlalchemy.orm import relationship
 from datetime import datetime
 import uuid
@@ -53,6 +53,9 @@ class UserCredit(Base):
 class CreditTransaction(Base):
     """Credit transaction history"""
     __tablename__ = "credit_transactions"
+    __table_args__ = (
+        Index("ix_credit_transactions_user_created_id", "user_id", "created_at", "id"),  # Keyset pagination
+    )
     
     id = Column(String, primary_key=True, default=generate_uuid)
     user_credit_id = Column(String, ForeignKey("user_credits.id"), nullable=False, index=True)
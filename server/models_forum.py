@@ -1,7 +1,7 @@
 """
 Forum models for posts, comments, and likes
 """
-from sqlalchemy import Column, String, Text, Boolean, DateTime, Integer, ForeignKey
+from sqlalchemy import Column, String, Text, Boolean, DateTime, Integer, ForeignKey, Index
 from sqlalchemy.orm import relationship
 from datetime import datetime
 import uuid
@@ -11,6 +11,9 @@ from database import Base
 class Post(Base):
     """Forum posts"""
     __tablename__ = "posts"
+    __table_args__ = (
+        Index("ix_posts_created_id", "created_at", "id"),  # Keyset pagination of the feed
+    )
     
     id = Column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
     user_id = Column(String, ForeignKey("users.id"), nullable=False)
@@ -31,6 +34,9 @@ class Post(Base):
 class Comment(Base):
     """Comments on posts"""
     __tablename__ = "comments"
+    __table_args__ = (
+        Index("ix_comments_post_created", "post_id", "created_at"),  # Per-post comment lists and feed previews
+    )
     
     id = Column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
     post_id = Column(String, ForeignKey("posts.id"), nullable=False)
@@ -46,6 +52,9 @@ class Comment(Base):
 class PostLike(Base):
     """Likes on posts"""
     __tablename__ = "post_likes"
+    __table_args__ = (
+        Index("ix_post_likes_user_post", "user_id", "post_id"),  # Batched is_liked lookups
+    )
     
     id = Column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
     post_id = Column(String, ForeignKey("posts.id"), nullable=False)
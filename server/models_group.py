@@ -1,7 +1,7 @@
 """
 Group chat models
 """
-from sqlalchemy import Column, String, Text, Boolean, DateTime, ForeignKey
+from sqlalchemy import Column, String, Text, Boolean, DateTime, ForeignKey, Index
 from sqlalchemy.orm import relationship
 from datetime import datetime
 import uuid
@@ -29,6 +29,10 @@ class ChatGroup(Base):
 class GroupMember(Base):
     """Group membership"""
     __tablename__ = "group_members"
+    __table_args__ = (
+        Index("ix_group_members_group_joined", "group_id", "joined_at"),  # Member counts and member pages
+        Index("ix_group_members_user_group", "user_id", "group_id"),  # A user's groups and membership checks
+    )
     
     id = Column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
     group_id = Column(String, ForeignKey("chat_groups.id"), nullable=False)
@@ -64,6 +64,15 @@ class ResourceListing(Base):
     rating = Column(Float, default=5.0)  # 平均评分
     review_count = Column(Integer, default=0)  # 评价数量
     
+    # 评分聚合（新评价原子递增，见 rating_aggregates.py）
+    rating_sum = Column(Float, default=0.0)  # 总评分之和
+    speed_rating_sum = Column(Float, default=0.0)  # 速度评分之和
+    speed_rating_count = Column(Integer, default=0)
+    reliability_rating_sum = Column(Float, default=0.0)  # 可靠性评分之和
+    reliability_rating_count = Column(Integer, default=0)
+    value_rating_sum = Column(Float, default=0.0)  # 性价比评分之和
+    value_rating_count = Column(Integer, default=0)
+    
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
     
@@ -142,6 +151,20 @@ class ResourceReview(Base):
     listing = relationship("ResourceListing", back_populates="reviews")
 
 
+class PlatformLedgerEntry(Base):
+    """平台账本 - 每笔资源交易的平台抽成和风险准备金"""
+    __tablename__ = "marketplace_platform_ledger"
+
+    id = Column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
+    transaction_id = Column(String, ForeignKey("resource_transactions.id"), nullable=False, index=True)
+    listing_id = Column(String, ForeignKey("resource_listings.id"), nullable=False)
+    
+    entry_type = Column(String, nullable=False)  # platform_fee / reserve_fund
+    amount = Column(Float, nullable=False)  # 金额（美元）
+    
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+
 class APIKeyVault(Base):
     """API密钥保管库（加密存储）"""
     __tablename__ = "api_key_vault"
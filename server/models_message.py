@@ -1,7 +1,7 @@
 """
 Message models for user-to-user messaging
 """
-from sqlalchemy import Column, String, Text, Boolean, DateTime, ForeignKey
+from sqlalchemy import Column, String, Text, Boolean, DateTime, ForeignKey, Index
 from sqlalchemy.orm import relationship
 from datetime import datetime
 import uuid
@@ -11,6 +11,10 @@ from database import Base
 class Message(Base):
     """User-to-user messages"""
     __tablename__ = "messages"
+    __table_args__ = (
+        Index("ix_messages_sender_receiver_created", "sender_id", "receiver_id", "created_at"),  # Threads and latest message per partner
+        Index("ix_messages_receiver_read", "receiver_id", "is_read"),  # Unread counts
+    )
     
     id = Column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
     sender_id = Column(String, ForeignKey("users.id"), nullable=False)
@@ -5,7 +5,7 @@ This is separate from Marketplace (P2P trading).
 Resource Pool is a centralized bank where users deposit API resources
 and the platform intelligently routes requests to available resources.
 """
-from sqlalchemy import Column, String, Float, Integer, Boolean, DateTime, ForeignKey, Text, Enum as SQLEnum, JSON
+from sqlalchemy import Column, String, Float, Integer, Boolean, DateTime, ForeignKey, Text, Enum as SQLEnum, JSON, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from database import Base
@@ -151,6 +151,9 @@ class PoolUsageLog(Base):
     这是"账本"，记录谁用了谁的资源
     """
     __tablename__ = "pool_usage_logs"
+    __table_args__ = (
+        Index("ix_pool_usage_logs_created_id", "created_at", "id"),  # Keyset pagination
+    )
 
     id = Column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
     
@@ -184,7 +187,8 @@ class PoolUsageLog(Base):
     routing_algorithm = Column(String, default="smart_v1")
     
     # 时间戳
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    # Python-side default keeps microseconds on SQLite, so keyset cursors stay exact
+    created_at = Column(DateTime(timezone=True), default=datetime.utcnow, server_default=func.now())
     
     # 关系
     user = relationship("User", foreign_keys=[user_id])
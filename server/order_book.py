@@ -0,0 +1,112 @@
+"""
+Marketplace order book
+
+Per model_id snapshot of the active, in-stock resource listings (with the
+seller's username), sorted best offer first: lowest price, then highest
+rating. Browsing a model by price and best-offer lookups are served from
+memory; the marketplace router invalidates a model's book whenever one of
+its listings is created, updated, purchased, reviewed or deleted.
+
+Books are per worker. Invalidation only reaches the worker that made the
+change, so every book also expires after settings.order_book_ttl seconds
+to bound staleness on the others. Purchases always re-check inventory in
+the database, so a stale book can never oversell.
+"""
+import bisect
+import time
+from typing import Dict, List, Optional, Tuple
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from config import settings
+from models import User
+from models_marketplace import ResourceListing, ResourceStatus
+from rating_aggregates import DIMENSIONS, dimension_average
+
+# Listing fields exposed to buyers (never the API key)
+LISTING_FIELDS = [
+    "id", "user_id", "model_id", "model_name", "provider",
+    "price_per_1m_tokens", "official_price", "discount_percentage",
+    "total_quota", "available_quota", "min_purchase", "title", "description",
+    "status", "total_sales", "total_orders", "success_rate", "rating",
+    "review_count", "created_at",
+]
+
+
+def listing_snapshot(listing: ResourceListing, seller_username: Optional[str]) -> Dict:
+    """Plain dict of a listing for responses and the order book"""
+    snapshot = {name: getattr(listing, name) for name in LISTING_FIELDS}
+    snapshot["status"] = listing.status.value if listing.status else None
+    snapshot["seller_username"] = seller_username or "Unknown"
+    for dimension in DIMENSIONS:
+        snapshot[f"{dimension}_rating"] = dimension_average(listing, dimension)
+    return snapshot
+
+
+def offer_key(entry: Dict) -> Tuple:
+    """Sort key: cheapest first, then best rated, then oldest"""
+    return (entry["price_per_1m_tokens"], -(entry["rating"] or 0.0), str(entry["created_at"]), entry["id"])
+
+
+class OrderBook:
+    """In-memory order books keyed by model_id"""
+
+    def __init__(self, ttl_seconds: float):
+        self.ttl_seconds = ttl_seconds
+        # model_id -> (expires_at, entries sorted by offer_key, prices for bisect)
+        self._books: Dict[str, Tuple[float, List[Dict], List[float]]] = {}
+        # Bumped on invalidation so loads racing with a change are not stored
+        self._versions: Dict[str, int] = {}
+
+    def invalidate(self, model_id: Optional[str]):
+        if model_id is None:
+            return
+        self._books.pop(model_id, None)
+        self._versions[model_id] = self._versions.get(model_id, 0) + 1
+
+    async def _load(self, db: AsyncSession, model_id: str) -> Tuple[List[Dict], List[float]]:
+        version = self._versions.get(model_id, 0)
+        rows = (await db.execute(
+            select(ResourceListing, User.username)
+            .outerjoin(User, User.id == ResourceListing.user_id)
+            .where(
+                ResourceListing.model_id == model_id,
+                ResourceListing.status == ResourceStatus.ACTIVE,
+                ResourceListing.available_quota > 0
+            )
+        )).all()
+
+        entries = sorted((listing_snapshot(listing, username) for listing, username in rows), key=offer_key)
+        prices = [entry["price_per_1m_tokens"] for entry in entries]
+        if self._versions.get(model_id, 0) == version:
+            self._books[model_id] = (time.monotonic() + self.ttl_seconds, entries, prices)
+        return entries, prices
+
+    async def _book(self, db: AsyncSession, model_id: str) -> Tuple[List[Dict], List[float]]:
+        book = self._books.get(model_id)
+        if book is not None and book[0] > time.monotonic():
+            return book[1], book[2]
+        return await self._load(db, model_id)
+
+    async def offers(
+        self,
+        db: AsyncSession,
+        model_id: str,
+        min_price: Optional[float] = None,
+        max_price: Optional[float] = None
+    ) -> List[Dict]:
+        """Active offers for a model, best first, within a price range"""
+        entries, prices = await self._book(db, model_id)
+        start = bisect.bisect_left(prices, min_price) if min_price is not None else 0
+        end = bisect.bisect_right(prices, max_price) if max_price is not None else len(entries)
+        return entries[start:end]
+
+    async def best_offer(self, db: AsyncSession, model_id: str, amount: Optional[float] = None) -> Optional[Dict]:
+        """Cheapest offer that can fill a purchase of `amount` (any offer when None)"""
+        entries, _ = await self._book(db, model_id)
+        for entry in entries:
+            if amount is None or (entry["min_purchase"] or 0) <= amount <= entry["available_quota"]:
+                return entry
+        return None
+
+
+order_book = OrderBook(ttl_seconds=settings.order_book_ttl)
@@ -0,0 +1,71 @@
+"""
+Keyset (cursor) pagination helpers
+
+Lists ordered newest first by (timestamp, id) are paged with an opaque
+cursor holding the last row's sort key. Each page is then a range scan on a
+(..., timestamp, id) index instead of an OFFSET that reads and discards
+every earlier row.
+
+The cursor for the next page is returned in the X-Next-Cursor response
+header so list response bodies stay unchanged. Feeds that are synced
+incrementally also return X-Sync-Cursor, the key of the newest row seen,
+to ask for only newer rows on the next poll.
+"""
+import base64
+import json
+from datetime import datetime
+from typing import Optional, Sequence, Tuple
+from fastapi import HTTPException, Response
+from sqlalchemy import literal, tuple_
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+SYNC_CURSOR_HEADER = "X-Sync-Cursor"
+
+
+def encode_cursor(timestamp: datetime, row_id: str) -> str:
+    raw = json.dumps([timestamp.isoformat(), row_id], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, str]:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        timestamp, row_id = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        return datetime.fromisoformat(timestamp), row_id
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def after_cursor(timestamp_column, id_column, cursor: Optional[str]):
+    """
+    WHERE clause for rows after the cursor in (timestamp DESC, id DESC) order
+    Returns None when no cursor is given.
+    """
+    if not cursor:
+        return None
+    timestamp, row_id = decode_cursor(cursor)
+    return tuple_(timestamp_column, id_column) < tuple_(
+        literal(timestamp, timestamp_column.type),
+        literal(row_id, id_column.type)
+    )
+
+
+def since_cursor(timestamp_column, id_column, cursor: Optional[str]):
+    """
+    WHERE clause for rows newer than the cursor in (timestamp, id) order
+    Returns None when no cursor is given.
+    """
+    if not cursor:
+        return None
+    timestamp, row_id = decode_cursor(cursor)
+    return tuple_(timestamp_column, id_column) > tuple_(
+        literal(timestamp, timestamp_column.type),
+        literal(row_id, id_column.type)
+    )
+
+
+def set_next_cursor(response: Response, rows: Sequence, limit: int, timestamp_attr: str):
+    """Expose the cursor of the next page when this page is full"""
+    if rows and len(rows) >= limit:
+        last = rows[-1]
+        response.headers[NEXT_CURSOR_HEADER] = encode_cursor(getattr(last, timestamp_attr), last.id)
@@ -0,0 +1,303 @@
+"""
+Resource pool request executor
+
+Runs one upstream call against pool keys chosen by SmartRouter, following
+the active PoolRouterConfig:
+- strategy: how SmartRouter chooses among its top candidates
+- max_retry_attempts: on an error or timeout, retry on the next-best key
+  (keys already tried for this request are excluded)
+- failover_enabled: when the model family has no usable key left, fall
+  back to any key of the provider (SmartRouter.get_fallback_resource)
+
+With settings.pool_hedge_after_ms set, a duplicate (hedged) request goes to
+a second key when the first has not answered by then; the first success
+wins and the other is cancelled. Hedges count towards the attempt budget.
+
+Every attempt (won, failed, timed out or cancelled) is written to
+pool_usage_logs with its role and outcome in routing_reason, and every
+finished attempt feeds SmartRouter.record_usage (quota, health).
+"""
+import asyncio
+import time
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set
+from fastapi import HTTPException
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from config import settings
+from models_resource_pool import PoolRouterConfig, PoolUsageLog
+from router_scoreboard import ResourceEntry
+from smart_router import SmartRouter
+from resource_health import resource_health
+
+
+@dataclass
+class PoolCallResult:
+    """What an upstream call reports back to the executor"""
+    response: Any
+    cost_amount: float = 0.0  # Quota consumed on the key
+    input_tokens: Optional[int] = None
+    output_tokens: Optional[int] = None
+
+
+class PoolCallError(Exception):
+    """
+    Upstream failure the caller classified
+    retriable=False (e.g. a 400 for a malformed request) stops the executor
+    without retrying or counting against the key's health.
+    """
+
+    def __init__(self, message: str, retriable: bool = True):
+        super().__init__(message)
+        self.retriable = retriable
+
+
+@dataclass
+class RouterPolicy:
+    """PoolRouterConfig fields the executor reads (defaults when none is active)"""
+    strategy: str = "smart"
+    max_retry_attempts: int = 3
+    failover_enabled: bool = True
+
+
+@dataclass
+class PoolAttempt:
+    number: int
+    role: str  # "primary", "retry", "hedge", plus ":failover" when outside the model family
+    resource: ResourceEntry
+    started_at: float
+    task: Optional[asyncio.Task] = None
+    outcome: str = "pending"  # "success", "error", "timeout", "rejected", "cancelled"
+    error: Optional[str] = None
+    latency_ms: Optional[float] = None
+    result: Optional[PoolCallResult] = None
+
+
+@dataclass
+class PoolExecution:
+    result: PoolCallResult
+    resource: ResourceEntry
+    attempts: List[PoolAttempt] = field(default_factory=list)
+
+
+class PoolRequestExecutor:
+    """Retry / failover / hedging around SmartRouter selections"""
+
+    def __init__(self, attempt_timeout: float, hedge_after_ms: float, policy_ttl: float):
+        self.attempt_timeout = attempt_timeout
+        self.hedge_after_ms = hedge_after_ms
+        self.policy_ttl = policy_ttl
+        self._policy: Optional[RouterPolicy] = None
+        self._policy_expires = 0.0
+
+    async def policy(self, db: AsyncSession) -> RouterPolicy:
+        """Active PoolRouterConfig (oldest active one), cached for policy_ttl seconds"""
+        if self._policy is not None and self._policy_expires > time.monotonic():
+            return self._policy
+        config = (await db.execute(
+            select(PoolRouterConfig)
+            .where(PoolRouterConfig.is_active == True)
+            .order_by(PoolRouterConfig.created_at)
+            .limit(1)
+        )).scalar_one_or_none()
+        policy = RouterPolicy()
+        if config is not None:
+            if config.strategy in SmartRouter.STRATEGIES:
+                policy.strategy = config.strategy
+            if config.max_retry_attempts is not None:
+                policy.max_retry_attempts = max(config.max_retry_attempts, 0)
+            if config.failover_enabled is not None:
+                policy.failover_enabled = config.failover_enabled
+        self._policy, self._policy_expires = policy, time.monotonic() + self.policy_ttl
+        return policy
+
+    async def _select(
+        self,
+        db: AsyncSession,
+        policy: RouterPolicy,
+        provider: str,
+        model_family: Optional[str],
+        required_quota: float,
+        tried: Set[str]
+    ):
+        """(entry, failover) for the next attempt, or (None, False)"""
+        # Ranking is in memory; claims may hit Redis, so they run outside run_sync
+        ranked = await db.run_sync(lambda session: SmartRouter.rank_resources(
+            session, provider, model_family, required_quota, policy.strategy, tried
+        ))
+        for entry in ranked:
+            if await SmartRouter.claim_async(entry):
+                return entry, False
+        if policy.failover_enabled:
+            ranked = await db.run_sync(lambda session: SmartRouter.rank_fallback_resources(
+                session, provider, required_quota, tried
+            ))
+            for entry in ranked:
+                if await SmartRouter.claim_async(entry):
+                    return entry, True
+        return None, False
+
+    async def _call(self, call: Callable[[ResourceEntry], Awaitable[PoolCallResult]], entry: ResourceEntry):
+        return await asyncio.wait_for(call(entry), timeout=self.attempt_timeout)
+
+    def _finish(self, attempt: PoolAttempt):
+        """Classify a completed attempt task"""
+        attempt.latency_ms = (time.perf_counter() - attempt.started_at) * 1000
+        try:
+            attempt.result = attempt.task.result()
+            attempt.outcome = "success"
+        except asyncio.TimeoutError:
+            attempt.outcome = "timeout"
+            attempt.error = f"No response after {self.attempt_timeout:.0f}s"
+        except PoolCallError as e:
+            attempt.outcome = "error" if e.retriable else "rejected"
+            attempt.error = str(e)
+        except Exception as e:
+            attempt.outcome = "error"
+            attempt.error = f"{type(e).__name__}: {e}"
+
+    def _routing_reason(self, attempt: PoolAttempt, policy: RouterPolicy, max_attempts: int) -> str:
+        reason = f"{policy.strategy} {attempt.role} attempt {attempt.number}/{max_attempts}: {attempt.outcome}"
+        if attempt.latency_ms is not None:
+            reason += f" after {attempt.latency_ms:.0f}ms"
+        return reason
+
+    def _log(
+        self,
+        db: AsyncSession,
+        attempt: PoolAttempt,
+        policy: RouterPolicy,
+        max_attempts: int,
+        user_id: str,
+        model: str,
+        request_type: str,
+        credits_charged: float
+    ):
+        """Add the attempt to pool_usage_logs and feed its outcome to SmartRouter"""
+        result = attempt.result
+        db.add(PoolUsageLog(
+            user_id=user_id,
+            resource_id=attempt.resource.id,
+            resource_owner_id=attempt.resource.owner_id,
+            model=model,
+            provider=attempt.resource.provider,
+            request_type=request_type,
+            input_tokens=result.input_tokens if result else None,
+            output_tokens=result.output_tokens if result else None,
+            total_tokens=(result.input_tokens or 0) + (result.output_tokens or 0) if result else None,
+            cost_amount=result.cost_amount if result else 0.0,
+            credits_charged=credits_charged if attempt.outcome == "success" else 0.0,
+            response_time=attempt.latency_ms,
+            was_successful=attempt.outcome == "success",
+            error_message=attempt.error,
+            routing_reason=self._routing_reason(attempt, policy, max_attempts)
+        ))
+
+        if attempt.outcome in ("success", "error", "timeout"):
+            SmartRouter.record_usage(
+                attempt.resource,
+                result.cost_amount if result else 0.0,
+                attempt.outcome == "success",
+                attempt.latency_ms
+            )
+        else:
+            # Cancelled / rejected: no verdict on the key, give back a half-open probe
+            resource_health.release(attempt.resource.id)
+
+    async def execute(
+        self,
+        db: AsyncSession,
+        user_id: str,
+        provider: str,
+        model_family: Optional[str],
+        model: str,
+        call: Callable[[ResourceEntry], Awaitable[PoolCallResult]],
+        required_quota: float = 1.0,
+        request_type: str = "chat",
+        credits_charged: float = 0.0
+    ) -> PoolExecution:
+        """
+        Run `call` against pool keys until one succeeds
+
+        Raises HTTPException 503 when no key is available at all, 502 when
+        every attempt failed, and 400 when the upstream rejected the request.
+        """
+        policy = await self.policy(db)
+        max_attempts = 1 + policy.max_retry_attempts
+        hedge_delay = self.hedge_after_ms / 1000 if self.hedge_after_ms > 0 else None
+        tried: Set[str] = set()
+        attempts: List[PoolAttempt] = []
+        pending: Dict[asyncio.Task, PoolAttempt] = {}
+        winner: Optional[PoolAttempt] = None
+        rejected: Optional[PoolAttempt] = None
+
+        async def start(role: str) -> Optional[PoolAttempt]:
+            if len(attempts) >= max_attempts:
+                return None
+            entry, failover = await self._select(db, policy, provider, model_family, required_quota, tried)
+            if entry is None:
+                return None
+            tried.add(entry.id)
+            attempt = PoolAttempt(
+                number=len(attempts) + 1,
+                role=f"{role}:failover" if failover else role,
+                resource=entry,
+                started_at=time.perf_counter()
+            )
+            attempt.task = asyncio.create_task(self._call(call, entry))
+            attempts.append(attempt)
+            pending[attempt.task] = attempt
+            return attempt
+
+        try:
+            await start("primary")
+            while pending:
+                # Hedge once per in-flight attempt when it is the only one
+                timeout = hedge_delay if len(pending) == 1 and len(attempts) < max_attempts else None
+                done, _ = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+
+                if not done:
+                    if await start("hedge") is None:
+                        hedge_delay = None  # Nothing to hedge to; just wait
+                    continue
+
+                for task in done:
+                    attempt = pending.pop(task)
+                    self._finish(attempt)
+                    self._log(db, attempt, policy, max_attempts, user_id, model, request_type, credits_charged)
+                    if attempt.outcome == "success" and winner is None:
+                        winner = attempt
+                    elif attempt.outcome == "rejected":
+                        rejected = attempt
+
+                if winner is not None or rejected is not None:
+                    break
+                if not pending:
+                    await start("retry")
+        finally:
+            # Losing hedges (or everything, if we were cancelled ourselves)
+            for task, attempt in pending.items():
+                task.cancel()
+                attempt.outcome = "cancelled"
+                attempt.latency_ms = (time.perf_counter() - attempt.started_at) * 1000
+                self._log(db, attempt, policy, max_attempts, user_id, model, request_type, 0.0)
+            # One commit for every attempt's log row
+            await db.commit()
+
+        if winner is not None:
+            return PoolExecution(result=winner.result, resource=winner.resource, attempts=attempts)
+        if rejected is not None:
+            raise HTTPException(status_code=400, detail=rejected.error)
+        if not attempts:
+            raise HTTPException(status_code=503, detail=f"No {provider} resource available in the pool")
+        raise HTTPException(
+            status_code=502,
+            detail=f"All {len(attempts)} pool attempts failed: {attempts[-1].error}"
+        )
+
+
+pool_executor = PoolRequestExecutor(
+    attempt_timeout=settings.pool_attempt_timeout,
+    hedge_after_ms=settings.pool_hedge_after_ms,
+    policy_ttl=settings.pool_router_refresh_interval
+)
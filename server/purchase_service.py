@@ -0,0 +1,172 @@
+"""
+Marketplace purchase engine
+
+A purchase settles inventory, buyer, seller and platform in ONE database
+transaction:
+
+1. Inventory is reserved with a single conditional UPDATE
+   (available_quota >= amount AND status = active ...). The row lock it takes
+   (PostgreSQL) or the write lock (SQLite) serializes concurrent buyers, and
+   the condition is re-evaluated against the committed quota, so a listing
+   can never be oversold.
+2. The buyer is debited with CreditService.debit's conditional UPDATE.
+3. The seller is credited with an increment UPDATE.
+4. Platform fee and reserve fund go to the platform ledger, and the
+   ResourceTransaction is inserted.
+
+Any failure rolls everything back, including the inventory reservation.
+Credit rows are locked in user_id order so two users buying from each
+other at the same moment cannot deadlock.
+"""
+from datetime import datetime
+from fastapi import HTTPException
+from sqlalchemy import update, case, literal
+from sqlalchemy.orm import Session
+
+from models_credit import TransactionType
+from models_marketplace import (
+    ResourceListing, ResourceTransaction, PlatformLedgerEntry,
+    ResourceStatus, TransactionStatus
+)
+from credit_service import CreditService
+
+# 分成比例
+SELLER_SHARE = 0.85   # 卖家85%
+PLATFORM_SHARE = 0.10  # 平台10%
+RESERVE_SHARE = 0.05   # 准备金5%
+
+
+class PurchaseService:
+    """Atomic settlement of marketplace purchases"""
+
+    @staticmethod
+    def _reserve_inventory(db: Session, listing_id: str, buyer_id: str, amount: float):
+        """Decrement inventory if (and only if) the purchase is valid right now"""
+        out_of_stock = literal(ResourceStatus.OUT_OF_STOCK, ResourceListing.status.type)
+        return db.execute(
+            update(ResourceListing)
+            .where(
+                ResourceListing.id == listing_id,
+                ResourceListing.status == ResourceStatus.ACTIVE,
+                ResourceListing.available_quota >= amount,
+                ResourceListing.min_purchase <= amount,
+                ResourceListing.user_id != buyer_id
+            )
+            .values(
+                available_quota=ResourceListing.available_quota - amount,
+                total_sales=ResourceListing.total_sales + amount,
+                total_orders=ResourceListing.total_orders + 1,
+                status=case(
+                    (ResourceListing.available_quota - amount <= 0, out_of_stock),
+                    else_=ResourceListing.status
+                ),
+                updated_at=datetime.utcnow()
+            )
+            .returning(
+                ResourceListing.user_id,
+                ResourceListing.title,
+                ResourceListing.price_per_1m_tokens
+            )
+            .execution_options(synchronize_session=False)
+        ).first()
+
+    @staticmethod
+    def _rejection(db: Session, listing_id: str, buyer_id: str, amount: float) -> HTTPException:
+        """Explain why the inventory reservation matched no row (error path only)"""
+        listing = db.get(ResourceListing, listing_id)
+        if not listing or listing.status != ResourceStatus.ACTIVE:
+            return HTTPException(status_code=404, detail="Listing not found or not available")
+        if listing.user_id == buyer_id:
+            return HTTPException(status_code=400, detail="Cannot purchase your own resource")
+        if amount < listing.min_purchase:
+            return HTTPException(status_code=400, detail=f"Minimum purchase is ${listing.min_purchase}")
+        return HTTPException(status_code=400, detail="Insufficient quota available")
+
+    @staticmethod
+    def purchase(db: Session, listing_id: str, buyer_id: str, amount: float) -> ResourceTransaction:
+        """
+        Buy `amount` dollars of quota from a listing
+        Raises HTTPException (nothing is written) when the purchase is rejected.
+        """
+        try:
+            reserved = PurchaseService._reserve_inventory(db, listing_id, buyer_id, amount)
+            if reserved is None:
+                raise PurchaseService._rejection(db, listing_id, buyer_id, amount)
+            seller_id = reserved.user_id
+            title = reserved.title
+            price_per_1m_tokens = reserved.price_per_1m_tokens
+
+            # 计算费用
+            seller_revenue = amount * SELLER_SHARE
+            platform_fee = amount * PLATFORM_SHARE
+            reserve_fund = amount * RESERVE_SHARE
+            tokens_purchased = int((amount / price_per_1m_tokens) * 1_000_000)
+
+            # 买家扣款、卖家入账（按 user_id 顺序加锁，避免死锁）
+            for user_id in sorted((buyer_id, seller_id)):
+                if user_id == buyer_id:
+                    try:
+                        CreditService.debit(
+                            user_id=buyer_id,
+                            amount=amount,
+                            description=f"Purchase resource: {title}",
+                            reference_id=listing_id,
+                            db=db,
+                            commit=False
+                        )
+                    except HTTPException as e:
+                        if e.status_code == 402:
+                            raise HTTPException(status_code=400, detail="Insufficient credit balance")
+                        raise
+                else:
+                    CreditService.credit(
+                        user_id=seller_id,
+                        amount=seller_revenue,
+                        type=TransactionType.BONUS,
+                        description=f"Sale revenue: {title}",
+                        reference_id=listing_id,
+                        db=db,
+                        commit=False
+                    )
+
+            # 创建交易记录
+            transaction = ResourceTransaction(
+                buyer_id=buyer_id,
+                seller_id=seller_id,
+                listing_id=listing_id,
+                amount=amount,
+                tokens_purchased=tokens_purchased,
+                price_per_1m_tokens=price_per_1m_tokens,
+                seller_revenue=seller_revenue,
+                platform_fee=platform_fee,
+                reserve_fund=reserve_fund,
+                tokens_used=0,
+                tokens_remaining=tokens_purchased,
+                status=TransactionStatus.COMPLETED,
+                completed_at=datetime.utcnow()
+            )
+            db.add(transaction)
+            db.flush()
+
+            # 平台账本
+            db.add_all([
+                PlatformLedgerEntry(
+                    transaction_id=transaction.id,
+                    listing_id=listing_id,
+                    entry_type="platform_fee",
+                    amount=platform_fee
+                ),
+                PlatformLedgerEntry(
+                    transaction_id=transaction.id,
+                    listing_id=listing_id,
+                    entry_type="reserve_fund",
+                    amount=reserve_fund
+                ),
+            ])
+
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+
+        return transaction
@@ -0,0 +1,302 @@
+"""
+Quota counters
+
+Per-user request/token counters for the current UTC day and month, bumped
+when usage is recorded so limit checks are O(1) instead of aggregating
+usage_logs on every request.
+
+Counters live in Redis (shared across workers) when it is available and in
+process memory otherwise. Keys embed the UTC day/month, so they roll over
+at midnight and on the 1st without any reset job. A periodic reconcile
+raises the counters of limited users to the usage_logs totals to correct
+drift (lost increments, restarts, late spool replays). It never lowers
+them: usage_logs lags the write-behind queue, so a lower total only means
+increments that are still on their way to the database.
+"""
+import asyncio
+import threading
+from datetime import datetime
+from typing import Dict, Optional, Tuple
+from sqlalchemy import func
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from config import settings
+from database import SessionLocal
+from models import UsageLog, UserLimit
+from rate_limit import redis_client, redis_available
+
+
+DAY_TTL = 2 * 24 * 3600
+MONTH_TTL = 33 * 24 * 3600
+
+# KEYS[1] counter; ARGV requests, tokens, ttl. Raise to at least these totals, mark seeded.
+RAISE_LUA = """
+local requests = tonumber(redis.call('HGET', KEYS[1], 'requests')) or 0
+local tokens = tonumber(redis.call('HGET', KEYS[1], 'tokens')) or 0
+redis.call('HSET', KEYS[1],
+    'requests', math.max(requests, tonumber(ARGV[1])),
+    'tokens', math.max(tokens, tonumber(ARGV[2])),
+    'seeded', 1)
+redis.call('EXPIRE', KEYS[1], tonumber(ARGV[3]))
+return 1
+"""
+
+
+def _periods(now: Optional[datetime] = None) -> Tuple[str, str]:
+    """Current UTC day and month keys"""
+    now = now or datetime.utcnow()
+    return now.strftime("%Y%m%d"), now.strftime("%Y%m")
+
+
+def _period_starts(now: Optional[datetime] = None) -> Tuple[datetime, datetime]:
+    now = now or datetime.utcnow()
+    return datetime(now.year, now.month, now.day), datetime(now.year, now.month, 1)
+
+
+def _usage_since(db: Session, user_id: str, start: datetime) -> Tuple[int, int]:
+    """(requests, tokens) for a user since start, straight from usage_logs"""
+    row = db.query(
+        func.count(UsageLog.id),
+        func.sum(UsageLog.total_tokens)
+    ).filter(
+        UsageLog.user_id == user_id,
+        UsageLog.timestamp >= start
+    ).first()
+    return int(row[0] or 0), int(row[1] or 0)
+
+
+class QuotaCounters:
+    """Day/month usage counters with a Redis or in-process backend"""
+
+    REDIS_PREFIX = "quota:"
+
+    def __init__(self, reconcile_interval: float):
+        self.reconcile_interval = reconcile_interval
+        # (user_id, "d"/"m", period) -> {"requests", "tokens", "seeded"}
+        self._local: Dict[Tuple[str, str, str], Dict[str, int]] = {}
+        self._local_day: Optional[str] = None
+        self._lock = threading.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self._raise_script = redis_client.register_script(RAISE_LUA) if self.use_redis else None
+
+    @property
+    def use_redis(self) -> bool:
+        return redis_available
+
+    async def _off_loop(self, fn, *args):
+        """Run fn in a worker thread when it may block on Redis"""
+        if self.use_redis:
+            return await asyncio.to_thread(fn, *args)
+        return fn(*args)
+
+    def _redis_key(self, user_id: str, scope: str, period: str) -> str:
+        return f"{self.REDIS_PREFIX}{user_id}:{scope}:{period}"
+
+    def _local_entry(self, user_id: str, scope: str, period: str) -> Dict[str, int]:
+        # Caller holds self._lock
+        day, _ = _periods()
+        if day != self._local_day:
+            # UTC rollover: drop counters of past periods
+            _, month = _periods()
+            self._local = {
+                k: v for k, v in self._local.items()
+                if (k[1] == "d" and k[2] == day) or (k[1] == "m" and k[2] == month)
+            }
+            self._local_day = day
+        return self._local.setdefault((user_id, scope, period), {"requests": 0, "tokens": 0, "seeded": 0})
+
+    # ---------- write side ----------
+
+    def record(self, user_id: str, tokens: int, requests: int = 1):
+        """Add usage to the user's current day and month counters"""
+        day, month = _periods()
+        if self.use_redis:
+            try:
+                pipe = redis_client.pipeline()
+                for scope, period, ttl in (("d", day, DAY_TTL), ("m", month, MONTH_TTL)):
+                    key = self._redis_key(user_id, scope, period)
+                    pipe.hincrby(key, "requests", requests)
+                    pipe.hincrby(key, "tokens", tokens)
+                    pipe.expire(key, ttl)
+                pipe.execute()
+                return
+            except Exception as e:
+                print(f"⚠️  Quota counter update failed in Redis, using local counters: {e}")
+
+        with self._lock:
+            for scope, period in (("d", day), ("m", month)):
+                entry = self._local_entry(user_id, scope, period)
+                entry["requests"] += requests
+                entry["tokens"] += tokens
+
+    async def record_async(self, user_id: str, tokens: int, requests: int = 1):
+        """record() without blocking the event loop on Redis"""
+        await self._off_loop(self.record, user_id, tokens, requests)
+
+    def _raise_to(self, user_id: str, scope: str, period: str, requests: int, tokens: int):
+        """Raise one counter to at least these totals and mark it seeded (seeding / reconcile)"""
+        if self.use_redis:
+            try:
+                ttl = DAY_TTL if scope == "d" else MONTH_TTL
+                self._raise_script(keys=[self._redis_key(user_id, scope, period)], args=[requests, tokens, ttl])
+                return
+            except Exception as e:
+                print(f"⚠️  Quota counter write failed in Redis: {e}")
+
+        with self._lock:
+            entry = self._local_entry(user_id, scope, period)
+            entry.update(
+                requests=max(entry["requests"], requests),
+                tokens=max(entry["tokens"], tokens),
+                seeded=1
+            )
+
+    # ---------- read side ----------
+
+    def _read(self, user_id: str, day: str, month: str) -> Tuple[Dict[str, int], Dict[str, int]]:
+        if self.use_redis:
+            try:
+                pipe = redis_client.pipeline()
+                pipe.hgetall(self._redis_key(user_id, "d", day))
+                pipe.hgetall(self._redis_key(user_id, "m", month))
+                day_raw, month_raw = pipe.execute()
+                return (
+                    {k: int(v) for k, v in day_raw.items()},
+                    {k: int(v) for k, v in month_raw.items()},
+                )
+            except Exception as e:
+                print(f"⚠️  Quota counter read failed in Redis, using local counters: {e}")
+
+        with self._lock:
+            return (
+                dict(self._local_entry(user_id, "d", day)),
+                dict(self._local_entry(user_id, "m", month)),
+            )
+
+    @staticmethod
+    def _unseeded(day_counts: Dict[str, int], month_counts: Dict[str, int], now: datetime):
+        """(scope, period, start, counts) of counters not seeded from usage_logs yet"""
+        day, month = _periods(now)
+        today_start, month_start = _period_starts(now)
+        return [
+            (scope, period, start, counts)
+            for scope, period, start, counts in (
+                ("d", day, today_start, day_counts),
+                ("m", month, month_start, month_counts),
+            )
+            if not counts.get("seeded")
+        ]
+
+    @staticmethod
+    def _seed(counts: Dict[str, int], requests: int, tokens: int):
+        # Keep increments recorded before the seed
+        counts["requests"] = max(requests, counts.get("requests", 0))
+        counts["tokens"] = max(tokens, counts.get("tokens", 0))
+
+    @staticmethod
+    def _usage(day_counts: Dict[str, int], month_counts: Dict[str, int]) -> Dict[str, int]:
+        return {
+            "today_requests": day_counts.get("requests", 0),
+            "today_tokens": day_counts.get("tokens", 0),
+            "month_tokens": month_counts.get("tokens", 0),
+        }
+
+    def get_usage(self, user_id: str, db: Session) -> Dict[str, int]:
+        """
+        Current usage for a user: today_requests, today_tokens, month_tokens
+        Counters not seeded yet (first check of the period in this backend)
+        are initialized once from usage_logs.
+        Blocks on Redis; async routes use get_usage_async().
+        """
+        now = datetime.utcnow()
+        day, month = _periods(now)
+        day_counts, month_counts = self._read(user_id, day, month)
+
+        for scope, period, start, counts in self._unseeded(day_counts, month_counts, now):
+            self._seed(counts, *_usage_since(db, user_id, start))
+            self._raise_to(user_id, scope, period, counts["requests"], counts["tokens"])
+
+        return self._usage(day_counts, month_counts)
+
+    async def get_usage_async(self, user_id: str, db: AsyncSession) -> Dict[str, int]:
+        """get_usage() for async routes: Redis calls run in a worker thread"""
+        now = datetime.utcnow()
+        day, month = _periods(now)
+        day_counts, month_counts = await self._off_loop(self._read, user_id, day, month)
+
+        for scope, period, start, counts in self._unseeded(day_counts, month_counts, now):
+            self._seed(counts, *await db.run_sync(lambda session: _usage_since(session, user_id, start)))
+            await self._off_loop(self._raise_to, user_id, scope, period, counts["requests"], counts["tokens"])
+
+        return self._usage(day_counts, month_counts)
+
+    # ---------- reconcile ----------
+
+    def reconcile(self, db: Session) -> int:
+        """
+        Raise counters of limited users to the usage_logs totals
+        Returns the number of users reconciled
+        """
+        now = datetime.utcnow()
+        day, month = _periods(now)
+        today_start, month_start = _period_starts(now)
+
+        user_ids = [
+            row[0] for row in
+            db.query(UserLimit.user_id).filter(UserLimit.is_limited == True).all()
+        ]
+        if not user_ids:
+            return 0
+
+        def totals(start: datetime) -> Dict[str, Tuple[int, int]]:
+            rows = db.query(
+                UsageLog.user_id,
+                func.count(UsageLog.id),
+                func.sum(UsageLog.total_tokens)
+            ).filter(
+                UsageLog.user_id.in_(user_ids),
+                UsageLog.timestamp >= start
+            ).group_by(UsageLog.user_id).all()
+            return {user_id: (int(requests or 0), int(tokens or 0)) for user_id, requests, tokens in rows}
+
+        day_totals = totals(today_start)
+        month_totals = totals(month_start)
+        for user_id in user_ids:
+            self._raise_to(user_id, "d", day, *day_totals.get(user_id, (0, 0)))
+            self._raise_to(user_id, "m", month, *month_totals.get(user_id, (0, 0)))
+        return len(user_ids)
+
+    def _reconcile_with_new_session(self) -> int:
+        db = SessionLocal()
+        try:
+            return self.reconcile(db)
+        finally:
+            db.close()
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.reconcile_interval)
+            try:
+                count = await asyncio.to_thread(self._reconcile_with_new_session)
+                if count:
+                    print(f"🔄 Reconciled quota counters for {count} users")
+            except Exception as e:
+                print(f"⚠️  Quota counter reconcile failed: {e}")
+
+    def start(self):
+        """Start the periodic reconcile task (startup hook)"""
+        if self._task is None and self.reconcile_interval > 0:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+# Application-wide quota counters
+quota_counters = QuotaCounters(reconcile_interval=settings.quota_reconcile_interval)
@@ -13,15 +13,19 @@ import os
 # Try to connect to Redis, fall back to in-memory storage
 redis_url = os.getenv("REDIS_URL", "redis://localhost:6379")
 redis_client: Optional[redis.Redis] = None
+# True only when the ping succeeded; other Redis consumers check this
+redis_available = False
 
 try:
     redis_client = redis.from_url(redis_url, decode_responses=True)
     redis_client.ping()  # Test connection
     print(f"✅ Connected to Redis at {redis_url}")
     storage_backend = f"redis://{redis_url.split('://')[1]}"
+    redis_available = True
 except Exception as e:
     print(f"⚠️  Redis not available ({e}), using in-memory rate limiting")
     storage_backend = None
+    redis_client = None
 
 # Create limiter
 # If Redis is available, use it for distributed rate limiting
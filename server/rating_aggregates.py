@@ -0,0 +1,77 @@
+"""
+Marketplace rating aggregates
+
+Each listing keeps the count and sum of its review ratings, plus a sum and
+count per optional dimension (speed, reliability, value). A new review
+adds to them with one atomic UPDATE, so reviewing costs the same no matter
+how many reviews a listing already has, and concurrent reviews never lose
+increments. recompute_listing_ratings.py rebuilds every aggregate from
+resource_reviews to repair drift.
+"""
+from typing import Dict, Optional
+from sqlalchemy import update, select, func, case, literal
+from models_marketplace import ResourceListing, ResourceReview
+
+DIMENSIONS = ["speed", "reliability", "value"]
+DEFAULT_RATING = 5.0  # Shown until a listing gets its first review
+
+
+def _column(name: str):
+    return getattr(ResourceListing, name)
+
+
+def apply_review(listing_id: str, rating: float, dimensions: Dict[str, Optional[float]]):
+    """UPDATE adding one review to a listing's aggregates (RETURNING model_id)"""
+    values = {
+        "review_count": ResourceListing.review_count + 1,
+        "rating_sum": ResourceListing.rating_sum + rating,
+        # Right-hand sides see the old row, so this is the new average
+        "rating": (ResourceListing.rating_sum + rating) / (ResourceListing.review_count + 1),
+    }
+    for dimension in DIMENSIONS:
+        value = dimensions.get(dimension)
+        if value is not None:
+            values[f"{dimension}_rating_sum"] = _column(f"{dimension}_rating_sum") + value
+            values[f"{dimension}_rating_count"] = _column(f"{dimension}_rating_count") + 1
+
+    return (
+        update(ResourceListing)
+        .where(ResourceListing.id == listing_id)
+        .values(**values)
+        .returning(ResourceListing.model_id)
+        .execution_options(synchronize_session=False)
+    )
+
+
+def dimension_average(listing: ResourceListing, dimension: str) -> Optional[float]:
+    count = getattr(listing, f"{dimension}_rating_count") or 0
+    if not count:
+        return None
+    return getattr(listing, f"{dimension}_rating_sum") / count
+
+
+def recompute_all():
+    """UPDATE rebuilding every listing's aggregates from resource_reviews"""
+    def review_stat(aggregate, column=None, default=0):
+        where = ResourceReview.listing_id == ResourceListing.id
+        stat = select(func.coalesce(aggregate, default)).where(where)
+        if column is not None:
+            stat = stat.where(column.isnot(None))
+        return stat.correlate(ResourceListing).scalar_subquery()
+
+    review_count = review_stat(func.count(ResourceReview.id))
+    rating_sum = review_stat(func.sum(ResourceReview.rating), default=0.0)
+    values = {
+        "review_count": review_count,
+        "rating_sum": rating_sum,
+        "rating": case(
+            (review_count > 0, rating_sum / review_count),
+            else_=literal(DEFAULT_RATING)
+        ),
+    }
+    for dimension in DIMENSIONS:
+        column = getattr(ResourceReview, f"{dimension}_rating")
+        values[f"{dimension}_rating_sum"] = review_stat(func.sum(column), column, default=0.0)
+        values[f"{dimension}_rating_count"] = review_stat(func.count(column), column)
+
+    return update(ResourceListing).values(**values)
@@ -0,0 +1,149 @@
+"""
+Real-time event hub
+
+Pushes new direct messages, group messages, unread counters and forum posts
+to connected clients (see routers/realtime_router.py) instead of having
+every panel poll.
+
+Each connection subscribes a bounded queue for its user. Events published
+by the routers are delivered to the queues of the target users (or of
+everyone for broadcasts). When Redis is available events go through a
+Redis pub/sub channel, and every worker delivers what it receives to its
+own connections, so users get events no matter which worker they are
+connected to. Without Redis, delivery stays in-process.
+"""
+import asyncio
+import json
+import threading
+from typing import Dict, Iterable, Optional, Set
+from fastapi.encoders import jsonable_encoder
+from config import settings
+from rate_limit import redis_client, redis_available
+
+
+class EventHub:
+    """In-process pub/sub for user events with optional Redis fan-out"""
+
+    REDIS_CHANNEL = "realtime:events"
+
+    def __init__(self, queue_size: int):
+        self.queue_size = queue_size
+        self._subscribers: Dict[str, Set[asyncio.Queue]] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._listener: Optional[threading.Thread] = None
+        self._stopping = threading.Event()
+        self._subscribed = threading.Event()  # Set while the listener holds a live subscription
+        self._dropped = 0
+
+    @property
+    def use_redis(self) -> bool:
+        return redis_available
+
+    # ---------- subscriptions ----------
+
+    def subscribe(self, user_id: str) -> asyncio.Queue:
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        self._subscribers.setdefault(user_id, set()).add(queue)
+        return queue
+
+    def unsubscribe(self, user_id: str, queue: asyncio.Queue):
+        queues = self._subscribers.get(user_id)
+        if queues is None:
+            return
+        queues.discard(queue)
+        if not queues:
+            del self._subscribers[user_id]
+
+    def _deliver(self, user_ids: Optional[Iterable[str]], event: Dict):
+        """Put an event on the queues of local subscribers (None = everyone)"""
+        if user_ids is None:
+            targets = [q for queues in self._subscribers.values() for q in queues]
+        else:
+            targets = [q for uid in set(user_ids) for q in self._subscribers.get(uid, ())]
+        for queue in targets:
+            try:
+                queue.put_nowait(event)
+            except asyncio.QueueFull:
+                # Slow client: it resyncs over REST when it reconnects
+                self._dropped += 1
+
+    # ---------- publishing ----------
+
+    def _redis_publish(self, payload: str) -> bool:
+        try:
+            redis_client.publish(self.REDIS_CHANNEL, payload)
+            return True
+        except Exception as e:
+            print(f"⚠️  Realtime publish to Redis failed, delivering locally: {e}")
+            return False
+
+    async def publish(self, event_type: str, data, user_ids: Optional[Iterable[str]] = None):
+        """
+        Publish an event to some users (or to everyone when user_ids is None)
+        Never raises: a lost push only delays clients until their next resync.
+        """
+        event = {"type": event_type, "data": jsonable_encoder(data)}
+        targets = list(user_ids) if user_ids is not None else None
+
+        if self.use_redis and self._listener is not None:
+            # Checked before publishing: a listener that is reconnecting misses the message
+            subscribed = self._subscribed.is_set()
+            payload = json.dumps({"user_ids": targets, "event": event}, ensure_ascii=False)
+            if await asyncio.to_thread(self._redis_publish, payload) and subscribed:
+                return  # Delivered to local subscribers by our own listener
+        self._deliver(targets, event)
+
+    # ---------- Redis fan-out ----------
+
+    def _listen(self):
+        """Relay events from the Redis channel to this worker's subscribers"""
+        pubsub = None
+        while not self._stopping.is_set():
+            try:
+                if pubsub is None:
+                    pubsub = redis_client.pubsub(ignore_subscribe_messages=True)
+                    pubsub.subscribe(self.REDIS_CHANNEL)
+                    self._subscribed.set()
+                message = pubsub.get_message(timeout=1.0)
+                if message is None:
+                    continue
+                envelope = json.loads(message["data"])
+                self._loop.call_soon_threadsafe(self._deliver, envelope["user_ids"], envelope["event"])
+            except Exception as e:
+                self._subscribed.clear()
+                print(f"⚠️  Realtime Redis listener error: {e}")
+                if pubsub is not None:
+                    try:
+                        pubsub.close()
+                    except Exception:
+                        pass
+                    pubsub = None
+                self._stopping.wait(2.0)
+        self._subscribed.clear()
+        if pubsub is not None:
+            pubsub.close()
+
+    def start(self):
+        self._loop = asyncio.get_running_loop()
+        if self.use_redis and self._listener is None:
+            self._stopping.clear()
+            self._listener = threading.Thread(target=self._listen, name="realtime-redis", daemon=True)
+            self._listener.start()
+            print("✅ Realtime events fan out through Redis")
+
+    async def stop(self):
+        if self._listener is not None:
+            self._stopping.set()
+            await asyncio.to_thread(self._listener.join, 5.0)
+            self._listener = None
+
+    def stats(self) -> Dict:
+        return {
+            "connections": sum(len(queues) for queues in self._subscribers.values()),
+            "users": len(self._subscribers),
+            "dropped_events": self._dropped,
+            "redis": self._listener is not None,
+        }
+
+
+event_hub = EventHub(queue_size=settings.realtime_queue_size)
@@ -0,0 +1,46 @@
+"""
+Recompute marketplace rating aggregates from resource_reviews
+
+Adds the aggregate columns to resource_listings if they are missing, then
+rebuilds review_count, rating_sum, rating and the per-dimension sums and
+counts of every listing with one UPDATE. Run once after upgrading, and
+periodically (e.g. nightly cron) to repair any drift. Works on both SQLite
+and PostgreSQL.
+
+Usage:
+    python recompute_listing_ratings.py
+"""
+from sqlalchemy import create_engine, inspect, text
+from config import settings
+from rating_aggregates import DIMENSIONS, recompute_all
+
+
+AGGREGATE_COLUMNS = {"rating_sum": "FLOAT DEFAULT 0"}
+for dimension in DIMENSIONS:
+    AGGREGATE_COLUMNS[f"{dimension}_rating_sum"] = "FLOAT DEFAULT 0"
+    AGGREGATE_COLUMNS[f"{dimension}_rating_count"] = "INTEGER DEFAULT 0"
+
+
+def add_missing_columns(engine):
+    columns = {col["name"] for col in inspect(engine).get_columns("resource_listings")}
+    missing = [name for name in AGGREGATE_COLUMNS if name not in columns]
+    with engine.begin() as conn:
+        for name in missing:
+            conn.execute(text(f"ALTER TABLE resource_listings ADD COLUMN {name} {AGGREGATE_COLUMNS[name]}"))
+            print(f"  ✅ Added column {name}")
+
+
+def recompute():
+    print("🔧 Recomputing listing rating aggregates...")
+
+    engine = create_engine(settings.database_url)
+    add_missing_columns(engine)
+
+    with engine.begin() as conn:
+        updated = conn.execute(recompute_all()).rowcount
+
+    print(f"✅ Recomputed ratings for {updated} listings")
+
+
+if __name__ == "__main__":
+    recompute()
@@ -0,0 +1,202 @@
+"""
+Live health of resource pool keys for SmartRouter
+
+Per resource, in memory:
+- exponentially weighted (EWMA) latency and error rate, so a key that
+  degraded a few minutes ago stops winning long before its lifetime
+  success_rate moves
+- a streaming p95 latency estimate (no samples kept)
+- a circuit breaker: CLOSED -> OPEN after repeated failures (traffic is
+  routed around the key), OPEN -> HALF_OPEN after a cooldown (a limited
+  number of trial requests), HALF_OPEN -> CLOSED on a successful probe or
+  back to OPEN on a failed one
+
+Health is per worker and starts empty (neutral) after a restart.
+"""
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, Optional
+from config import settings
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+@dataclass
+class HealthState:
+    ewma_latency: Optional[float] = None  # ms
+    p95_latency: Optional[float] = None  # ms
+    ewma_error_rate: float = 0.0
+    samples: int = 0
+    consecutive_failures: int = 0
+    circuit: str = CLOSED
+    opened_at: float = 0.0  # When the circuit last opened or started probing
+    probes_in_flight: int = 0
+
+
+class ResourceHealthTracker:
+    """EWMA latency / error trackers and circuit breakers keyed by resource id"""
+
+    # Latency at which the latency factor is 0.5; faster keys score higher
+    REFERENCE_LATENCY_MS = 1000.0
+
+    def __init__(
+        self,
+        alpha: float,
+        failure_threshold: int,
+        error_rate_threshold: float,
+        min_samples: int,
+        cooldown_seconds: float,
+        half_open_probes: int
+    ):
+        self.alpha = alpha
+        self.failure_threshold = failure_threshold
+        self.error_rate_threshold = error_rate_threshold
+        self.min_samples = min_samples
+        self.cooldown_seconds = cooldown_seconds
+        self.half_open_probes = half_open_probes
+        self._states: Dict[str, HealthState] = {}
+        self._lock = threading.Lock()
+
+    def _state(self, resource_id: str) -> HealthState:
+        state = self._states.get(resource_id)
+        if state is None:
+            state = self._states[resource_id] = HealthState()
+        return state
+
+    def _open(self, state: HealthState):
+        state.circuit = OPEN
+        state.opened_at = time.monotonic()
+        state.probes_in_flight = 0
+
+    # ---------- routing ----------
+
+    def available(self, resource_id: str) -> bool:
+        """Whether selection may consider the key (does not reserve a probe)"""
+        state = self._states.get(resource_id)
+        if state is None or state.circuit == CLOSED:
+            return True
+        cooled_down = time.monotonic() - state.opened_at >= self.cooldown_seconds
+        if state.circuit == OPEN:
+            return cooled_down
+        return cooled_down or state.probes_in_flight < self.half_open_probes
+
+    def acquire(self, resource_id: str) -> bool:
+        """Claim the key for a request; past the cooldown this starts a half-open probe"""
+        with self._lock:
+            state = self._states.get(resource_id)
+            if state is None or state.circuit == CLOSED:
+                return True
+            cooled_down = time.monotonic() - state.opened_at >= self.cooldown_seconds
+            if state.circuit == OPEN:
+                if not cooled_down:
+                    return False
+                state.circuit = HALF_OPEN
+                state.opened_at = time.monotonic()
+                state.probes_in_flight = 0
+            elif cooled_down:
+                # Probes that never reported back (e.g. worker task killed) don't block forever
+                state.opened_at = time.monotonic()
+                state.probes_in_flight = 0
+            if state.probes_in_flight >= self.half_open_probes:
+                return False
+            state.probes_in_flight += 1
+            return True
+
+    def release(self, resource_id: str):
+        """Give back a claimed probe without an outcome (request cancelled)"""
+        with self._lock:
+            state = self._states.get(resource_id)
+            if state is not None and state.circuit == HALF_OPEN and state.probes_in_flight:
+                state.probes_in_flight -= 1
+
+    def record(self, resource_id: str, success: bool, latency_ms: Optional[float] = None) -> HealthState:
+        """Feed one request outcome into the trackers and the breaker"""
+        with self._lock:
+            state = self._state(resource_id)
+            state.samples += 1
+            state.ewma_error_rate += self.alpha * ((0.0 if success else 1.0) - state.ewma_error_rate)
+
+            if latency_ms is not None:
+                if state.ewma_latency is None:
+                    state.ewma_latency = state.p95_latency = latency_ms
+                else:
+                    state.ewma_latency += self.alpha * (latency_ms - state.ewma_latency)
+                    # Stochastic quantile estimate: settles where 5% of samples land above it
+                    step = self.alpha * max(state.ewma_latency, 1.0)
+                    if latency_ms > state.p95_latency:
+                        state.p95_latency += step * 0.95
+                    else:
+                        state.p95_latency = max(state.p95_latency - step * 0.05, 0.0)
+
+            if success:
+                state.consecutive_failures = 0
+                if state.circuit == HALF_OPEN:
+                    state.circuit = CLOSED
+                    state.probes_in_flight = 0
+                    print(f"✅ Resource {resource_id} circuit closed")
+            else:
+                state.consecutive_failures += 1
+                tripped = (
+                    state.consecutive_failures >= self.failure_threshold
+                    or (state.samples >= self.min_samples and state.ewma_error_rate >= self.error_rate_threshold)
+                )
+                if state.circuit == HALF_OPEN or (state.circuit == CLOSED and tripped):
+                    self._open(state)
+                    print(f"⚠️  Resource {resource_id} circuit opened "
+                          f"({state.consecutive_failures} consecutive failures, "
+                          f"error rate {state.ewma_error_rate:.0%})")
+            return state
+
+    # ---------- scoring ----------
+
+    def performance_score(
+        self,
+        resource_id: str,
+        success_rate: float,
+        avg_response_time: Optional[float]
+    ) -> float:
+        """
+        0-100 score from recent reliability and tail latency
+        Falls back to the stored lifetime stats until the key has been used here.
+        """
+        state = self._states.get(resource_id)
+        if state is not None and state.samples:
+            reliability = (1.0 - state.ewma_error_rate) * 100
+            latency = state.p95_latency
+        else:
+            reliability = success_rate
+            latency = avg_response_time
+        if latency is None:
+            return reliability
+        latency_factor = self.REFERENCE_LATENCY_MS / (self.REFERENCE_LATENCY_MS + latency)
+        # Half reliability, half reliability scaled by latency (a fast failing key still loses)
+        return reliability * (0.5 + 0.5 * latency_factor)
+
+    def get(self, resource_id: str) -> Optional[HealthState]:
+        return self._states.get(resource_id)
+
+    def forget(self, resource_id: str):
+        with self._lock:
+            self._states.pop(resource_id, None)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            circuits = [state.circuit for state in self._states.values()]
+        return {
+            "tracked": len(circuits),
+            "open": circuits.count(OPEN),
+            "half_open": circuits.count(HALF_OPEN),
+        }
+
+
+resource_health = ResourceHealthTracker(
+    alpha=settings.pool_health_ewma_alpha,
+    failure_threshold=settings.pool_circuit_failure_threshold,
+    error_rate_threshold=settings.pool_circuit_error_rate,
+    min_samples=settings.pool_circuit_min_samples,
+    cooldown_seconds=settings.pool_circuit_cooldown,
+    half_open_probes=settings.pool_circuit_half_open_probes
+)
@@ -0,0 +1,210 @@
+"""
+Write-behind statistics for resource pool keys
+
+SmartRouter.record_usage adds each request's quota and outcome to an
+in-memory delta per resource instead of committing a read-modify-write of
+the PoolResource row. A background task flushes every
+settings.pool_stats_flush_interval seconds: one UPDATE per touched key with
+atomic increments (current_quota, total_requests, successful_requests,
+failed_requests, total_consumed; success_rate recomputed from the new
+counters), then one conditional UPDATE that marks keys DEPLETED only if they
+are still ACTIVE with no quota left. Concurrent workers never overwrite
+each other's counts.
+
+Deltas not yet committed are re-applied to the scoreboard whenever it
+reloads from the database (apply_pending), so a refresh never hands back
+quota that has already been spent.
+"""
+import asyncio
+import threading
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Dict, List, Optional
+from sqlalchemy import update, case, func
+from config import settings
+from database import SessionLocal
+from models_resource_pool import PoolResource, PoolResourceStatus
+
+
+@dataclass
+class StatsDelta:
+    quota_used: float = 0.0
+    requests: int = 0
+    successes: int = 0
+    failures: int = 0
+    avg_response_time: Optional[float] = None  # Latest latency EWMA (ms), overwrites
+    last_used_at: Optional[datetime] = None
+
+    def merge(self, other: "StatsDelta"):
+        """Fold an older delta (e.g. from a failed flush) into this one"""
+        self.quota_used += other.quota_used
+        self.requests += other.requests
+        self.successes += other.successes
+        self.failures += other.failures
+        if self.avg_response_time is None:
+            self.avg_response_time = other.avg_response_time
+        if self.last_used_at is None:
+            self.last_used_at = other.last_used_at
+
+
+class ResourceStatsBuffer:
+    """Per-resource usage deltas flushed as atomic SQL increments"""
+
+    def __init__(self, flush_interval: float):
+        self.flush_interval = flush_interval
+        self._pending: Dict[str, StatsDelta] = {}
+        self._flushing: Dict[str, StatsDelta] = {}  # Taken by a flush, not committed yet
+        self._lock = threading.Lock()
+        # Held while a flush commits and while the scoreboard reloads, so a
+        # reload sees each delta exactly once (in the database or re-applied)
+        self.sync_lock = threading.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self.flushed_batches = 0
+        self.depleted = 0
+
+    def add(
+        self,
+        resource_id: str,
+        quota_used: float,
+        success: bool,
+        avg_response_time: Optional[float] = None
+    ):
+        with self._lock:
+            delta = self._pending.setdefault(resource_id, StatsDelta())
+            delta.quota_used += quota_used
+            delta.requests += 1
+            if success:
+                delta.successes += 1
+            else:
+                delta.failures += 1
+            if avg_response_time is not None:
+                delta.avg_response_time = avg_response_time
+            delta.last_used_at = datetime.utcnow()
+
+    def apply_pending(self, entry):
+        """Re-apply uncommitted deltas to a ResourceEntry freshly loaded from the database"""
+        with self._lock:
+            deltas = [d for d in (self._flushing.get(entry.id), self._pending.get(entry.id)) if d is not None]
+        for delta in deltas:
+            entry.current_quota = max(0.0, entry.current_quota - delta.quota_used)
+            entry.total_requests += delta.requests
+            entry.successful_requests += delta.successes
+            entry.failed_requests += delta.failures
+            if delta.avg_response_time is not None:
+                entry.avg_response_time = delta.avg_response_time
+        if deltas and entry.total_requests:
+            entry.success_rate = entry.successful_requests / entry.total_requests * 100
+
+    @staticmethod
+    def _increment(resource_id: str, delta: StatsDelta):
+        remaining = PoolResource.current_quota - delta.quota_used
+        total = func.coalesce(PoolResource.total_requests, 0) + delta.requests
+        successful = func.coalesce(PoolResource.successful_requests, 0) + delta.successes
+        values = {
+            "current_quota": case((remaining > 0, remaining), else_=0.0),
+            "total_consumed": func.coalesce(PoolResource.total_consumed, 0.0) + delta.quota_used,
+            "total_requests": total,
+            "successful_requests": successful,
+            "failed_requests": func.coalesce(PoolResource.failed_requests, 0) + delta.failures,
+            # Right-hand sides see the old row, so this is the new rate
+            "success_rate": successful * 100.0 / total,
+            "last_used_at": delta.last_used_at,
+        }
+        if delta.avg_response_time is not None:
+            values["avg_response_time"] = delta.avg_response_time
+        return (
+            update(PoolResource)
+            .where(PoolResource.id == resource_id)
+            .values(**values)
+            .execution_options(synchronize_session=False)
+        )
+
+    def _flush_with_new_session(self) -> List[str]:
+        """Commit the pending deltas; returns ids that just became DEPLETED"""
+        with self._lock:
+            if not self._pending:
+                return []
+            self._flushing, self._pending = self._pending, {}
+            batch = self._flushing
+
+        db = SessionLocal()
+        try:
+            with self.sync_lock:
+                try:
+                    for resource_id, delta in batch.items():
+                        db.execute(self._increment(resource_id, delta))
+                    depleted = db.execute(
+                        update(PoolResource)
+                        .where(
+                            PoolResource.id.in_(list(batch)),
+                            PoolResource.status == PoolResourceStatus.ACTIVE,
+                            PoolResource.current_quota <= 0
+                        )
+                        .values(status=PoolResourceStatus.DEPLETED)
+                        .returning(PoolResource.id)
+                        .execution_options(synchronize_session=False)
+                    ).scalars().all()
+                    db.commit()
+                except Exception:
+                    db.rollback()
+                    # Put the deltas back in front of anything recorded meanwhile
+                    with self._lock:
+                        for resource_id, delta in batch.items():
+                            newer = self._pending.get(resource_id)
+                            if newer is not None:
+                                newer.merge(delta)
+                            else:
+                                self._pending[resource_id] = delta
+                        self._flushing = {}
+                    raise
+                with self._lock:
+                    self._flushing = {}
+        finally:
+            db.close()
+
+        self.flushed_batches += 1
+        self.depleted += len(depleted)
+        return depleted
+
+    async def flush(self) -> List[str]:
+        return await asyncio.to_thread(self._flush_with_new_session)
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                depleted = await self.flush()
+                for resource_id in depleted:
+                    print(f"🪫 Pool resource {resource_id} depleted")
+            except Exception as e:
+                print(f"⚠️  Pool resource stats flush failed, will retry: {e}")
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop the flush loop and write out what is left (shutdown hook)"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        try:
+            await self.flush()
+        except Exception as e:
+            print(f"⚠️  Final pool resource stats flush failed: {e}")
+
+    def stats(self) -> Dict:
+        with self._lock:
+            pending = len(self._pending)
+        return {
+            "pending_resources": pending,
+            "flushed_batches": self.flushed_batches,
+            "depleted": self.depleted,
+        }
+
+
+resource_stats = ResourceStatsBuffer(flush_interval=settings.pool_stats_flush_interval)
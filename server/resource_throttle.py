@@ -0,0 +1,131 @@
+"""
+Per-resource request throttling for SmartRouter
+
+A token bucket per pool key enforces PoolResource.max_requests_per_minute
+before a request is dispatched, so the router spreads load instead of
+driving a key into provider 429s. Keys without a limit are never throttled.
+
+Buckets live in Redis (shared across workers, updated atomically by a Lua
+script) when it is available and settings.pool_throttle_use_redis is on,
+and in process memory otherwise. Selection filters candidates with a
+local, non-consuming check; the chosen key then takes a token
+(try_acquire_async from the event loop, so the Redis round-trip runs in a
+worker thread).
+"""
+import asyncio
+import math
+import threading
+import time
+from typing import Dict, List, Optional
+from config import settings
+from rate_limit import redis_client, redis_available
+
+# KEYS[1] bucket; ARGV rate (tokens/s), capacity -> {allowed, seconds until a token}
+TOKEN_BUCKET_LUA = """
+local now_parts = redis.call('TIME')
+local now = tonumber(now_parts[1]) + tonumber(now_parts[2]) / 1000000
+local rate = tonumber(ARGV[1])
+local capacity = tonumber(ARGV[2])
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or capacity
+local ts = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+local allowed = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+    allowed = 1
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', now)
+redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 1)
+local wait = 0
+if tokens < 1 then
+    wait = (1 - tokens) / rate
+end
+return {allowed, tostring(wait)}
+"""
+
+
+class ResourceThrottle:
+    """Token buckets keyed by resource id with a Redis or in-process backend"""
+
+    REDIS_PREFIX = "pool_throttle:"
+
+    def __init__(self, burst_seconds: float, use_redis: bool):
+        self.burst_seconds = burst_seconds
+        self.use_redis = use_redis and redis_available
+        self._script = redis_client.register_script(TOKEN_BUCKET_LUA) if self.use_redis else None
+        # resource_id -> [tokens, last refill (monotonic)]
+        self._buckets: Dict[str, List[float]] = {}
+        # resource_id -> monotonic time the shared bucket has a token again (Redis backend)
+        self._blocked_until: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def _limits(self, max_requests_per_minute: int):
+        """(refill rate per second, bucket capacity)"""
+        rate = max_requests_per_minute / 60.0
+        return rate, max(1.0, math.floor(rate * self.burst_seconds))
+
+    def _refill(self, resource_id: str, rate: float, capacity: float) -> List[float]:
+        # Caller holds self._lock
+        now = time.monotonic()
+        bucket = self._buckets.get(resource_id)
+        if bucket is None:
+            bucket = self._buckets[resource_id] = [capacity, now]
+        else:
+            bucket[0] = min(capacity, bucket[0] + (now - bucket[1]) * rate)
+            bucket[1] = now
+        return bucket
+
+    def has_capacity(self, resource_id: str, max_requests_per_minute: Optional[int]) -> bool:
+        """Non-consuming check used while walking the scoreboard"""
+        if not max_requests_per_minute:
+            return True
+        if self.use_redis:
+            return self._blocked_until.get(resource_id, 0.0) <= time.monotonic()
+        rate, capacity = self._limits(max_requests_per_minute)
+        with self._lock:
+            return self._refill(resource_id, rate, capacity)[0] >= 1
+
+    def try_acquire(self, resource_id: str, max_requests_per_minute: Optional[int]) -> bool:
+        """Take one token for a request to this key"""
+        if not max_requests_per_minute:
+            return True
+        rate, capacity = self._limits(max_requests_per_minute)
+
+        if self.use_redis:
+            try:
+                allowed, wait = self._script(keys=[self.REDIS_PREFIX + resource_id], args=[rate, capacity])
+                if float(wait) > 0:
+                    self._blocked_until[resource_id] = time.monotonic() + float(wait)
+                else:
+                    self._blocked_until.pop(resource_id, None)
+                return int(allowed) == 1
+            except Exception as e:
+                print(f"⚠️  Pool throttle Redis call failed, using local bucket: {e}")
+
+        with self._lock:
+            bucket = self._refill(resource_id, rate, capacity)
+            if bucket[0] < 1:
+                return False
+            bucket[0] -= 1
+            return True
+
+    async def try_acquire_async(self, resource_id: str, max_requests_per_minute: Optional[int]) -> bool:
+        """try_acquire() without blocking the event loop on Redis"""
+        if self.use_redis and max_requests_per_minute:
+            return await asyncio.to_thread(self.try_acquire, resource_id, max_requests_per_minute)
+        return self.try_acquire(resource_id, max_requests_per_minute)
+
+    def stats(self) -> Dict:
+        now = time.monotonic()
+        if self.use_redis:
+            saturated = sum(1 for until in list(self._blocked_until.values()) if until > now)
+        else:
+            saturated = sum(1 for tokens, _ in list(self._buckets.values()) if tokens < 1)
+        return {"backend": "redis" if self.use_redis else "memory", "saturated": saturated}
+
+
+resource_throttle = ResourceThrottle(
+    burst_seconds=settings.pool_throttle_burst_seconds,
+    use_redis=settings.pool_throttle_use_redis
+)
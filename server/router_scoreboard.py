@@ -0,0 +1,250 @@
+"""
+Live scoreboard of resource pool keys for SmartRouter
+
+Keeps every active PoolResource in memory as a ResourceEntry, grouped by
+(provider, model_family) into lists sorted best score first. Selection walks
+the front of one list (no database query, no re-scoring on the request
+path); a usage event re-scores only the affected key and moves it with a
+bisect (O(log n) search). A background task reloads everything from the
+database every settings.pool_router_refresh_interval seconds to pick up new
+deposits, status changes and edits made elsewhere; usage not yet flushed to
+the database (resource_stats.py) is re-applied on top of each reload.
+"""
+import asyncio
+import bisect
+import contextlib
+import threading
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Set, Tuple
+from sqlalchemy.orm import Session
+from database import SessionLocal
+from models_resource_pool import PoolResource, PoolResourceStatus
+
+BoardKey = Tuple[str, Optional[str]]
+
+
+@dataclass
+class ResourceEntry:
+    """In-memory copy of the routing-relevant fields of a PoolResource"""
+    id: str
+    owner_id: str
+    provider: str
+    model_family: Optional[str]
+    api_key_encrypted: str
+    api_endpoint: Optional[str]
+    api_config: Optional[dict]
+    original_quota: float
+    current_quota: float
+    total_requests: int = 0
+    successful_requests: int = 0
+    failed_requests: int = 0
+    success_rate: float = 100.0
+    avg_response_time: Optional[float] = None
+    priority: int = 0
+    max_requests_per_minute: Optional[int] = None
+
+    @property
+    def board_key(self) -> BoardKey:
+        return (self.provider, self.model_family)
+
+    @classmethod
+    def from_model(cls, resource: PoolResource) -> "ResourceEntry":
+        return cls(
+            id=resource.id,
+            owner_id=resource.owner_id,
+            provider=resource.provider,
+            model_family=resource.model_family,
+            api_key_encrypted=resource.api_key_encrypted,
+            api_endpoint=resource.api_endpoint,
+            api_config=resource.api_config,
+            original_quota=resource.original_quota or 0.0,
+            current_quota=resource.current_quota or 0.0,
+            total_requests=resource.total_requests or 0,
+            successful_requests=resource.successful_requests or 0,
+            failed_requests=resource.failed_requests or 0,
+            success_rate=resource.success_rate if resource.success_rate is not None else 100.0,
+            avg_response_time=resource.avg_response_time,
+            priority=resource.priority or 0,
+            max_requests_per_minute=resource.max_requests_per_minute,
+        )
+
+
+class ResourceScoreboard:
+    """Sorted per (provider, model_family) boards of routable resources"""
+
+    def __init__(self, score_fn: Callable[[ResourceEntry], float], refresh_interval: float, pending=None):
+        self.score_fn = score_fn
+        self.refresh_interval = refresh_interval
+        # Write-behind stats buffer (sync_lock, apply_pending) re-applied on reload
+        self.pending = pending
+        self._entries: Dict[str, ResourceEntry] = {}
+        self._sort_keys: Dict[str, Tuple[float, str]] = {}
+        # board -> [(-score, resource_id)] ascending, i.e. best first
+        self._boards: Dict[BoardKey, List[Tuple[float, str]]] = {}
+        self._families: Dict[str, Set[Optional[str]]] = {}  # provider -> model families
+        self._lock = threading.RLock()
+        self._loaded = False
+        self._task: Optional[asyncio.Task] = None
+
+    # ---------- board maintenance (caller holds the lock) ----------
+
+    def _place(self, entry: ResourceEntry):
+        sort_key = (-self.score_fn(entry), entry.id)
+        self._sort_keys[entry.id] = sort_key
+        bisect.insort(self._boards.setdefault(entry.board_key, []), sort_key)
+        self._families.setdefault(entry.provider, set()).add(entry.model_family)
+
+    def _unplace(self, entry: ResourceEntry):
+        sort_key = self._sort_keys.pop(entry.id, None)
+        board = self._boards.get(entry.board_key)
+        if sort_key is None or board is None:
+            return
+        index = bisect.bisect_left(board, sort_key)
+        if index < len(board) and board[index] == sort_key:
+            del board[index]
+
+    # ---------- writes ----------
+
+    def upsert(self, entry: ResourceEntry):
+        """Add or replace a resource (and re-score it)"""
+        with self._lock:
+            old = self._entries.get(entry.id)
+            if old is not None:
+                self._unplace(old)
+            self._entries[entry.id] = entry
+            self._place(entry)
+
+    def remove(self, resource_id: str):
+        with self._lock:
+            entry = self._entries.pop(resource_id, None)
+            if entry is not None:
+                self._unplace(entry)
+
+    def update(self, resource_id: str, mutate: Callable[[ResourceEntry], None]) -> Optional[ResourceEntry]:
+        """Apply an in-place change to a resource and move it on its board"""
+        with self._lock:
+            entry = self._entries.get(resource_id)
+            if entry is None:
+                return None
+            self._unplace(entry)
+            mutate(entry)
+            if entry.current_quota <= 0:
+                del self._entries[resource_id]  # Depleted: no longer routable
+            else:
+                self._place(entry)
+            return entry
+
+    def rescore(self, resource_id: str):
+        """Re-sort a resource after state that feeds its score changed elsewhere"""
+        self.update(resource_id, lambda entry: None)
+
+    # ---------- reads ----------
+
+    def get(self, resource_id: str) -> Optional[ResourceEntry]:
+        return self._entries.get(resource_id)
+
+    def top(
+        self,
+        provider: str,
+        model_family: Optional[str],
+        limit: int,
+        accept: Callable[[ResourceEntry], bool] = lambda entry: True
+    ) -> List[Tuple[float, ResourceEntry]]:
+        """
+        Best `limit` (score, entry) pairs of one board that pass `accept`
+        Walks from the front, so the cost depends on how many entries are
+        skipped, not on the board size.
+        """
+        result = []
+        with self._lock:
+            for neg_score, resource_id in self._boards.get((provider, model_family), ()):
+                entry = self._entries[resource_id]
+                if accept(entry):
+                    result.append((-neg_score, entry))
+                    if len(result) >= limit:
+                        break
+        return result
+
+    def top_for_provider(
+        self,
+        provider: str,
+        limit: int,
+        accept: Callable[[ResourceEntry], bool] = lambda entry: True
+    ) -> List[Tuple[float, ResourceEntry]]:
+        """Best `limit` (score, entry) pairs across every model family of a provider"""
+        with self._lock:
+            merged = [
+                item
+                for family in self._families.get(provider, ())
+                for item in self.top(provider, family, limit, accept)
+            ]
+        merged.sort(key=lambda item: -item[0])
+        return merged[:limit]
+
+    # ---------- loading ----------
+
+    def load(self, db: Session) -> int:
+        """Rebuild every board from the database"""
+        guard = self.pending.sync_lock if self.pending is not None else contextlib.nullcontext()
+        with guard:
+            resources = db.query(PoolResource).filter(
+                PoolResource.status == PoolResourceStatus.ACTIVE,
+                PoolResource.current_quota > 0
+            ).all()
+            entries = [ResourceEntry.from_model(r) for r in resources]
+            if self.pending is not None:
+                for entry in entries:
+                    self.pending.apply_pending(entry)
+        entries = [entry for entry in entries if entry.current_quota > 0]
+
+        with self._lock:
+            self._entries = {}
+            self._sort_keys = {}
+            self._boards = {}
+            self._families = {}
+            for entry in entries:
+                self._entries[entry.id] = entry
+                self._place(entry)
+            self._loaded = True
+        return len(entries)
+
+    def ensure_loaded(self, db: Session):
+        if not self._loaded:
+            self.load(db)
+
+    def _load_with_new_session(self) -> int:
+        db = SessionLocal()
+        try:
+            return self.load(db)
+        finally:
+            db.close()
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.to_thread(self._load_with_new_session)
+            except Exception as e:
+                print(f"⚠️  Router scoreboard refresh failed: {e}")
+            await asyncio.sleep(self.refresh_interval)
+
+    def start(self):
+        """Load now and keep refreshing in the background (startup hook)"""
+        if self._task is None and self.refresh_interval > 0:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "resources": len(self._entries),
+                "boards": len(self._boards),
+                "loaded": self._loaded,
+            }
@@ -13,7 +13,8 @@ from . import (
     group_router,
     marketplace_router,
     resource_pool_router,
-    admin_pricing_router
+    admin_pricing_router,
+    realtime_router
 )
 
 __all__ = [
@@ -28,5 +29,6 @@ __all__ = [
     "group_router",
     "marketplace_router",
     "resource_pool_router",
-    "admin_pricing_router"
+    "admin_pricing_router",
+    "realtime_router"
 ]
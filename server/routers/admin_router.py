@@ -9,8 +9,9 @@ from typing import List, Optional
 from pydantic import BaseModel
 
 from database import get_db
-from models import User, UserLimit, UsageLog
+from models import User, UserLimit, UsageLog, UsageDailyRollup
 from middleware import require_admin
+from model_registry import model_registry
 
 router = APIRouter(prefix="/api/admin", tags=["admin"])
 
@@ -84,35 +85,38 @@ async def get_all_users(
     Get all users with their usage statistics and limits
     """
     users = db.query(User).all()
+    limits = {limit.user_id: limit for limit in db.query(UserLimit).all()}
+    
+    # Usage totals per user from the daily rollups (one grouped query each)
+    today = datetime.utcnow().date()
+    total_usage = {
+        row.user_id: row for row in db.query(
+            UsageDailyRollup.user_id,
+            func.sum(UsageDailyRollup.requests).label("requests"),
+            func.sum(UsageDailyRollup.total_tokens).label("tokens")
+        ).group_by(UsageDailyRollup.user_id).all()
+    }
+    today_usage = {
+        row.user_id: row for row in db.query(
+            UsageDailyRollup.user_id,
+            func.sum(UsageDailyRollup.requests).label("requests"),
+            func.sum(UsageDailyRollup.total_tokens).label("tokens")
+        ).filter(UsageDailyRollup.day == today).group_by(UsageDailyRollup.user_id).all()
+    }
     
     result = []
     for user in users:
-        # Get user limit
-        user_limit = db.query(UserLimit).filter(UserLimit.user_id == user.id).first()
-        
-        # Get total usage
-        total_usage = db.query(
-            func.count(UsageLog.id).label("total_requests"),
-            func.sum(UsageLog.total_tokens).label("total_tokens")
-        ).filter(UsageLog.user_id == user.id).first()
-        
-        # Get today's usage
-        today_start = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
-        today_usage = db.query(
-            func.count(UsageLog.id).label("requests_today"),
-            func.sum(UsageLog.total_tokens).label("tokens_today")
-        ).filter(
-            UsageLog.user_id == user.id,
-            UsageLog.timestamp >= today_start
-        ).first()
+        user_limit = limits.get(user.id)
+        total = total_usage.get(user.id)
+        today_row = today_usage.get(user.id)
         
         result.append(UserWithLimit(
             user=UserInfo.from_orm(user),
             limit=UserLimitInfo.from_orm(user_limit) if user_limit else None,
-            total_requests=total_usage.total_requests or 0,
-            total_tokens=total_usage.total_tokens or 0,
-            requests_today=today_usage.requests_today or 0,
-            tokens_today=today_usage.tokens_today or 0
+            total_requests=(total.requests or 0) if total else 0,
+            total_tokens=(total.tokens or 0) if total else 0,
+            requests_today=(today_row.requests or 0) if today_row else 0,
+            tokens_today=(today_row.tokens or 0) if today_row else 0
         ))
     
     return result
@@ -134,38 +138,40 @@ async def get_user_usage(
     
     since = datetime.utcnow() - timedelta(days=days)
     
-    logs = db.query(UsageLog).filter(
-        UsageLog.user_id == user_id,
-        UsageLog.timestamp >= since
-    ).order_by(UsageLog.timestamp.desc()).all()
+    # Stats by model and task type from the daily rollups
+    rows = db.query(
+        UsageDailyRollup.model_name,
+        UsageDailyRollup.task_type,
+        func.sum(UsageDailyRollup.requests).label("requests"),
+        func.sum(UsageDailyRollup.total_tokens).label("tokens")
+    ).filter(
+        UsageDailyRollup.user_id == user_id,
+        UsageDailyRollup.day >= since.date()
+    ).group_by(UsageDailyRollup.model_name, UsageDailyRollup.task_type).all()
     
-    # Calculate stats by model
     model_stats = {}
-    for log in logs:
-        if log.model_name not in model_stats:
-            model_stats[log.model_name] = {
-                "requests": 0,
-                "tokens": 0
-            }
-        model_stats[log.model_name]["requests"] += 1
-        model_stats[log.model_name]["tokens"] += log.total_tokens
-    
-    # Calculate stats by task type
     task_stats = {}
-    for log in logs:
-        if log.task_type not in task_stats:
-            task_stats[log.task_type] = {
-                "requests": 0,
-                "tokens": 0
-            }
-        task_stats[log.task_type]["requests"] += 1
-        task_stats[log.task_type]["tokens"] += log.total_tokens
+    for row in rows:
+        for stats, key in ((model_stats, row.model_name), (task_stats, row.task_type)):
+            if key not in stats:
+                stats[key] = {
+                    "requests": 0,
+                    "tokens": 0
+                }
+            stats[key]["requests"] += row.requests or 0
+            stats[key]["tokens"] += row.tokens or 0
+    
+    # Only the most recent raw logs are loaded
+    recent_logs = db.query(UsageLog).filter(
+        UsageLog.user_id == user_id,
+        UsageLog.timestamp >= since
+    ).order_by(UsageLog.timestamp.desc()).limit(50).all()
     
     return {
         "user_id": user_id,
         "username": user.username,
-        "total_requests": len(logs),
-        "total_tokens": sum(log.total_tokens for log in logs),
+        "total_requests": sum(stats["requests"] for stats in model_stats.values()),
+        "total_tokens": sum(stats["tokens"] for stats in model_stats.values()),
         "by_model": model_stats,
         "by_task": task_stats,
         "recent_logs": [
@@ -177,7 +183,7 @@ async def get_user_usage(
                 "total_tokens": log.total_tokens,
                 "response_time_ms": log.response_time_ms
             }
-            for log in logs[:50]  # Return last 50 logs
+            for log in recent_logs  # Return last 50 logs
         ]
     }
 
@@ -267,23 +273,24 @@ async def get_platform_stats(
     active_users = db.query(func.count(User.id)).filter(User.is_active == True).scalar()
     admin_users = db.query(func.count(User.id)).filter(User.is_admin == True).scalar()
     
-    # Usage stats
-    total_requests = db.query(func.count(UsageLog.id)).scalar()
-    total_tokens = db.query(func.sum(UsageLog.total_tokens)).scalar() or 0
+    # Usage stats (from the daily rollups)
+    total_requests, total_tokens = db.query(
+        func.coalesce(func.sum(UsageDailyRollup.requests), 0),
+        func.coalesce(func.sum(UsageDailyRollup.total_tokens), 0)
+    ).first()
     
     # Today's stats
-    today_start = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
     today_stats = db.query(
-        func.count(UsageLog.id).label("requests"),
-        func.sum(UsageLog.total_tokens).label("tokens")
-    ).filter(UsageLog.timestamp >= today_start).first()
+        func.sum(UsageDailyRollup.requests).label("requests"),
+        func.sum(UsageDailyRollup.total_tokens).label("tokens")
+    ).filter(UsageDailyRollup.day == datetime.utcnow().date()).first()
     
     # Top models
     top_models_query = db.query(
-        UsageLog.model_name,
-        func.count(UsageLog.id).label("requests"),
-        func.sum(UsageLog.total_tokens).label("tokens")
-    ).group_by(UsageLog.model_name).order_by(func.count(UsageLog.id).desc()).limit(10).all()
+        UsageDailyRollup.model_name,
+        func.sum(UsageDailyRollup.requests).label("requests"),
+        func.sum(UsageDailyRollup.total_tokens).label("tokens")
+    ).group_by(UsageDailyRollup.model_name).order_by(func.sum(UsageDailyRollup.requests).desc()).limit(10).all()
     
     top_models = [
         {
@@ -331,3 +338,20 @@ async def delete_user(
     }
 
 
+@router.post("/models/reload")
+async def reload_model_catalog(
+    admin: User = Depends(require_admin)
+):
+    """
+    Reload the model catalog file without restarting the server
+    """
+    loaded = model_registry.reload()
+    if not loaded:
+        raise HTTPException(status_code=500, detail="Model catalog reload failed, current catalog kept")
+    
+    return {
+        "message": "Model catalog reloaded successfully",
+        "enabled_models": len(model_registry.all()),
+        "total_models": len(model_registry.all(include_disabled=True)),
+        "etag": model_registry.etag
+    }
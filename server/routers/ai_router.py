@@ -1,21 +1,28 @@
 """
 AI/Chat routes - Cloudflare API proxy with Credit billing
 """
-from fastapi import APIRouter, Depends, HTTPException
-from fastapi.responses import StreamingResponse
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.responses import StreamingResponse, Response
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List
 import json
-from database import get_db
-from models import User, UsageLog
+import time
+import anyio
+from database import get_async_db
+from models import User
 from schemas import ChatRequest, ChatResponse, ModelInfo
-from auth import get_current_user_from_api_key
+from auth import get_current_user_from_api_key_async
 from cloudflare_client_simple import (
-    call_cloudflare_ai, get_available_models,
-    get_model_by_id
+    call_cloudflare_ai, stream_cloudflare_ai,
+    get_model_by_id, estimate_messages_tokens
 )
-from check_limits import check_user_limits
+from model_registry import model_registry
+from check_limits import check_user_limits_async
 from credit_service import CreditService
+from completion_cache import completion_cache
+from config import settings
+from usage_log_queue import usage_log_queue
+from quota_counters import quota_counters
 
 router = APIRouter(prefix="/ai", tags=["AI"])
 
@@ -43,19 +50,24 @@ def trim_messages(messages: list, max_messages: int = MAX_CONTEXT_MESSAGES) -> l
 
 
 @router.get("/models", response_model=List[ModelInfo])
-def list_models():
+def list_models(request: Request):
     """
     Get list of available Cloudflare AI models
     Returns only verified working models
+    Served from the registry's prebuilt payload; supports If-None-Match
     """
-    return get_available_models()
+    etag = model_registry.etag
+    headers = {"ETag": etag, "Cache-Control": "public, max-age=60"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    return Response(content=model_registry.models_payload, media_type="application/json", headers=headers)
 
 
 @router.post("/chat", response_model=ChatResponse)
 async def chat(
     request: ChatRequest,
-    current_user: User = Depends(get_current_user_from_api_key),
-    db: Session = Depends(get_db)
+    current_user: User = Depends(get_current_user_from_api_key_async),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Send a chat request to Cloudflare AI and track usage
@@ -74,7 +86,7 @@ async def chat(
     
     try:
         # Check user limits BEFORE making API call
-        check_user_limits(current_user, db, estimated_tokens=request.max_tokens or 512)
+        await check_user_limits_async(current_user, db, estimated_tokens=request.max_tokens or 512)
         
         # Get model info
         model_info = get_model_by_id(request.model)
@@ -86,20 +98,33 @@ async def chat(
         
         task_type = model_info["task"]
         
-        # Call Cloudflare AI
-        result = await call_cloudflare_ai(
-            messages=messages,
-            model=request.model,
-            temperature=request.temperature,
-            max_tokens=request.max_tokens,
-            stream=False
-        )
+        # Serve deterministic requests from the completion cache when possible
+        cache_key = None
+        cached = None
+        if request.cache and completion_cache.is_cacheable(request.temperature, task_type, messages):
+            cache_key = completion_cache.make_key(request.model, messages, request.temperature, request.max_tokens)
+            cache_start = time.time()
+            cached = await completion_cache.get(cache_key)
+        
+        if cached:
+            result = {**cached, "response_time_ms": (time.time() - cache_start) * 1000}
+        else:
+            # Call Cloudflare AI
+            result = await call_cloudflare_ai(
+                messages=messages,
+                model=request.model,
+                temperature=request.temperature,
+                max_tokens=request.max_tokens,
+                stream=False
+            )
+            if cache_key:
+                await completion_cache.set(cache_key, result)
         
         # Check if request contains image
         has_image = any("image" in msg for msg in messages)
         
-        # Log usage
-        usage_log = UsageLog(
+        # Log usage (written in the background by the usage log queue)
+        usage_log_id = usage_log_queue.enqueue(
             user_id=current_user.id,
             model_name=request.model,
             task_type=task_type,
@@ -109,23 +134,23 @@ async def chat(
             response_time_ms=result["response_time_ms"],
             has_image=has_image,
             has_audio=False,
+            cache_hit=bool(cached),
             request_data=json.dumps({"messages": [{"role": m["role"], "content": m["content"], "has_image": "image" in m} for m in messages], "model": request.model})
         )
-        db.add(usage_log)
-        db.commit()
-        db.refresh(usage_log)
+        await quota_counters.record_async(current_user.id, result["total_tokens"])
         
         # Charge credits
         try:
-            credit_transaction = CreditService.calculate_and_charge(
+            await db.run_sync(lambda session: CreditService.calculate_and_charge(
                 user_id=current_user.id,
                 model_id=request.model,
                 input_tokens=result["input_tokens"],
                 output_tokens=result["output_tokens"],
                 has_image=has_image,
-                usage_log_id=usage_log.id,
-                db=db
-            )
+                usage_log_id=usage_log_id,
+                db=session,
+                discount=settings.completion_cache_discount if cached else 0.0
+            ))
         except HTTPException as e:
             # If credit charge fails, return the error
             # Usage is still logged but not charged
@@ -137,7 +162,8 @@ async def chat(
             response=result["response"],
             input_tokens=result["input_tokens"],
             output_tokens=result["output_tokens"],
-            total_tokens=result["total_tokens"]
+            total_tokens=result["total_tokens"],
+            cached=bool(cached)
         )
         
     except ValueError as e:
@@ -149,15 +175,15 @@ async def chat(
 @router.post("/chat/stream")
 async def chat_stream(
     request: ChatRequest,
-    current_user: User = Depends(get_current_user_from_api_key),
-    db: Session = Depends(get_db)
+    current_user: User = Depends(get_current_user_from_api_key_async),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Stream chat responses from Cloudflare AI
     Requires X-API-Key header
     """
     # Check user limits BEFORE making API call
-    check_user_limits(current_user, db, estimated_tokens=request.max_tokens or 512)
+    await check_user_limits_async(current_user, db, estimated_tokens=request.max_tokens or 512)
     
     messages = [{"role": msg.role, "content": msg.content} for msg in request.messages]
     
@@ -176,69 +202,72 @@ async def chat_stream(
         full_response_content = ""
         input_tokens_count = 0
         output_tokens_count = 0
-        total_tokens_count = 0
         response_time_ms = 0.0
         task_type = model_info["task"]
+        start_time = time.time()
 
         try:
-            # Get full response
-            result = await call_cloudflare_ai(
+            # Forward upstream deltas as they arrive
+            async for event in stream_cloudflare_ai(
                 messages=messages,
                 model=request.model,
                 temperature=request.temperature,
                 max_tokens=request.max_tokens,
-            )
-            
-            full_response_content = result["response"]
-            input_tokens_count = result["input_tokens"]
-            output_tokens_count = result["output_tokens"]
-            total_tokens_count = result["total_tokens"]
-            response_time_ms = result["response_time_ms"]
-            
-            # Stream the response in chunks
-            chunk_size = 20
-            for i in range(0, len(full_response_content), chunk_size):
-                chunk = full_response_content[i:i + chunk_size]
-                yield f"data: {json.dumps({'token': chunk})}\n\n"
-            
-            # Send completion event with token stats
-            yield f"data: {json.dumps({'done': True, 'tokens': result})}\n\n"
+            ):
+                if event.get("done"):
+                    full_response_content = event["response"]
+                    input_tokens_count = event["input_tokens"]
+                    output_tokens_count = event["output_tokens"]
+                    response_time_ms = event["response_time_ms"]
+                    
+                    # Send completion event with token stats
+                    yield f"data: {json.dumps({'done': True, 'tokens': event})}\n\n"
+                else:
+                    full_response_content += event["token"]
+                    output_tokens_count = event["output_tokens"]  # Running total, billed if the client disconnects
+                    yield f"data: {json.dumps({'token': event['token']})}\n\n"
             
         except Exception as e:
             yield f"data: {json.dumps({'error': str(e)})}\n\n"
         finally:
-            # Log usage and charge credits
-            if full_response_content:
-                usage_log = UsageLog(
-                    user_id=current_user.id,
-                    model_name=request.model,
-                    task_type=task_type,
-                    input_tokens=input_tokens_count,
-                    output_tokens=output_tokens_count,
-                    total_tokens=total_tokens_count,
-                    response_time_ms=response_time_ms,
-                    request_data=json.dumps({"messages": messages, "model": request.model}),
-                    has_image=False,
-                    has_audio=False,
-                )
-                db.add(usage_log)
-                db.commit()
-                db.refresh(usage_log)
+            # Log usage and charge credits (also for streams cut short by the client).
+            # A client disconnect cancels the response task group; the shield keeps that
+            # cancellation from aborting the awaits below.
+            with anyio.CancelScope(shield=True):
+                if full_response_content:
+                    if not input_tokens_count:
+                        input_tokens_count = await estimate_messages_tokens(messages)
+                    if not response_time_ms:
+                        response_time_ms = (time.time() - start_time) * 1000
                 
-                # Charge credits
-                try:
-                    CreditService.calculate_and_charge(
+                    usage_log_id = usage_log_queue.enqueue(
                         user_id=current_user.id,
-                        model_id=request.model,
+                        model_name=request.model,
+                        task_type=task_type,
                         input_tokens=input_tokens_count,
                         output_tokens=output_tokens_count,
+                        total_tokens=input_tokens_count + output_tokens_count,
+                        response_time_ms=response_time_ms,
+                        request_data=json.dumps({"messages": messages, "model": request.model}),
                         has_image=False,
-                        usage_log_id=usage_log.id,
-                        db=db
+                        has_audio=False,
                     )
-                except Exception as credit_error:
-                    # Log credit charge failure but don't interrupt the stream
-                    print(f"⚠️ Credit charge failed: {credit_error}")
+                    await quota_counters.record_async(current_user.id, input_tokens_count + output_tokens_count)
+                
+                    # Charge credits
+                    try:
+                        await db.run_sync(lambda session: CreditService.calculate_and_charge(
+                            user_id=current_user.id,
+                            model_id=request.model,
+                            input_tokens=input_tokens_count,
+                            output_tokens=output_tokens_count,
+                            has_image=False,
+                            usage_log_id=usage_log_id,
+                            db=session
+                        ))
+                    except Exception as credit_error:
+                        # Log credit charge failure but don't interrupt the stream
+                        print(f"⚠️ Credit charge failed: {credit_error}")
     
     return StreamingResponse(
         event_generator(),
@@ -246,5 +275,6 @@ async def chat_stream(
         headers={
             "Cache-Control": "no-cache",
             "Connection": "keep-alive",
+            "X-Accel-Buffering": "no",  # Disable proxy buffering so deltas flush immediately
         }
     )
@@ -1,10 +1,11 @@
 """
 Credit management routes
 """
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
 from sqlalchemy.orm import Session
-from sqlalchemy import func
-from typing import List
+from sqlalchemy import func, select
+from typing import List, Optional
+from datetime import datetime
 from database import get_db
 from models import User
 from models_credit import UserCredit, CreditTransaction, ModelPricing
@@ -14,6 +15,8 @@ from schemas_credit import (
 )
 from auth import get_current_user_from_token, get_current_user_from_api_key
 from credit_service import CreditService
+from export_service import stream_export, apply_date_range
+from pagination import set_next_cursor
 
 router = APIRouter(prefix="/credits", tags=["Credits"])
 
@@ -100,21 +103,52 @@ def deposit_credits(
 
 @router.get("/transactions", response_model=List[CreditTransactionResponse])
 def get_my_transactions(
+    response: Response,
     limit: int = 100,
     offset: int = 0,
+    cursor: Optional[str] = None,
     current_user: User = Depends(get_current_user_from_token),
     db: Session = Depends(get_db)
 ):
-    """Get current user's credit transaction history"""
-    transactions = CreditService.get_transactions(current_user.id, db, limit, offset)
+    """Get current user's credit transaction history (next page cursor in X-Next-Cursor)"""
+    transactions = CreditService.get_transactions(current_user.id, db, limit, offset, cursor)
+    set_next_cursor(response, transactions, limit, "created_at")
     return transactions
 
 
+@router.get("/transactions/export")
+def export_transactions(
+    format: str = Query(default="ndjson", pattern="^(ndjson|csv)$"),
+    start: Optional[datetime] = Query(default=None, description="Include transactions at or after this time (UTC)"),
+    end: Optional[datetime] = Query(default=None, description="Include transactions before this time (UTC)"),
+    user_id: Optional[str] = Query(default=None, description="Admin only: export another user's transactions"),
+    all_users: bool = Query(default=False, description="Admin only: export transactions of every user"),
+    current_user: User = Depends(get_current_user_from_token)
+):
+    """Stream credit transaction history as NDJSON or CSV"""
+    if (user_id or all_users) and not current_user.is_admin:
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    columns = [
+        "id", "user_id", "type", "amount", "balance_before", "balance_after",
+        "description", "reference_id", "created_at"
+    ]
+    statement = select(*[CreditTransaction.__table__.c[name] for name in columns])
+    if not all_users:
+        statement = statement.where(CreditTransaction.user_id == (user_id or current_user.id))
+    statement = apply_date_range(statement, CreditTransaction.created_at, start, end)
+    statement = statement.order_by(CreditTransaction.created_at, CreditTransaction.id)
+    
+    return stream_export(statement, columns, format, filename="credit_transactions")
+
+
 @router.get("/transactions/{user_id}", response_model=List[CreditTransactionResponse])
 def get_user_transactions(
     user_id: str,
+    response: Response,
     limit: int = 100,
     offset: int = 0,
+    cursor: Optional[str] = None,
     current_user: User = Depends(get_current_user_from_token),
     db: Session = Depends(get_db)
 ):
@@ -122,7 +156,8 @@ def get_user_transactions(
     if not current_user.is_admin:
         raise HTTPException(status_code=403, detail="Admin access required")
     
-    transactions = CreditService.get_transactions(user_id, db, limit, offset)
+    transactions = CreditService.get_transactions(user_id, db, limit, offset, cursor)
+    set_next_cursor(response, transactions, limit, "created_at")
     return transactions
 
 
@@ -1,20 +1,26 @@
 """
 Forum API routes for posts, comments, and likes
 """
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from sqlalchemy import desc
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
+from sqlalchemy import select, desc, func
 from typing import List, Optional
 from datetime import datetime
 from pydantic import BaseModel
 
-from database import get_db
+from database import get_async_db
 from models import User
 from models_forum import Post, Comment, PostLike
-from auth import get_current_user_from_token
+from auth import get_current_user_from_token_async
+from pagination import after_cursor, set_next_cursor
+from realtime import event_hub
 
 router = APIRouter(prefix="/api/forum", tags=["forum"])
 
+# Latest comments embedded per post in the feed (full list: GET /posts/{id}/comments)
+COMMENT_PREVIEW_SIZE = 3
+
 
 # ==================== Schemas ====================
 
@@ -67,74 +73,177 @@ class PostResponse(BaseModel):
         from_attributes = True
 
 
+# ==================== Helpers ====================
+
+def build_post_response(post: Post, author: User, is_liked: bool, comments: List[Comment]) -> PostResponse:
+    """
+    Build a PostResponse without touching lazy relationships
+    (lazy loads are not allowed on an AsyncSession)
+    """
+    return PostResponse(
+        id=post.id,
+        user_id=post.user_id,
+        title=post.title,
+        content=post.content,
+        image_url=post.image_url,
+        likes_count=post.likes_count or 0,
+        comments_count=post.comments_count or 0,
+        created_at=post.created_at,
+        updated_at=post.updated_at,
+        author=UserInfo.from_orm(author),
+        is_liked=is_liked,
+        comments=[CommentResponse.from_orm(c) for c in comments]
+    )
+
+
+async def get_post_comments(db: AsyncSession, post_id: str) -> List[Comment]:
+    """Get all comments on a post with their authors (oldest first)"""
+    result = await db.execute(
+        select(Comment).options(selectinload(Comment.author))
+        .where(Comment.post_id == post_id)
+        .order_by(Comment.created_at)
+    )
+    return result.scalars().all()
+
+
+async def get_comment_previews(db: AsyncSession, post_ids: List[str], size: int) -> dict:
+    """
+    Latest `size` comments of each post in one query (ROW_NUMBER per post)
+    Returns {post_id: [comments oldest first]}
+    """
+    previews = {post_id: [] for post_id in post_ids}
+    if not post_ids or size <= 0:
+        return previews
+    
+    ranked = select(
+        Comment.id,
+        func.row_number().over(
+            partition_by=Comment.post_id,
+            order_by=(Comment.created_at.desc(), Comment.id.desc())
+        ).label("rank")
+    ).where(Comment.post_id.in_(post_ids)).subquery()
+    
+    comments = (await db.execute(
+        select(Comment).options(selectinload(Comment.author))
+        .join(ranked, ranked.c.id == Comment.id)
+        .where(ranked.c.rank <= size)
+        .order_by(Comment.post_id, Comment.created_at, Comment.id)
+    )).scalars().all()
+    
+    for comment in comments:
+        previews[comment.post_id].append(comment)
+    return previews
+
+
+async def get_liked_post_ids(db: AsyncSession, post_ids: List[str], user_id: str) -> set:
+    """Which of these posts the user liked, in one IN query"""
+    if not post_ids:
+        return set()
+    result = await db.execute(
+        select(PostLike.post_id).where(
+            PostLike.user_id == user_id,
+            PostLike.post_id.in_(post_ids)
+        )
+    )
+    return set(result.scalars().all())
+
+
+async def is_post_liked(db: AsyncSession, post_id: str, user_id: str) -> bool:
+    """Check if a user liked a post"""
+    result = await db.execute(
+        select(PostLike.id).where(
+            PostLike.post_id == post_id,
+            PostLike.user_id == user_id
+        ).limit(1)
+    )
+    return result.first() is not None
+
+
 # ==================== Routes ====================
 
 @router.get("/posts", response_model=List[PostResponse])
 async def get_all_posts(
+    response: Response,
     skip: int = 0,
     limit: int = 50,
-    current_user: User = Depends(get_current_user_from_token),
-    db: Session = Depends(get_db)
+    cursor: Optional[str] = None,
+    comments_preview: int = Query(COMMENT_PREVIEW_SIZE, ge=0, le=20),
+    current_user: User = Depends(get_current_user_from_token_async),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Get all forum posts (newest first)
+    Each post carries only its latest `comments_preview` comments; comments_count has the total.
+    Pass the X-Next-Cursor response header back as `cursor` for the next page.
     """
-    posts = db.query(Post).order_by(desc(Post.created_at)).offset(skip).limit(limit).all()
+    query = select(Post).options(selectinload(Post.author))
+    if cursor:
+        query = query.where(after_cursor(Post.created_at, Post.id, cursor))
+    else:
+        query = query.offset(skip)
     
-    result = []
-    for post in posts:
-        # Check if current user liked this post
-        is_liked = db.query(PostLike).filter(
-            PostLike.post_id == post.id,
-            PostLike.user_id == current_user.id
-        ).first() is not None
-        
-        # Get comments
-        comments = db.query(Comment).filter(Comment.post_id == post.id).order_by(Comment.created_at).all()
-        
-        post_dict = PostResponse.from_orm(post).dict()
-        post_dict['is_liked'] = is_liked
-        post_dict['comments'] = [CommentResponse.from_orm(c) for c in comments]
-        
-        result.append(PostResponse(**post_dict))
+    posts = (await db.execute(
+        query.order_by(desc(Post.created_at), desc(Post.id)).limit(limit)
+    )).scalars().all()
+    set_next_cursor(response, posts, limit, "created_at")
+    
+    # Likes and comment previews for the whole page at once
+    post_ids = [post.id for post in posts]
+    liked_ids = await get_liked_post_ids(db, post_ids, current_user.id)
+    previews = await get_comment_previews(db, post_ids, comments_preview)
     
-    return result
+    return [
+        build_post_response(post, post.author, post.id in liked_ids, previews[post.id])
+        for post in posts
+    ]
 
 
 @router.get("/posts/{post_id}", response_model=PostResponse)
 async def get_post(
     post_id: str,
-    current_user: User = Depends(get_current_user_from_token),
-    db: Session = Depends(get_db)
+    current_user: User = Depends(get_current_user_from_token_async),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Get a specific post by ID
     """
-    post = db.query(Post).filter(Post.id == post_id).first()
+    post = (await db.execute(
+        select(Post).options(selectinload(Post.author)).where(Post.id == post_id)
+    )).scalars().first()
     if not post:
         raise HTTPException(status_code=404, detail="Post not found")
     
     # Check if current user liked this post
-    is_liked = db.query(PostLike).filter(
-        PostLike.post_id == post.id,
-        PostLike.user_id == current_user.id
-    ).first() is not None
+    is_liked = await is_post_liked(db, post.id, current_user.id)
     
     # Get comments
-    comments = db.query(Comment).filter(Comment.post_id == post.id).order_by(Comment.created_at).all()
+    comments = await get_post_comments(db, post.id)
     
-    post_dict = PostResponse.from_orm(post).dict()
-    post_dict['is_liked'] = is_liked
-    post_dict['comments'] = [CommentResponse.from_orm(c) for c in comments]
+    return build_post_response(post, post.author, is_liked, comments)
+
+
+@router.get("/posts/{post_id}/comments", response_model=List[CommentResponse])
+async def get_comments(
+    post_id: str,
+    current_user: User = Depends(get_current_user_from_token_async),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Get all comments on a post (oldest first)
+    """
+    post = await db.get(Post, post_id)
+    if not post:
+        raise HTTPException(status_code=404, detail="Post not found")
     
-    return PostResponse(**post_dict)
+    comments = await get_post_comments(db, post_id)
+    return [CommentResponse.from_orm(c) for c in comments]
 
 
 @router.post("/posts", response_model=PostResponse)
 async def create_post(
     request: CreatePostRequest,
-    current_user: User = Depends(get_current_user_from_token),
-    db: Session = Depends(get_db)
+    current_user: User = Depends(get_current_user_from_token_async),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Create a new forum post
@@ -147,28 +256,32 @@ async def create_post(
     )
     
     db.add(post)
-    db.commit()
-    db.refresh(post)
+    await db.commit()
+    await db.refresh(post)
     
-    post_dict = PostResponse.from_orm(post).dict()
-    post_dict['is_liked'] = False
-    post_dict['comments'] = []
+    # Announce to everyone; clients refetch the feed (keeps images out of the push)
+    await event_hub.publish("post", {
+        "id": post.id,
+        "title": post.title,
+        "author": current_user.username,
+        "created_at": post.created_at
+    })
     
-    return PostResponse(**post_dict)
+    return build_post_response(post, current_user, False, [])
 
 
 @router.post("/posts/{post_id}/comments", response_model=CommentResponse)
 async def create_comment(
     post_id: str,
     request: CreateCommentRequest,
-    current_user: User = Depends(get_current_user_from_token),
-    db: Session = Depends(get_db)
+    current_user: User = Depends(get_current_user_from_token_async),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Add a comment to a post
     """
     # Verify post exists
-    post = db.query(Post).filter(Post.id == post_id).first()
+    post = await db.get(Post, post_id)
     if not post:
         raise HTTPException(status_code=404, detail="Post not found")
     
@@ -182,37 +295,48 @@ async def create_comment(
     db.add(comment)
     
     # Update post comment count
-    post.comments_count = db.query(Comment).filter(Comment.post_id == post_id).count() + 1
+    post.comments_count = (await db.execute(
+        select(func.count(Comment.id)).where(Comment.post_id == post_id)
+    )).scalar() + 1
     
-    db.commit()
-    db.refresh(comment)
+    await db.commit()
+    await db.refresh(comment)
     
-    return CommentResponse.from_orm(comment)
+    return CommentResponse(
+        id=comment.id,
+        post_id=comment.post_id,
+        user_id=comment.user_id,
+        content=comment.content,
+        created_at=comment.created_at,
+        author=UserInfo.from_orm(current_user)
+    )
 
 
 @router.post("/posts/{post_id}/like")
 async def toggle_like(
     post_id: str,
-    current_user: User = Depends(get_current_user_from_token),
-    db: Session = Depends(get_db)
+    current_user: User = Depends(get_current_user_from_token_async),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Toggle like on a post
     """
     # Verify post exists
-    post = db.query(Post).filter(Post.id == post_id).first()
+    post = await db.get(Post, post_id)
     if not post:
         raise HTTPException(status_code=404, detail="Post not found")
     
     # Check if already liked
-    existing_like = db.query(PostLike).filter(
-        PostLike.post_id == post_id,
-        PostLike.user_id == current_user.id
-    ).first()
+    existing_like = (await db.execute(
+        select(PostLike).where(
+            PostLike.post_id == post_id,
+            PostLike.user_id == current_user.id
+        )
+    )).scalars().first()
     
     if existing_like:
         # Unlike
-        db.delete(existing_like)
+        await db.delete(existing_like)
         post.likes_count = max(0, post.likes_count - 1)
         is_liked = False
     else:
@@ -225,7 +349,7 @@ async def toggle_like(
         post.likes_count += 1
         is_liked = True
     
-    db.commit()
+    await db.commit()
     
     return {
         "is_liked": is_liked,
@@ -236,13 +360,13 @@ async def toggle_like(
 @router.delete("/posts/{post_id}")
 async def delete_post(
     post_id: str,
-    current_user: User = Depends(get_current_user_from_token),
-    db: Session = Depends(get_db)
+    current_user: User = Depends(get_current_user_from_token_async),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Delete a post (only author or admin can delete)
     """
-    post = db.query(Post).filter(Post.id == post_id).first()
+    post = await db.get(Post, post_id)
     if not post:
         raise HTTPException(status_code=404, detail="Post not found")
     
@@ -250,8 +374,8 @@ async def delete_post(
     if post.user_id != current_user.id and not current_user.is_admin:
         raise HTTPException(status_code=403, detail="Not authorized to delete this post")
     
-    db.delete(post)
-    db.commit()
+    await db.delete(post)
+    await db.commit()
     
     return {"message": "Post deleted successfully"}
 
@@ -259,13 +383,13 @@ async def delete_post(
 @router.delete("/comments/{comment_id}")
 async def delete_comment(
     comment_id: str,
-    current_user: User = Depends(get_current_user_from_token),
-    db: Session = Depends(get_db)
+    current_user: User = Depends(get_current_user_from_token_async),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Delete a comment (only author or admin can delete)
     """
-    comment = db.query(Comment).filter(Comment.id == comment_id).first()
+    comment = await db.get(Comment, comment_id)
     if not comment:
         raise HTTPException(status_code=404, detail="Comment not found")
     
@@ -274,12 +398,12 @@ async def delete_comment(
         raise HTTPException(status_code=403, detail="Not authorized to delete this comment")
     
     # Update post comment count
-    post = db.query(Post).filter(Post.id == comment.post_id).first()
+    post = await db.get(Post, comment.post_id)
     if post:
         post.comments_count = max(0, post.comments_count - 1)
     
-    db.delete(comment)
-    db.commit()
+    await db.delete(comment)
+    await db.commit()
     
     return {"message": "Comment deleted successfully"}
 
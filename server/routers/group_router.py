@@ -1,17 +1,19 @@
 """
 Group Chat API routes
 """
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from sqlalchemy import or_, and_
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload, joinedload, aliased
+from sqlalchemy import select, func
 from typing import List, Optional
 from datetime import datetime
 from pydantic import BaseModel
 
-from database import get_db
+from database import get_async_db
 from models import User
 from models_group import ChatGroup, GroupMember, GroupMessage
-from auth import get_current_user_from_token
+from auth import get_current_user_from_token_async
+from realtime import event_hub
 
 router = APIRouter(prefix="/api/groups", tags=["groups"])
 
@@ -82,73 +84,132 @@ class AddMemberRequest(BaseModel):
     user_id: str
 
 
+# ==================== Helpers ====================
+
+def member_count_column():
+    """Member count of each selected group, computed in SQL"""
+    return (
+        select(func.count(GroupMember.id))
+        .where(GroupMember.group_id == ChatGroup.id)
+        .correlate(ChatGroup)
+        .scalar_subquery()
+        .label("member_count")
+    )
+
+
+def select_groups(include_members: bool = True):
+    """
+    Select (group, member_count) rows with the creator joined in
+    With include_members, members and their users come in one extra query
+    for all selected groups.
+    """
+    query = select(ChatGroup, member_count_column()).options(joinedload(ChatGroup.creator))
+    if include_members:
+        query = query.options(
+            selectinload(ChatGroup.members).joinedload(GroupMember.user)
+        )
+    return query
+
+
+def build_member_response(member: GroupMember) -> GroupMemberResponse:
+    return GroupMemberResponse(
+        id=member.id,
+        group_id=member.group_id,
+        user_id=member.user_id,
+        is_admin=member.is_admin,
+        joined_at=member.joined_at,
+        user=UserInfo.from_orm(member.user)
+    )
+
+
+def build_group_response(group: ChatGroup, member_count: int, include_members: bool = True) -> GroupResponse:
+    return GroupResponse(
+        id=group.id,
+        name=group.name,
+        description=group.description,
+        avatar_url=group.avatar_url,
+        creator_id=group.creator_id,
+        created_at=group.created_at,
+        updated_at=group.updated_at,
+        creator=UserInfo.from_orm(group.creator),
+        members=[build_member_response(m) for m in group.members] if include_members else [],
+        member_count=member_count or 0
+    )
+
+
+async def load_group(db: AsyncSession, group_id: str, include_members: bool = True) -> Optional[GroupResponse]:
+    row = (await db.execute(
+        select_groups(include_members).where(ChatGroup.id == group_id)
+        .execution_options(populate_existing=True)
+    )).first()
+    if row is None:
+        return None
+    group, member_count = row
+    return build_group_response(group, member_count, include_members)
+
+
+async def get_membership(db: AsyncSession, group_id: str, user_id: str, admin_only: bool = False) -> Optional[GroupMember]:
+    """Get a user's membership in a group (optionally only if admin)"""
+    query = select(GroupMember).where(
+        GroupMember.group_id == group_id,
+        GroupMember.user_id == user_id
+    )
+    if admin_only:
+        query = query.where(GroupMember.is_admin == True)
+    return (await db.execute(query)).scalars().first()
+
+
 # ==================== Routes ====================
 
 @router.get("/", response_model=List[GroupResponse])
 async def get_my_groups(
-    current_user: User = Depends(get_current_user_from_token),
-    db: Session = Depends(get_db)
+    include_members: bool = True,
+    current_user: User = Depends(get_current_user_from_token_async),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Get all groups that the current user is a member of
+    Pass include_members=false to skip member lists (member_count is always set).
     """
-    # Get all group memberships for current user
-    memberships = db.query(GroupMember).filter(GroupMember.user_id == current_user.id).all()
-    group_ids = [m.group_id for m in memberships]
+    mine = aliased(GroupMember)
+    rows = (await db.execute(
+        select_groups(include_members)
+        .join(mine, (mine.group_id == ChatGroup.id) & (mine.user_id == current_user.id))
+        .order_by(ChatGroup.created_at)
+    )).all()
     
-    if not group_ids:
-        return []
-    
-    # Get groups
-    groups = db.query(ChatGroup).filter(ChatGroup.id.in_(group_ids)).all()
-    
-    result = []
-    for group in groups:
-        members = db.query(GroupMember).filter(GroupMember.group_id == group.id).all()
-        group_dict = GroupResponse.from_orm(group).dict()
-        group_dict['members'] = [GroupMemberResponse.from_orm(m) for m in members]
-        group_dict['member_count'] = len(members)
-        result.append(GroupResponse(**group_dict))
-    
-    return result
+    return [build_group_response(group, member_count, include_members) for group, member_count in rows]
 
 
 @router.get("/{group_id}", response_model=GroupResponse)
 async def get_group(
     group_id: str,
-    current_user: User = Depends(get_current_user_from_token),
-    db: Session = Depends(get_db)
+    include_members: bool = True,
+    current_user: User = Depends(get_current_user_from_token_async),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Get group details
+    For large groups pass include_members=false and page through GET /{group_id}/members.
     """
     # Check if user is a member
-    membership = db.query(GroupMember).filter(
-        GroupMember.group_id == group_id,
-        GroupMember.user_id == current_user.id
-    ).first()
+    membership = await get_membership(db, group_id, current_user.id)
     
     if not membership:
         raise HTTPException(status_code=403, detail="Not a member of this group")
     
-    group = db.query(ChatGroup).filter(ChatGroup.id == group_id).first()
+    group = await load_group(db, group_id, include_members)
     if not group:
         raise HTTPException(status_code=404, detail="Group not found")
     
-    members = db.query(GroupMember).filter(GroupMember.group_id == group_id).all()
-    
-    group_dict = GroupResponse.from_orm(group).dict()
-    group_dict['members'] = [GroupMemberResponse.from_orm(m) for m in members]
-    group_dict['member_count'] = len(members)
-    
-    return GroupResponse(**group_dict)
+    return group
 
 
 @router.post("/", response_model=GroupResponse)
 async def create_group(
     request: CreateGroupRequest,
-    current_user: User = Depends(get_current_user_from_token),
-    db: Session = Depends(get_db)
+    current_user: User = Depends(get_current_user_from_token_async),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Create a new group
@@ -162,7 +223,7 @@ async def create_group(
     )
     
     db.add(group)
-    db.flush()  # Get group ID
+    await db.flush()  # Get group ID
     
     # Add creator as admin member
     creator_member = GroupMember(
@@ -172,12 +233,14 @@ async def create_group(
     )
     db.add(creator_member)
     
-    # Add initial members
-    for member_id in request.member_ids:
-        if member_id != current_user.id:  # Don't add creator again
-            # Verify user exists
-            user = db.query(User).filter(User.id == member_id).first()
-            if user:
+    # Add initial members (only users that exist)
+    member_ids = [member_id for member_id in request.member_ids if member_id != current_user.id]
+    if member_ids:
+        existing_ids = set((await db.execute(
+            select(User.id).where(User.id.in_(member_ids))
+        )).scalars().all())
+        for member_id in dict.fromkeys(member_ids):
+            if member_id in existing_ids:
                 member = GroupMember(
                     group_id=group.id,
                     user_id=member_id,
@@ -185,49 +248,61 @@ async def create_group(
                 )
                 db.add(member)
     
-    db.commit()
-    db.refresh(group)
+    await db.commit()
     
-    # Get all members for response
-    members = db.query(GroupMember).filter(GroupMember.group_id == group.id).all()
+    # Reload with members for response
+    return await load_group(db, group.id)
+
+
+@router.get("/{group_id}/members", response_model=List[GroupMemberResponse])
+async def get_members(
+    group_id: str,
+    skip: int = 0,
+    limit: int = Query(100, ge=1, le=500),
+    current_user: User = Depends(get_current_user_from_token_async),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Get a page of group members (in join order)
+    """
+    membership = await get_membership(db, group_id, current_user.id)
     
-    group_dict = GroupResponse.from_orm(group).dict()
-    group_dict['members'] = [GroupMemberResponse.from_orm(m) for m in members]
-    group_dict['member_count'] = len(members)
+    if not membership:
+        raise HTTPException(status_code=403, detail="Not a member of this group")
+    
+    members = (await db.execute(
+        select(GroupMember).options(joinedload(GroupMember.user))
+        .where(GroupMember.group_id == group_id)
+        .order_by(GroupMember.joined_at, GroupMember.id)
+        .offset(skip).limit(limit)
+    )).scalars().all()
     
-    return GroupResponse(**group_dict)
+    return [build_member_response(m) for m in members]
 
 
 @router.post("/{group_id}/members", response_model=GroupMemberResponse)
 async def add_member(
     group_id: str,
     request: AddMemberRequest,
-    current_user: User = Depends(get_current_user_from_token),
-    db: Session = Depends(get_db)
+    current_user: User = Depends(get_current_user_from_token_async),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Add a member to group (admin only)
     """
     # Check if user is an admin of this group
-    membership = db.query(GroupMember).filter(
-        GroupMember.group_id == group_id,
-        GroupMember.user_id == current_user.id,
-        GroupMember.is_admin == True
-    ).first()
+    membership = await get_membership(db, group_id, current_user.id, admin_only=True)
     
     if not membership:
         raise HTTPException(status_code=403, detail="Only group admins can add members")
     
     # Check if user to add exists
-    user = db.query(User).filter(User.id == request.user_id).first()
+    user = await db.get(User, request.user_id)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     
     # Check if already a member
-    existing = db.query(GroupMember).filter(
-        GroupMember.group_id == group_id,
-        GroupMember.user_id == request.user_id
-    ).first()
+    existing = await get_membership(db, group_id, request.user_id)
     
     if existing:
         raise HTTPException(status_code=400, detail="User is already a member")
@@ -240,35 +315,41 @@ async def add_member(
     )
     
     db.add(new_member)
-    db.commit()
-    db.refresh(new_member)
-    
-    return GroupMemberResponse.from_orm(new_member)
+    await db.commit()
+    await db.refresh(new_member)
+    
+    return GroupMemberResponse(
+        id=new_member.id,
+        group_id=new_member.group_id,
+        user_id=new_member.user_id,
+        is_admin=new_member.is_admin,
+        joined_at=new_member.joined_at,
+        user=UserInfo.from_orm(user)
+    )
 
 
 @router.get("/{group_id}/messages", response_model=List[GroupMessageResponse])
 async def get_group_messages(
     group_id: str,
     limit: int = 100,
-    current_user: User = Depends(get_current_user_from_token),
-    db: Session = Depends(get_db)
+    current_user: User = Depends(get_current_user_from_token_async),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Get messages from a group
     """
     # Check if user is a member
-    membership = db.query(GroupMember).filter(
-        GroupMember.group_id == group_id,
-        GroupMember.user_id == current_user.id
-    ).first()
+    membership = await get_membership(db, group_id, current_user.id)
     
     if not membership:
         raise HTTPException(status_code=403, detail="Not a member of this group")
     
     # Get messages
-    messages = db.query(GroupMessage).filter(
-        GroupMessage.group_id == group_id
-    ).order_by(GroupMessage.created_at.asc()).limit(limit).all()
+    messages = (await db.execute(
+        select(GroupMessage).options(selectinload(GroupMessage.sender))
+        .where(GroupMessage.group_id == group_id)
+        .order_by(GroupMessage.created_at.asc()).limit(limit)
+    )).scalars().all()
     
     return [GroupMessageResponse.from_orm(m) for m in messages]
 
@@ -277,17 +358,14 @@ async def get_group_messages(
 async def send_group_message(
     group_id: str,
     request: SendGroupMessageRequest,
-    current_user: User = Depends(get_current_user_from_token),
-    db: Session = Depends(get_db)
+    current_user: User = Depends(get_current_user_from_token_async),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Send a message to a group
     """
     # Check if user is a member
-    membership = db.query(GroupMember).filter(
-        GroupMember.group_id == group_id,
-        GroupMember.user_id == current_user.id
-    ).first()
+    membership = await get_membership(db, group_id, current_user.id)
     
     if not membership:
         raise HTTPException(status_code=403, detail="Not a member of this group")
@@ -300,37 +378,48 @@ async def send_group_message(
     )
     
     db.add(message)
-    db.commit()
-    db.refresh(message)
+    await db.commit()
+    await db.refresh(message)
+    
+    result = GroupMessageResponse(
+        id=message.id,
+        group_id=message.group_id,
+        sender_id=message.sender_id,
+        content=message.content,
+        created_at=message.created_at,
+        sender=UserInfo.from_orm(current_user)
+    )
+    
+    # Push to every member
+    member_ids = (await db.execute(
+        select(GroupMember.user_id).where(GroupMember.group_id == group_id)
+    )).scalars().all()
+    await event_hub.publish("group_message", result, member_ids)
     
-    return GroupMessageResponse.from_orm(message)
+    return result
 
 
 @router.delete("/{group_id}")
 async def delete_group(
     group_id: str,
-    current_user: User = Depends(get_current_user_from_token),
-    db: Session = Depends(get_db)
+    current_user: User = Depends(get_current_user_from_token_async),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Delete a group (admin only)
     """
     # Check if user is an admin of this group
-    membership = db.query(GroupMember).filter(
-        GroupMember.group_id == group_id,
-        GroupMember.user_id == current_user.id,
-        GroupMember.is_admin == True
-    ).first()
+    membership = await get_membership(db, group_id, current_user.id, admin_only=True)
     
     if not membership:
         raise HTTPException(status_code=403, detail="Only group admins can delete the group")
     
-    group = db.query(ChatGroup).filter(ChatGroup.id == group_id).first()
+    group = await db.get(ChatGroup, group_id)
     if not group:
         raise HTTPException(status_code=404, detail="Group not found")
     
-    db.delete(group)
-    db.commit()
+    await db.delete(group)
+    await db.commit()
     
     return {"message": "Group deleted successfully"}
 
@@ -339,8 +428,8 @@ async def delete_group(
 async def remove_member(
     group_id: str,
     user_id: str,
-    current_user: User = Depends(get_current_user_from_token),
-    db: Session = Depends(get_db)
+    current_user: User = Depends(get_current_user_from_token_async),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Remove a member from group (admin only or self)
@@ -348,40 +437,28 @@ async def remove_member(
     # Check if removing self
     if user_id == current_user.id:
         # Allow leaving group
-        membership = db.query(GroupMember).filter(
-            GroupMember.group_id == group_id,
-            GroupMember.user_id == user_id
-        ).first()
+        membership = await get_membership(db, group_id, user_id)
         
         if membership:
-            db.delete(membership)
-            db.commit()
+            await db.delete(membership)
+            await db.commit()
             return {"message": "Left group successfully"}
         else:
             raise HTTPException(status_code=404, detail="Not a member of this group")
     
     # Check if user is an admin
-    admin_membership = db.query(GroupMember).filter(
-        GroupMember.group_id == group_id,
-        GroupMember.user_id == current_user.id,
-        GroupMember.is_admin == True
-    ).first()
+    admin_membership = await get_membership(db, group_id, current_user.id, admin_only=True)
     
     if not admin_membership:
         raise HTTPException(status_code=403, detail="Only group admins can remove members")
     
     # Remove member
-    membership = db.query(GroupMember).filter(
-        GroupMember.group_id == group_id,
-        GroupMember.user_id == user_id
-    ).first()
+    membership = await get_membership(db, group_id, user_id)
     
     if not membership:
         raise HTTPException(status_code=404, detail="User is not a member")
     
-    db.delete(membership)
-    db.commit()
+    await db.delete(membership)
+    await db.commit()
     
     return {"message": "Member removed successfully"}
-
-
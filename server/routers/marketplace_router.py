@@ -2,20 +2,24 @@
 Marketplace API Routes - Resource Trading Platform
 """
 from fastapi import APIRouter, Depends, HTTPException, Query
-from sqlalchemy.orm import Session
-from sqlalchemy import and_, or_, desc, func
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import aliased
+from sqlalchemy import select, and_, or_, desc, func
+from sqlalchemy.exc import IntegrityError
 from typing import List, Optional
 from datetime import datetime
 from pydantic import BaseModel, Field
 
-from database import get_db
+from database import get_async_db
 from models import User
 from models_marketplace import (
     ResourceListing, ResourceTransaction, ResourceReview, APIKeyVault,
     ResourceStatus, TransactionStatus
 )
-from auth import get_current_user_from_token
-from credit_service import CreditService
+from auth import get_current_user_from_token_async
+from purchase_service import PurchaseService
+from rating_aggregates import apply_review
+from order_book import order_book, listing_snapshot
 
 
 router = APIRouter(prefix="/marketplace", tags=["Marketplace"])
@@ -69,6 +73,9 @@ class ListingResponse(BaseModel):
     success_rate: float
     rating: float
     review_count: int
+    speed_rating: Optional[float] = None
+    reliability_rating: Optional[float] = None
+    value_rating: Optional[float] = None
     created_at: datetime
 
     class Config:
@@ -101,34 +108,52 @@ class MarketplaceStats(BaseModel):
     active_models: int
 
 
+# ============= Helpers =============
+
+def build_listing_response(listing: ResourceListing, seller_username: Optional[str]) -> ListingResponse:
+    return ListingResponse(**listing_snapshot(listing, seller_username))
+
+
 # ============= API Routes =============
 
 @router.get("/stats", response_model=MarketplaceStats)
-async def get_marketplace_stats(db: Session = Depends(get_db)):
+async def get_marketplace_stats(db: AsyncSession = Depends(get_async_db)):
     """获取市场统计数据"""
     
-    total_listings = db.query(ResourceListing).filter(
-        ResourceListing.status == ResourceStatus.ACTIVE
-    ).count()
+    total_listings = (await db.execute(
+        select(func.count(ResourceListing.id)).where(
+            ResourceListing.status == ResourceStatus.ACTIVE
+        )
+    )).scalar()
     
-    total_sellers = db.query(func.count(func.distinct(ResourceListing.user_id))).scalar()
+    total_sellers = (await db.execute(
+        select(func.count(func.distinct(ResourceListing.user_id)))
+    )).scalar()
     
-    total_transactions = db.query(ResourceTransaction).filter(
-        ResourceTransaction.status == TransactionStatus.COMPLETED
-    ).count()
+    total_transactions = (await db.execute(
+        select(func.count(ResourceTransaction.id)).where(
+            ResourceTransaction.status == TransactionStatus.COMPLETED
+        )
+    )).scalar()
     
-    total_volume = db.query(func.sum(ResourceTransaction.amount)).filter(
-        ResourceTransaction.status == TransactionStatus.COMPLETED
-    ).scalar() or 0.0
+    total_volume = (await db.execute(
+        select(func.sum(ResourceTransaction.amount)).where(
+            ResourceTransaction.status == TransactionStatus.COMPLETED
+        )
+    )).scalar() or 0.0
     
-    avg_discount = db.query(func.avg(ResourceListing.discount_percentage)).filter(
-        ResourceListing.status == ResourceStatus.ACTIVE,
-        ResourceListing.discount_percentage.isnot(None)
-    ).scalar() or 0.0
+    avg_discount = (await db.execute(
+        select(func.avg(ResourceListing.discount_percentage)).where(
+            ResourceListing.status == ResourceStatus.ACTIVE,
+            ResourceListing.discount_percentage.isnot(None)
+        )
+    )).scalar() or 0.0
     
-    active_models = db.query(func.count(func.distinct(ResourceListing.model_id))).filter(
-        ResourceListing.status == ResourceStatus.ACTIVE
-    ).scalar()
+    active_models = (await db.execute(
+        select(func.count(func.distinct(ResourceListing.model_id))).where(
+            ResourceListing.status == ResourceStatus.ACTIVE
+        )
+    )).scalar()
     
     return MarketplaceStats(
         total_listings=total_listings,
@@ -150,7 +175,7 @@ async def get_listings(
     sort_by: str = Query("price_asc", regex="^(price_asc|price_desc|rating|sales|newest)$"),
     limit: int = Query(50, le=100),
     offset: int = 0,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     获取资源列表（市场大厅）
@@ -160,28 +185,40 @@ async def get_listings(
     - min_price/max_price: 价格范围
     - min_rating: 最低评分
     - sort_by: 排序方式 (price_asc, price_desc, rating, sales, newest)
+    
+    按模型价格浏览 (model_id + price_asc) 直接读取内存中的 order book
     """
     
-    query = db.query(ResourceListing).filter(
+    if model_id and sort_by == "price_asc":
+        offers = await order_book.offers(db, model_id, min_price, max_price)
+        if provider:
+            offers = [o for o in offers if o["provider"] == provider]
+        if min_rating is not None:
+            offers = [o for o in offers if (o["rating"] or 0) >= min_rating]
+        return [ListingResponse(**o) for o in offers[offset:offset + limit]]
+    
+    query = select(ResourceListing, User.username).outerjoin(
+        User, User.id == ResourceListing.user_id
+    ).where(
         ResourceListing.status == ResourceStatus.ACTIVE,
         ResourceListing.available_quota > 0
     )
     
     # 筛选条件
     if model_id:
-        query = query.filter(ResourceListing.model_id == model_id)
+        query = query.where(ResourceListing.model_id == model_id)
     if provider:
-        query = query.filter(ResourceListing.provider == provider)
+        query = query.where(ResourceListing.provider == provider)
     if min_price is not None:
-        query = query.filter(ResourceListing.price_per_1m_tokens >= min_price)
+        query = query.where(ResourceListing.price_per_1m_tokens >= min_price)
     if max_price is not None:
-        query = query.filter(ResourceListing.price_per_1m_tokens <= max_price)
+        query = query.where(ResourceListing.price_per_1m_tokens <= max_price)
     if min_rating is not None:
-        query = query.filter(ResourceListing.rating >= min_rating)
+        query = query.where(ResourceListing.rating >= min_rating)
     
     # 排序
     if sort_by == "price_asc":
-        query = query.order_by(ResourceListing.price_per_1m_tokens.asc())
+        query = query.order_by(ResourceListing.price_per_1m_tokens.asc(), desc(ResourceListing.rating))
     elif sort_by == "price_desc":
         query = query.order_by(ResourceListing.price_per_1m_tokens.desc())
     elif sort_by == "rating":
@@ -191,49 +228,48 @@ async def get_listings(
     elif sort_by == "newest":
         query = query.order_by(desc(ResourceListing.created_at))
     
-    listings = query.offset(offset).limit(limit).all()
+    rows = (await db.execute(query.offset(offset).limit(limit))).all()
     
-    # 添加卖家用户名
-    result = []
-    for listing in listings:
-        seller = db.query(User).filter(User.id == listing.user_id).first()
-        listing_dict = {
-            **listing.__dict__,
-            "seller_username": seller.username if seller else "Unknown"
-        }
-        result.append(ListingResponse(**listing_dict))
+    return [build_listing_response(listing, username) for listing, username in rows]
+
+
+@router.get("/best-offer", response_model=Optional[ListingResponse])
+async def get_best_offer(
+    model_id: str,
+    amount: Optional[float] = Query(None, gt=0),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    获取某个模型当前最优报价（最低价，同价按评分）
     
-    return result
+    - amount: 只返回可以满足该购买金额的报价
+    """
+    offer = await order_book.best_offer(db, model_id, amount)
+    return ListingResponse(**offer) if offer else None
 
 
 @router.get("/my-listings", response_model=List[ListingResponse])
 async def get_my_listings(
-    current_user: User = Depends(get_current_user_from_token),
-    db: Session = Depends(get_db)
+    current_user: User = Depends(get_current_user_from_token_async),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """获取我的资源列表"""
     
-    listings = db.query(ResourceListing).filter(
-        ResourceListing.user_id == current_user.id,
-        ResourceListing.status != ResourceStatus.DELETED
-    ).order_by(desc(ResourceListing.created_at)).all()
-    
-    result = []
-    for listing in listings:
-        listing_dict = {
-            **listing.__dict__,
-            "seller_username": current_user.username
-        }
-        result.append(ListingResponse(**listing_dict))
+    listings = (await db.execute(
+        select(ResourceListing).where(
+            ResourceListing.user_id == current_user.id,
+            ResourceListing.status != ResourceStatus.DELETED
+        ).order_by(desc(ResourceListing.created_at))
+    )).scalars().all()
     
-    return result
+    return [build_listing_response(listing, current_user.username) for listing in listings]
 
 
 @router.post("/listings", response_model=ListingResponse)
 async def create_listing(
     data: ListingCreate,
-    current_user: User = Depends(get_current_user_from_token),
-    db: Session = Depends(get_db)
+    current_user: User = Depends(get_current_user_from_token_async),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """创建资源列表（上架资源）"""
     
@@ -260,30 +296,28 @@ async def create_listing(
     )
     
     db.add(listing)
-    db.commit()
-    db.refresh(listing)
-    
-    listing_dict = {
-        **listing.__dict__,
-        "seller_username": current_user.username
-    }
+    await db.commit()
+    await db.refresh(listing)
+    order_book.invalidate(listing.model_id)
     
-    return ListingResponse(**listing_dict)
+    return build_listing_response(listing, current_user.username)
 
 
 @router.patch("/listings/{listing_id}", response_model=ListingResponse)
 async def update_listing(
     listing_id: str,
     data: ListingUpdate,
-    current_user: User = Depends(get_current_user_from_token),
-    db: Session = Depends(get_db)
+    current_user: User = Depends(get_current_user_from_token_async),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """更新资源列表"""
     
-    listing = db.query(ResourceListing).filter(
-        ResourceListing.id == listing_id,
-        ResourceListing.user_id == current_user.id
-    ).first()
+    listing = (await db.execute(
+        select(ResourceListing).where(
+            ResourceListing.id == listing_id,
+            ResourceListing.user_id == current_user.id
+        )
+    )).scalars().first()
     
     if not listing:
         raise HTTPException(status_code=404, detail="Listing not found")
@@ -308,35 +342,34 @@ async def update_listing(
     
     listing.updated_at = datetime.utcnow()
     
-    db.commit()
-    db.refresh(listing)
-    
-    listing_dict = {
-        **listing.__dict__,
-        "seller_username": current_user.username
-    }
+    await db.commit()
+    await db.refresh(listing)
+    order_book.invalidate(listing.model_id)
     
-    return ListingResponse(**listing_dict)
+    return build_listing_response(listing, current_user.username)
 
 
 @router.delete("/listings/{listing_id}")
 async def delete_listing(
     listing_id: str,
-    current_user: User = Depends(get_current_user_from_token),
-    db: Session = Depends(get_db)
+    current_user: User = Depends(get_current_user_from_token_async),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """删除资源列表（下架）"""
     
-    listing = db.query(ResourceListing).filter(
-        ResourceListing.id == listing_id,
-        ResourceListing.user_id == current_user.id
-    ).first()
+    listing = (await db.execute(
+        select(ResourceListing).where(
+            ResourceListing.id == listing_id,
+            ResourceListing.user_id == current_user.id
+        )
+    )).scalars().first()
     
     if not listing:
         raise HTTPException(status_code=404, detail="Listing not found")
     
     listing.status = ResourceStatus.DELETED
-    db.commit()
+    await db.commit()
+    order_book.invalidate(listing.model_id)
     
     return {"message": "Listing deleted successfully"}
 
@@ -344,146 +377,87 @@ async def delete_listing(
 @router.post("/purchase")
 async def purchase_resource(
     data: PurchaseRequest,
-    current_user: User = Depends(get_current_user_from_token),
-    db: Session = Depends(get_db)
+    current_user: User = Depends(get_current_user_from_token_async),
+    db: AsyncSession = Depends(get_async_db)
 ):
-    """购买资源"""
-    
-    # 获取资源列表
-    listing = db.query(ResourceListing).filter(
-        ResourceListing.id == data.listing_id,
-        ResourceListing.status == ResourceStatus.ACTIVE
-    ).first()
-    
-    if not listing:
-        raise HTTPException(status_code=404, detail="Listing not found or not available")
-    
-    # 检查库存
-    if listing.available_quota < data.amount:
-        raise HTTPException(status_code=400, detail="Insufficient quota available")
-    
-    # 检查最小购买量
-    if data.amount < listing.min_purchase:
-        raise HTTPException(status_code=400, detail=f"Minimum purchase is ${listing.min_purchase}")
-    
-    # 不能购买自己的资源
-    if listing.user_id == current_user.id:
-        raise HTTPException(status_code=400, detail="Cannot purchase your own resource")
-    
-    # 计算费用
-    total_cost = data.amount
-    seller_revenue = total_cost * 0.85  # 卖家85%
-    platform_fee = total_cost * 0.10    # 平台10%
-    reserve_fund = total_cost * 0.05    # 准备金5%
-    
-    # 计算购买的tokens数量
-    tokens_purchased = int((data.amount / listing.price_per_1m_tokens) * 1_000_000)
-    
-    # 检查买家余额
-    credit_service = CreditService(db)
-    buyer_balance = credit_service.get_balance(current_user.id)
+    """
+    购买资源
     
-    if buyer_balance < total_cost:
-        raise HTTPException(status_code=400, detail="Insufficient credit balance")
+    库存、买家、卖家和平台账本在同一个事务中结算（见 purchase_service.py）
+    """
     
     try:
-        # 扣除买家Credit
-        credit_service.deduct_credits(
-            user_id=current_user.id,
-            amount=total_cost,
-            description=f"Purchase resource: {listing.title}"
-        )
-        
-        # 增加卖家Credit
-        credit_service.add_credits(
-            user_id=listing.user_id,
-            amount=seller_revenue,
-            description=f"Sale revenue: {listing.title}"
+        transaction = await db.run_sync(
+            lambda session: PurchaseService.purchase(session, data.listing_id, current_user.id, data.amount)
         )
-        
-        # 平台收入（添加到平台账户或记录）
-        # TODO: 创建平台账户来接收platform_fee和reserve_fund
-        
-        # 更新listing库存
-        listing.available_quota -= data.amount
-        listing.total_sales += total_cost
-        listing.total_orders += 1
-        
-        if listing.available_quota <= 0:
-            listing.status = ResourceStatus.OUT_OF_STOCK
-        
-        # 创建交易记录
-        transaction = ResourceTransaction(
-            buyer_id=current_user.id,
-            seller_id=listing.user_id,
-            listing_id=listing.id,
-            amount=total_cost,
-            tokens_purchased=tokens_purchased,
-            price_per_1m_tokens=listing.price_per_1m_tokens,
-            seller_revenue=seller_revenue,
-            platform_fee=platform_fee,
-            reserve_fund=reserve_fund,
-            tokens_used=0,
-            tokens_remaining=tokens_purchased,
-            status=TransactionStatus.COMPLETED,
-            completed_at=datetime.utcnow()
-        )
-        
-        db.add(transaction)
-        db.commit()
-        db.refresh(transaction)
-        
-        return {
-            "message": "Purchase successful",
-            "transaction_id": transaction.id,
-            "tokens_purchased": tokens_purchased,
-            "amount_paid": total_cost,
-            "seller_revenue": seller_revenue
-        }
-        
+    except HTTPException:
+        raise
     except Exception as e:
-        db.rollback()
         raise HTTPException(status_code=500, detail=f"Transaction failed: {str(e)}")
+    
+    listing_model_id = (await db.execute(
+        select(ResourceListing.model_id).where(ResourceListing.id == data.listing_id)
+    )).scalar()
+    order_book.invalidate(listing_model_id)
+    
+    return {
+        "message": "Purchase successful",
+        "transaction_id": transaction.id,
+        "tokens_purchased": transaction.tokens_purchased,
+        "amount_paid": transaction.amount,
+        "seller_revenue": transaction.seller_revenue
+    }
 
 
 @router.get("/transactions")
 async def get_my_transactions(
     transaction_type: str = Query("all", regex="^(all|purchases|sales)$"),
-    current_user: User = Depends(get_current_user_from_token),
-    db: Session = Depends(get_db)
+    current_user: User = Depends(get_current_user_from_token_async),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """获取我的交易记录"""
     
+    # 一次查询带出资源、买家、卖家信息
+    buyer = aliased(User)
+    seller = aliased(User)
+    query = select(
+        ResourceTransaction,
+        ResourceListing.title,
+        ResourceListing.model_name,
+        buyer.username,
+        seller.username
+    ).outerjoin(
+        ResourceListing, ResourceListing.id == ResourceTransaction.listing_id
+    ).outerjoin(
+        buyer, buyer.id == ResourceTransaction.buyer_id
+    ).outerjoin(
+        seller, seller.id == ResourceTransaction.seller_id
+    )
+    
     if transaction_type == "purchases":
-        transactions = db.query(ResourceTransaction).filter(
-            ResourceTransaction.buyer_id == current_user.id
-        ).order_by(desc(ResourceTransaction.created_at)).all()
+        query = query.where(ResourceTransaction.buyer_id == current_user.id)
     elif transaction_type == "sales":
-        transactions = db.query(ResourceTransaction).filter(
-            ResourceTransaction.seller_id == current_user.id
-        ).order_by(desc(ResourceTransaction.created_at)).all()
+        query = query.where(ResourceTransaction.seller_id == current_user.id)
     else:  # all
-        transactions = db.query(ResourceTransaction).filter(
+        query = query.where(
             or_(
                 ResourceTransaction.buyer_id == current_user.id,
                 ResourceTransaction.seller_id == current_user.id
             )
-        ).order_by(desc(ResourceTransaction.created_at)).all()
+        )
+    rows = (await db.execute(
+        query.order_by(desc(ResourceTransaction.created_at))
+    )).all()
     
-    # 添加额外信息
     result = []
-    for txn in transactions:
-        listing = db.query(ResourceListing).filter(ResourceListing.id == txn.listing_id).first()
-        buyer = db.query(User).filter(User.id == txn.buyer_id).first()
-        seller = db.query(User).filter(User.id == txn.seller_id).first()
-        
+    for txn, listing_title, model_name, buyer_username, seller_username in rows:
         result.append({
             "id": txn.id,
             "type": "purchase" if txn.buyer_id == current_user.id else "sale",
-            "listing_title": listing.title if listing else "Unknown",
-            "model_name": listing.model_name if listing else "Unknown",
-            "buyer_username": buyer.username if buyer else "Unknown",
-            "seller_username": seller.username if seller else "Unknown",
+            "listing_title": listing_title or "Unknown",
+            "model_name": model_name or "Unknown",
+            "buyer_username": buyer_username or "Unknown",
+            "seller_username": seller_username or "Unknown",
             "amount": txn.amount,
             "tokens_purchased": txn.tokens_purchased,
             "tokens_used": txn.tokens_used,
@@ -499,25 +473,29 @@ async def get_my_transactions(
 @router.post("/reviews")
 async def create_review(
     data: ReviewCreate,
-    current_user: User = Depends(get_current_user_from_token),
-    db: Session = Depends(get_db)
+    current_user: User = Depends(get_current_user_from_token_async),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """创建评价"""
     
     # 检查交易是否存在且属于当前用户
-    transaction = db.query(ResourceTransaction).filter(
-        ResourceTransaction.id == data.transaction_id,
-        ResourceTransaction.buyer_id == current_user.id,
-        ResourceTransaction.status == TransactionStatus.COMPLETED
-    ).first()
+    transaction = (await db.execute(
+        select(ResourceTransaction).where(
+            ResourceTransaction.id == data.transaction_id,
+            ResourceTransaction.buyer_id == current_user.id,
+            ResourceTransaction.status == TransactionStatus.COMPLETED
+        )
+    )).scalars().first()
     
     if not transaction:
         raise HTTPException(status_code=404, detail="Transaction not found or not eligible for review")
     
     # 检查是否已评价
-    existing_review = db.query(ResourceReview).filter(
-        ResourceReview.transaction_id == data.transaction_id
-    ).first()
+    existing_review = (await db.execute(
+        select(ResourceReview).where(
+            ResourceReview.transaction_id == data.transaction_id
+        )
+    )).scalars().first()
     
     if existing_review:
         raise HTTPException(status_code=400, detail="Already reviewed this transaction")
@@ -537,23 +515,23 @@ async def create_review(
     
     db.add(review)
     
-    # 更新listing的评分
-    listing = db.query(ResourceListing).filter(
-        ResourceListing.id == transaction.listing_id
-    ).first()
-    
-    if listing:
-        # 重新计算平均评分
-        all_reviews = db.query(ResourceReview).filter(
-            ResourceReview.listing_id == listing.id
-        ).all()
-        
-        total_rating = sum(r.rating for r in all_reviews) + data.rating
-        listing.review_count = len(all_reviews) + 1
-        listing.rating = total_rating / listing.review_count
+    # 更新listing的评分（原子递增，与评价同一事务）
+    model_id = (await db.execute(
+        apply_review(transaction.listing_id, data.rating, {
+            "speed": data.speed_rating,
+            "reliability": data.reliability_rating,
+            "value": data.value_rating,
+        })
+    )).scalar()
     
-    db.commit()
-    db.refresh(review)
+    try:
+        await db.commit()
+    except IntegrityError:
+        # Concurrent review of the same transaction (unique transaction_id)
+        await db.rollback()
+        raise HTTPException(status_code=400, detail="Already reviewed this transaction")
+    await db.refresh(review)
+    order_book.invalidate(model_id)
     
     return {"message": "Review created successfully", "review_id": review.id}
 
@@ -563,20 +541,22 @@ async def get_listing_reviews(
     listing_id: str,
     limit: int = Query(20, le=100),
     offset: int = 0,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """获取资源的评价列表"""
     
-    reviews = db.query(ResourceReview).filter(
-        ResourceReview.listing_id == listing_id
-    ).order_by(desc(ResourceReview.created_at)).offset(offset).limit(limit).all()
+    rows = (await db.execute(
+        select(ResourceReview, User.username)
+        .outerjoin(User, User.id == ResourceReview.buyer_id)
+        .where(ResourceReview.listing_id == listing_id)
+        .order_by(desc(ResourceReview.created_at)).offset(offset).limit(limit)
+    )).all()
     
     result = []
-    for review in reviews:
-        buyer = db.query(User).filter(User.id == review.buyer_id).first()
+    for review, buyer_username in rows:
         result.append({
             "id": review.id,
-            "buyer_username": buyer.username if buyer else "Anonymous",
+            "buyer_username": buyer_username or "Anonymous",
             "rating": review.rating,
             "speed_rating": review.speed_rating,
             "reliability_rating": review.reliability_rating,
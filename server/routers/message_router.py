@@ -1,17 +1,22 @@
 """
 Message API routes for user-to-user messaging
 """
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from sqlalchemy import or_, and_, func
-from typing import List
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
+from sqlalchemy import select, update, or_, and_, func, case
+from typing import List, Optional
 from datetime import datetime
 from pydantic import BaseModel
 
-from database import get_db
+from database import get_async_db
 from models import User
 from models_message import Message
-from auth import get_current_user_from_token
+from auth import get_current_user_from_token_async
+from realtime import event_hub
+from pagination import (
+    after_cursor, since_cursor, encode_cursor, set_next_cursor, SYNC_CURSOR_HEADER
+)
 
 router = APIRouter(prefix="/api/messages", tags=["messages"])
 
@@ -52,108 +57,102 @@ class ConversationUser(BaseModel):
     unread_count: int
 
 
+# ==================== Helpers ====================
+
+async def count_unread(db: AsyncSession, user_id: str) -> int:
+    """Total unread direct messages for a user"""
+    count = (await db.execute(
+        select(func.count(Message.id)).where(
+            Message.receiver_id == user_id,
+            Message.is_read == False
+        )
+    )).scalar()
+    return count or 0
+
+
 # ==================== Routes ====================
 
 @router.get("/users", response_model=List[UserInfo])
 async def get_all_users(
-    current_user: User = Depends(get_current_user_from_token),
-    db: Session = Depends(get_db)
+    current_user: User = Depends(get_current_user_from_token_async),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Get all users (except current user) for messaging
     """
-    users = db.query(User).filter(
-        User.id != current_user.id,
-        User.is_active == True
-    ).all()
+    result = await db.execute(
+        select(User).where(
+            User.id != current_user.id,
+            User.is_active == True
+        )
+    )
+    users = result.scalars().all()
     
     return [UserInfo.from_orm(user) for user in users]
 
 
 @router.get("/conversations", response_model=List[ConversationUser])
 async def get_conversations(
-    current_user: User = Depends(get_current_user_from_token),
-    db: Session = Depends(get_db)
+    current_user: User = Depends(get_current_user_from_token_async),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
-    Get all conversations with other users
+    Get all conversations with other users (most recent first)
+    
+    One query: every message of the current user is tagged with its partner,
+    ranked per partner by time and summed for unread, then the latest row of
+    each partner is joined to the partner's user.
     """
-    # Get all users the current user has messaged with
-    subquery = db.query(
-        func.coalesce(
-            Message.sender_id,
-            Message.receiver_id
-        ).label('other_user_id')
-    ).filter(
-        or_(
-            Message.sender_id == current_user.id,
-            Message.receiver_id == current_user.id
-        )
-    ).distinct().subquery()
+    partner_id = case(
+        (Message.sender_id == current_user.id, Message.receiver_id),
+        else_=Message.sender_id
+    )
     
-    # Get user details and last message for each conversation
-    conversations = []
+    threads = select(
+        partner_id.label("partner_id"),
+        Message.content,
+        Message.created_at,
+        func.row_number().over(
+            partition_by=partner_id,
+            order_by=(Message.created_at.desc(), Message.id.desc())
+        ).label("rank"),
+        func.sum(case(
+            (and_(Message.receiver_id == current_user.id, Message.is_read == False), 1),
+            else_=0
+        )).over(partition_by=partner_id).label("unread_count")
+    ).where(
+        or_(Message.sender_id == current_user.id, Message.receiver_id == current_user.id)
+    ).subquery()
     
-    # Get all unique user IDs from messages
-    user_ids = db.query(Message.sender_id).filter(
-        Message.receiver_id == current_user.id
-    ).union(
-        db.query(Message.receiver_id).filter(
-            Message.sender_id == current_user.id
-        )
-    ).distinct().all()
-    
-    for (user_id,) in user_ids:
-        if user_id == current_user.id:
-            continue
-            
-        # Get user info
-        other_user = db.query(User).filter(User.id == user_id).first()
-        if not other_user:
-            continue
-        
-        # Get last message
-        last_msg = db.query(Message).filter(
-            or_(
-                and_(Message.sender_id == current_user.id, Message.receiver_id == user_id),
-                and_(Message.sender_id == user_id, Message.receiver_id == current_user.id)
-            )
-        ).order_by(Message.created_at.desc()).first()
-        
-        if not last_msg:
-            continue
-        
-        # Count unread messages
-        unread_count = db.query(func.count(Message.id)).filter(
-            Message.sender_id == user_id,
-            Message.receiver_id == current_user.id,
-            Message.is_read == False
-        ).scalar()
-        
-        conversations.append(ConversationUser(
+    rows = (await db.execute(
+        select(User, threads.c.content, threads.c.created_at, threads.c.unread_count)
+        .join(threads, threads.c.partner_id == User.id)
+        .where(threads.c.rank == 1, User.id != current_user.id)
+        .order_by(threads.c.created_at.desc())
+    )).all()
+    
+    return [
+        ConversationUser(
             user=UserInfo.from_orm(other_user),
-            last_message=last_msg.content,
-            last_message_time=last_msg.created_at,
+            last_message=content,
+            last_message_time=created_at,
             unread_count=unread_count or 0
-        ))
-    
-    # Sort by last message time
-    conversations.sort(key=lambda x: x.last_message_time, reverse=True)
-    
-    return conversations
+        )
+        for other_user, content, created_at, unread_count in rows
+    ]
 
 
 @router.post("/send", response_model=MessageResponse)
 async def send_message(
     request: SendMessageRequest,
-    current_user: User = Depends(get_current_user_from_token),
-    db: Session = Depends(get_db)
+    current_user: User = Depends(get_current_user_from_token_async),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Send a message to another user
     """
     # Validate receiver exists
-    receiver = db.query(User).filter(User.id == request.receiver_id).first()
+    receiver = await db.get(User, request.receiver_id)
     if not receiver:
         raise HTTPException(status_code=404, detail="Receiver not found")
     
@@ -168,61 +167,102 @@ async def send_message(
     )
     
     db.add(message)
-    db.commit()
-    db.refresh(message)
+    await db.commit()
+    await db.refresh(message)
     
     # Add sender info for response
     message.sender = current_user
+    result = MessageResponse.from_orm(message)
+    
+    # Push to both sides, and the receiver's new unread total
+    await event_hub.publish("message", result, [current_user.id, request.receiver_id])
+    await event_hub.publish(
+        "unread_count",
+        {"unread_count": await count_unread(db, request.receiver_id)},
+        [request.receiver_id]
+    )
     
-    return MessageResponse.from_orm(message)
+    return result
 
 
 @router.get("/{user_id}", response_model=List[MessageResponse])
 async def get_messages_with_user(
     user_id: str,
-    current_user: User = Depends(get_current_user_from_token),
-    db: Session = Depends(get_db)
+    response: Response,
+    since: Optional[str] = None,
+    before: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=200),
+    current_user: User = Depends(get_current_user_from_token_async),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
-    Get all messages with a specific user
+    Get messages with a specific user (oldest first)
+    
+    - no cursor: the latest `limit` messages
+    - since: only messages newer than the cursor (pass back X-Sync-Cursor when polling)
+    - before: the page of older messages (pass back X-Next-Cursor to scroll up)
     """
+    if since and before:
+        raise HTTPException(status_code=400, detail="Use either since or before, not both")
+    
     # Validate user exists
-    other_user = db.query(User).filter(User.id == user_id).first()
+    other_user = await db.get(User, user_id)
     if not other_user:
         raise HTTPException(status_code=404, detail="User not found")
     
-    # Get all messages between current user and specified user
-    messages = db.query(Message).filter(
+    # Mark received messages as read in one statement
+    marked = await db.execute(
+        update(Message).where(
+            Message.receiver_id == current_user.id,
+            Message.sender_id == user_id,
+            Message.is_read == False
+        ).values(is_read=True, read_at=datetime.utcnow())
+    )
+    if marked.rowcount:
+        await db.commit()
+        await event_hub.publish(
+            "unread_count",
+            {"unread_count": await count_unread(db, current_user.id)},
+            [current_user.id]
+        )
+    
+    query = select(Message).options(selectinload(Message.sender)).where(
         or_(
             and_(Message.sender_id == current_user.id, Message.receiver_id == user_id),
             and_(Message.sender_id == user_id, Message.receiver_id == current_user.id)
         )
-    ).order_by(Message.created_at.asc()).all()
+    )
     
-    # Mark received messages as read
-    unread_messages = [msg for msg in messages if msg.receiver_id == current_user.id and not msg.is_read]
-    for msg in unread_messages:
-        msg.is_read = True
-        msg.read_at = datetime.utcnow()
+    if since:
+        # New messages, oldest first
+        query = query.where(since_cursor(Message.created_at, Message.id, since))
+        query = query.order_by(Message.created_at.asc(), Message.id.asc())
+        messages = (await db.execute(query.limit(limit))).scalars().all()
+    else:
+        # Latest page (or the page before the cursor), read newest first
+        if before:
+            query = query.where(after_cursor(Message.created_at, Message.id, before))
+        query = query.order_by(Message.created_at.desc(), Message.id.desc())
+        page = (await db.execute(query.limit(limit))).scalars().all()
+        set_next_cursor(response, page, limit, "created_at")
+        messages = list(reversed(page))
     
-    if unread_messages:
-        db.commit()
+    if messages and not before:
+        newest = messages[-1]
+        response.headers[SYNC_CURSOR_HEADER] = encode_cursor(newest.created_at, newest.id)
+    elif since:
+        response.headers[SYNC_CURSOR_HEADER] = since
     
     return [MessageResponse.from_orm(msg) for msg in messages]
 
 
 @router.get("/unread/count")
 async def get_unread_count(
-    current_user: User = Depends(get_current_user_from_token),
-    db: Session = Depends(get_db)
+    current_user: User = Depends(get_current_user_from_token_async),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Get total unread message count for current user
     """
-    count = db.query(func.count(Message.id)).filter(
-        Message.receiver_id == current_user.id,
-        Message.is_read == False
-    ).scalar()
-    
-    return {"unread_count": count or 0}
+    return {"unread_count": await count_unread(db, current_user.id)}
 
@@ -0,0 +1,72 @@
+"""
+Real-time event stream (Server-Sent Events)
+
+GET /api/realtime/events?token=<jwt> keeps one connection open per tab and
+pushes:
+- message: new direct message (to sender and receiver)
+- unread_count: the user's unread direct message total
+- group_message: new message in one of the user's groups
+- post: new forum post (to everyone)
+
+The token goes in the query string because EventSource cannot send headers.
+"""
+import asyncio
+import json
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import StreamingResponse
+
+from config import settings
+from database import AsyncSessionLocal
+from models import User
+from auth import decode_access_token
+from realtime import event_hub
+from routers.message_router import count_unread
+
+router = APIRouter(prefix="/api/realtime", tags=["realtime"])
+
+
+def format_event(event_type: str, data) -> str:
+    return f"event: {event_type}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+@router.get("/events")
+async def stream_events(token: str, request: Request):
+    """
+    Stream events for the current user
+    """
+    payload = decode_access_token(token)
+    user_id = payload.get("sub")
+    if user_id is None:
+        raise HTTPException(status_code=401, detail="Could not validate credentials")
+
+    # Short-lived session: nothing is held open while streaming
+    async with AsyncSessionLocal() as db:
+        user = await db.get(User, user_id)
+        if user is None or not user.is_active:
+            raise HTTPException(status_code=401, detail="Could not validate credentials")
+        unread = await count_unread(db, user_id)
+
+    queue = event_hub.subscribe(user_id)
+
+    async def events():
+        try:
+            # Current state first, then changes
+            yield format_event("unread_count", {"unread_count": unread})
+            while not await request.is_disconnected():
+                try:
+                    event = await asyncio.wait_for(queue.get(), settings.realtime_heartbeat_interval)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+                yield format_event(event["type"], event["data"])
+        finally:
+            event_hub.unsubscribe(user_id, queue)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no",
+        }
+    )
@@ -1,22 +1,25 @@
 """
 Resource Pool API Routes - Bank-style Resource Sharing System
 """
-from fastapi import APIRouter, Depends, HTTPException, Query
-from sqlalchemy.orm import Session
-from sqlalchemy import desc, func
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select, desc, func
 from typing import List, Optional
 from datetime import datetime
 from pydantic import BaseModel, Field
 
-from database import get_db
+from database import get_async_db
 from models import User
 from models_resource_pool import (
     PoolResource, PoolDeposit, PoolUsageLog, PoolLedger,
     PoolResourceStatus, PoolDepositStatus
 )
-from auth import get_current_user_from_token
+from auth import get_current_user_from_token_async
 from credit_service import CreditService
 from api_key_validator import APIKeyValidator, ValidationResult
+from pagination import after_cursor, set_next_cursor
+from router_scoreboard import ResourceEntry
+from smart_router import scoreboard
 
 
 router = APIRouter(prefix="/resource-pool", tags=["Resource Pool"])
@@ -96,32 +99,34 @@ class MyContributionItem(BaseModel):
 
 @router.get("/stats", response_model=PoolStatsResponse)
 async def get_pool_stats(
-    current_user: User = Depends(get_current_user_from_token),
-    db: Session = Depends(get_db)
+    current_user: User = Depends(get_current_user_from_token_async),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """获取资源池统计信息"""
     
     # Total resources count
-    total_resources = db.query(PoolResource).count()
+    total_resources = (await db.execute(select(func.count(PoolResource.id)))).scalar()
     
-    # Total deposited (sum of all approved deposits)
-    total_deposited = db.query(func.sum(PoolDeposit.claimed_quota)).filter(
-        PoolDeposit.status == PoolDepositStatus.APPROVED
-    ).scalar() or 0.0
+    # Total deposited and platform revenue (10% fee) from approved deposits
+    total_deposited, platform_revenue = (await db.execute(
+        select(
+            func.coalesce(func.sum(PoolDeposit.claimed_quota), 0.0),
+            func.coalesce(func.sum(PoolDeposit.fee_amount), 0.0)
+        ).where(PoolDeposit.status == PoolDepositStatus.APPROVED)
+    )).one()
     
     # Total usage (sum of all consumed credits)
-    total_usage = db.query(func.sum(PoolResource.total_consumed)).scalar() or 0.0
-    
-    # Platform revenue (10% fee from deposits + usage fees)
-    platform_revenue = db.query(func.sum(PoolDeposit.fee_amount)).filter(
-        PoolDeposit.status == PoolDepositStatus.APPROVED
-    ).scalar() or 0.0
+    total_usage = (await db.execute(
+        select(func.sum(PoolResource.total_consumed))
+    )).scalar() or 0.0
     
     # Active providers (unique users with active resources)
-    active_providers = db.query(func.count(func.distinct(PoolResource.owner_id))).filter(
-        PoolResource.owner_type == "user",
-        PoolResource.status == PoolResourceStatus.ACTIVE
-    ).scalar() or 0
+    active_providers = (await db.execute(
+        select(func.count(func.distinct(PoolResource.owner_id))).where(
+            PoolResource.owner_type == "user",
+            PoolResource.status == PoolResourceStatus.ACTIVE
+        )
+    )).scalar() or 0
     
     return PoolStatsResponse(
         total_resources=total_resources,
@@ -135,8 +140,8 @@ async def get_pool_stats(
 @router.post("/deposit", response_model=DepositResponse)
 async def deposit_resource(
     data: DepositRequest,
-    current_user: User = Depends(get_current_user_from_token),
-    db: Session = Depends(get_db)
+    current_user: User = Depends(get_current_user_from_token_async),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     用户存入API资源到资源池（带验证）
@@ -208,7 +213,7 @@ async def deposit_resource(
         )
         
         db.add(deposit)
-        db.flush()
+        await db.flush()
         
         # Create PoolResource (encrypted storage)
         # TODO: Implement proper encryption
@@ -228,26 +233,30 @@ async def deposit_resource(
         )
         
         db.add(resource)
-        db.flush()
+        await db.flush()
+        entry = ResourceEntry.from_model(resource)
         
         # Link deposit to resource
         deposit.resource_id = resource.id
         
         # Add Credits to user account
-        CreditService.deposit(
+        await db.run_sync(lambda session: CreditService.deposit(
             user_id=current_user.id,
             amount=credits_to_receive,
             description=f"Resource Pool deposit: {data.provider} API Key",
-            db=db
-        )
+            db=session
+        ))
         
         # Approve deposit
         deposit.status = PoolDepositStatus.APPROVED
         deposit.processed_at = datetime.utcnow()
         deposit.verified_at = datetime.utcnow()
         
-        db.commit()
-        db.refresh(deposit)
+        await db.commit()
+        await db.refresh(deposit)
+        
+        # Routable right away in this worker (others pick it up on their next refresh)
+        scoreboard.upsert(entry)
         
         return DepositResponse(
             deposit_id=deposit.id,
@@ -260,30 +269,34 @@ async def deposit_resource(
         )
         
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(status_code=500, detail=f"Failed to deposit resource: {str(e)}")
 
 
 @router.get("/my-contributions", response_model=List[MyContributionItem])
 async def get_my_contributions(
-    current_user: User = Depends(get_current_user_from_token),
-    db: Session = Depends(get_db)
+    current_user: User = Depends(get_current_user_from_token_async),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """获取我贡献的资源列表（详细信息）"""
     
     # Get all deposits by this user
-    deposits = db.query(PoolDeposit).filter(
-        PoolDeposit.user_id == current_user.id
-    ).order_by(desc(PoolDeposit.created_at)).all()
+    deposits = (await db.execute(
+        select(PoolDeposit).where(
+            PoolDeposit.user_id == current_user.id
+        ).order_by(desc(PoolDeposit.created_at))
+    )).scalars().all()
     
     contributions = []
     
     for deposit in deposits:
         # Find corresponding resource if exists
-        resource = db.query(PoolResource).filter(
-            PoolResource.owner_id == current_user.id,
-            PoolResource.provider == deposit.provider
-        ).first()
+        resource = (await db.execute(
+            select(PoolResource).where(
+                PoolResource.owner_id == current_user.id,
+                PoolResource.provider == deposit.provider
+            ).limit(1)
+        )).scalars().first()
         
         # Calculate earned amount (85% of consumed, 10% goes to platform, 5% buffer)
         earned_rate = 0.85
@@ -307,14 +320,16 @@ async def get_my_contributions(
 
 @router.get("/my-resources", response_model=List[PoolResourceInfo])
 async def get_my_resources(
-    current_user: User = Depends(get_current_user_from_token),
-    db: Session = Depends(get_db)
+    current_user: User = Depends(get_current_user_from_token_async),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """获取我贡献的资源列表"""
     
-    resources = db.query(PoolResource).filter(
-        PoolResource.owner_id == current_user.id
-    ).order_by(desc(PoolResource.created_at)).all()
+    resources = (await db.execute(
+        select(PoolResource).where(
+            PoolResource.owner_id == current_user.id
+        ).order_by(desc(PoolResource.created_at))
+    )).scalars().all()
     
     return [
         PoolResourceInfo(
@@ -337,14 +352,16 @@ async def get_my_resources(
 
 @router.get("/deposits")
 async def get_my_deposits(
-    current_user: User = Depends(get_current_user_from_token),
-    db: Session = Depends(get_db)
+    current_user: User = Depends(get_current_user_from_token_async),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """获取我的存款记录"""
     
-    deposits = db.query(PoolDeposit).filter(
-        PoolDeposit.user_id == current_user.id
-    ).order_by(desc(PoolDeposit.created_at)).all()
+    deposits = (await db.execute(
+        select(PoolDeposit).where(
+            PoolDeposit.user_id == current_user.id
+        ).order_by(desc(PoolDeposit.created_at))
+    )).scalars().all()
     
     return [
         {
@@ -365,17 +382,17 @@ async def get_my_deposits(
 
 @router.get("/admin/resources", response_model=List[PoolResourceInfo])
 async def admin_get_all_resources(
-    current_user: User = Depends(get_current_user_from_token),
-    db: Session = Depends(get_db)
+    current_user: User = Depends(get_current_user_from_token_async),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Admin: 获取所有资源池资源"""
     
     if not current_user.is_admin:
         raise HTTPException(status_code=403, detail="Admin access required")
     
-    resources = db.query(PoolResource).order_by(
-        desc(PoolResource.created_at)
-    ).all()
+    resources = (await db.execute(
+        select(PoolResource).order_by(desc(PoolResource.created_at))
+    )).scalars().all()
     
     return [
         PoolResourceInfo(
@@ -398,23 +415,33 @@ async def admin_get_all_resources(
 
 @router.get("/admin/usage-logs")
 async def admin_get_usage_logs(
+    response: Response,
     limit: int = Query(50, le=200),
-    current_user: User = Depends(get_current_user_from_token),
-    db: Session = Depends(get_db)
+    offset: int = Query(0, ge=0),
+    cursor: Optional[str] = Query(None, description="X-Next-Cursor from the previous page"),
+    current_user: User = Depends(get_current_user_from_token_async),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Admin: 获取资源使用日志（账本）"""
     
     if not current_user.is_admin:
         raise HTTPException(status_code=403, detail="Admin access required")
     
-    logs = db.query(PoolUsageLog).order_by(
-        desc(PoolUsageLog.created_at)
-    ).limit(limit).all()
+    query = select(PoolUsageLog)
+    if cursor:
+        query = query.where(after_cursor(PoolUsageLog.created_at, PoolUsageLog.id, cursor))
+    else:
+        query = query.offset(offset)
+    
+    logs = (await db.execute(
+        query.order_by(desc(PoolUsageLog.created_at), desc(PoolUsageLog.id)).limit(limit)
+    )).scalars().all()
+    set_next_cursor(response, logs, limit, "created_at")
     
     result = []
     for log in logs:
-        user = db.query(User).filter(User.id == log.user_id).first()
-        resource_owner = db.query(User).filter(User.id == log.resource_owner_id).first()
+        user = await db.get(User, log.user_id)
+        resource_owner = await db.get(User, log.resource_owner_id) if log.resource_owner_id else None
         
         result.append({
             "id": log.id,
@@ -1,16 +1,18 @@
 """
 Usage tracking and statistics routes
 """
-from fastapi import APIRouter, Depends, Query
+from fastapi import APIRouter, Depends, Query, Response
 from sqlalchemy.orm import Session
-from sqlalchemy import func, cast, Date
-from typing import List
+from sqlalchemy import func, cast, Date, select
+from typing import List, Optional
 from datetime import datetime, timedelta
 from database import get_db
-from models import User, UsageLog
+from models import User, UsageLog, UsageDailyRollup
 from schemas import UsageLogResponse, UsageStats
 from auth import get_current_user_from_token
 from check_limits import get_user_remaining_quota
+from export_service import stream_export, apply_date_range
+from pagination import after_cursor, set_next_cursor
 
 router = APIRouter(prefix="/usage", tags=["Usage"])
 
@@ -24,37 +26,40 @@ def get_usage_stats(
     """
     Get usage statistics for the current user
     """
-    # Calculate date range
-    start_date = datetime.utcnow() - timedelta(days=days)
+    # Calculate date range (whole UTC days, served from the daily rollups)
+    start_day = (datetime.utcnow() - timedelta(days=days)).date()
     
-    # Get logs within date range
-    logs = db.query(UsageLog).filter(
-        UsageLog.user_id == current_user.id,
-        UsageLog.timestamp >= start_date
+    rows = db.query(
+        UsageDailyRollup.model_name,
+        UsageDailyRollup.task_type,
+        func.sum(UsageDailyRollup.requests).label('requests'),
+        func.sum(UsageDailyRollup.total_tokens).label('tokens'),
+        func.sum(UsageDailyRollup.input_tokens).label('input_tokens'),
+        func.sum(UsageDailyRollup.output_tokens).label('output_tokens')
+    ).filter(
+        UsageDailyRollup.user_id == current_user.id,
+        UsageDailyRollup.day >= start_day
+    ).group_by(
+        UsageDailyRollup.model_name,
+        UsageDailyRollup.task_type
     ).all()
     
     # Calculate totals
-    total_requests = len(logs)
-    total_tokens = sum(log.total_tokens for log in logs)
-    total_input_tokens = sum(log.input_tokens for log in logs)
-    total_output_tokens = sum(log.output_tokens for log in logs)
+    total_requests = sum(row.requests or 0 for row in rows)
+    total_tokens = sum(row.tokens or 0 for row in rows)
+    total_input_tokens = sum(row.input_tokens or 0 for row in rows)
+    total_output_tokens = sum(row.output_tokens or 0 for row in rows)
     
-    # Group by model
+    # Group by model and by task type
     by_model = {}
-    for log in logs:
-        if log.model_name not in by_model:
-            by_model[log.model_name] = {"requests": 0, "tokens": 0}
-        by_model[log.model_name]["requests"] += 1
-        by_model[log.model_name]["tokens"] += log.total_tokens
-    
-    # Group by task type
     by_task = {}
-    for log in logs:
-        task_type = log.task_type or "text-generation"
-        if task_type not in by_task:
-            by_task[task_type] = {"requests": 0, "tokens": 0}
-        by_task[task_type]["requests"] += 1
-        by_task[task_type]["tokens"] += log.total_tokens
+    for row in rows:
+        task_type = row.task_type or "text-generation"
+        for groups, key in ((by_model, row.model_name), (by_task, task_type)):
+            if key not in groups:
+                groups[key] = {"requests": 0, "tokens": 0}
+            groups[key]["requests"] += row.requests or 0
+            groups[key]["tokens"] += row.tokens or 0
     
     return UsageStats(
         total_requests=total_requests,
@@ -68,23 +73,58 @@ def get_usage_stats(
 
 @router.get("/logs", response_model=List[UsageLogResponse])
 def get_usage_logs(
+    response: Response,
     limit: int = Query(default=50, ge=1, le=1000),
     offset: int = Query(default=0, ge=0),
+    cursor: Optional[str] = Query(default=None, description="X-Next-Cursor from the previous page (replaces offset)"),
     current_user: User = Depends(get_current_user_from_token),
     db: Session = Depends(get_db)
 ):
     """
     Get usage logs for the current user
+    Pass the X-Next-Cursor response header back as `cursor` to get the next page.
     """
-    logs = db.query(UsageLog).filter(
+    query = db.query(UsageLog).filter(
         UsageLog.user_id == current_user.id
-    ).order_by(
-        UsageLog.timestamp.desc()
-    ).offset(offset).limit(limit).all()
+    )
+    if cursor:
+        query = query.filter(after_cursor(UsageLog.timestamp, UsageLog.id, cursor))
+    query = query.order_by(
+        UsageLog.timestamp.desc(),
+        UsageLog.id.desc()
+    )
+    if not cursor:
+        query = query.offset(offset)
+    
+    logs = query.limit(limit).all()
     
+    set_next_cursor(response, logs, limit, "timestamp")
     return logs
 
 
+@router.get("/export")
+def export_usage_logs(
+    format: str = Query(default="ndjson", pattern="^(ndjson|csv)$"),
+    start: Optional[datetime] = Query(default=None, description="Include logs at or after this time (UTC)"),
+    end: Optional[datetime] = Query(default=None, description="Include logs before this time (UTC)"),
+    current_user: User = Depends(get_current_user_from_token)
+):
+    """
+    Stream all usage logs for the current user as NDJSON or CSV
+    """
+    columns = [
+        "id", "timestamp", "model_name", "task_type", "input_tokens", "output_tokens",
+        "total_tokens", "response_time_ms", "has_image", "has_audio", "cache_hit"
+    ]
+    statement = select(*[UsageLog.__table__.c[name] for name in columns]).where(
+        UsageLog.user_id == current_user.id
+    )
+    statement = apply_date_range(statement, UsageLog.timestamp, start, end)
+    statement = statement.order_by(UsageLog.timestamp, UsageLog.id)
+    
+    return stream_export(statement, columns, format, filename="usage_logs")
+
+
 @router.get("/quota")
 def get_user_quota(
     current_user: User = Depends(get_current_user_from_token),
@@ -109,21 +149,20 @@ def get_daily_usage_chart(
     
     start_date = datetime.utcnow() - timedelta(days=days)
     
-    # Query usage logs grouped by date
-    # Use cast() for cross-database compatibility (SQLite and PostgreSQL)
+    # Daily usage from the rollups
     daily_data = db.query(
-        cast(UsageLog.timestamp, Date).label('date'),
-        func.count(UsageLog.id).label('requests'),
-        func.sum(UsageLog.total_tokens).label('tokens'),
-        func.sum(UsageLog.input_tokens).label('input_tokens'),
-        func.sum(UsageLog.output_tokens).label('output_tokens')
+        UsageDailyRollup.day.label('date'),
+        func.sum(UsageDailyRollup.requests).label('requests'),
+        func.sum(UsageDailyRollup.total_tokens).label('tokens'),
+        func.sum(UsageDailyRollup.input_tokens).label('input_tokens'),
+        func.sum(UsageDailyRollup.output_tokens).label('output_tokens')
     ).filter(
-        UsageLog.user_id == current_user.id,
-        UsageLog.timestamp >= start_date
+        UsageDailyRollup.user_id == current_user.id,
+        UsageDailyRollup.day >= start_date.date()
     ).group_by(
-        cast(UsageLog.timestamp, Date)
+        UsageDailyRollup.day
     ).order_by(
-        cast(UsageLog.timestamp, Date)
+        UsageDailyRollup.day
     ).all()
     
     # Query credit consumption by date
@@ -169,16 +208,16 @@ def get_model_usage_chart(
     start_date = datetime.utcnow() - timedelta(days=days)
     
     model_data = db.query(
-        UsageLog.model_name,
-        func.count(UsageLog.id).label('requests'),
-        func.sum(UsageLog.total_tokens).label('tokens')
+        UsageDailyRollup.model_name,
+        func.sum(UsageDailyRollup.requests).label('requests'),
+        func.sum(UsageDailyRollup.total_tokens).label('tokens')
     ).filter(
-        UsageLog.user_id == current_user.id,
-        UsageLog.timestamp >= start_date
+        UsageDailyRollup.user_id == current_user.id,
+        UsageDailyRollup.day >= start_date.date()
     ).group_by(
-        UsageLog.model_name
+        UsageDailyRollup.model_name
     ).order_by(
-        func.sum(UsageLog.total_tokens).desc()
+        func.sum(UsageDailyRollup.total_tokens).desc()
     ).limit(10).all()  # Top 10 models
     
     chart_data = []
@@ -50,6 +50,7 @@ class ChatRequest(BaseModel):
     stream: bool = False
     temperature: float = Field(default=0.7, ge=0.0, le=2.0)
     max_tokens: int = Field(default=2048, ge=1, le=10000)
+    cache: bool = True  # Allow serving temperature == 0 requests from the completion cache
 
 
 class VisionChatRequest(BaseModel):
@@ -76,6 +77,7 @@ class ChatResponse(BaseModel):
     input_tokens: int
     output_tokens: int
     total_tokens: int
+    cached: bool = False
 
 
 class ModelInfo(BaseModel):
@@ -100,6 +102,7 @@ class UsageLogResponse(BaseModel):
     response_time_ms: float
     has_image: bool = False
     has_audio: bool = False
+    cache_hit: Optional[bool] = False
     
     class Config:
         from_attributes = True
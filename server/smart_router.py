@@ -6,21 +6,32 @@ Selects the best API key from the resource pool based on:
 2. Performance (success rate, latency)
 3. Availability (quota remaining)
 4. Load balancing (distribute load evenly)
+
+Candidates come from the in-memory scoreboard (router_scoreboard.py), so
+selection never queries the database. Performance uses recent EWMA error
+rate and p95 latency, and keys with an open circuit are skipped
+(resource_health.py), as are keys at their max_requests_per_minute
+(resource_throttle.py).
 """
 
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Set, Union
 from sqlalchemy.orm import Session
-from sqlalchemy import and_
 from dataclasses import dataclass
+import itertools
 import random
 
+from config import settings
 from models_resource_pool import PoolResource, PoolResourceStatus
+from router_scoreboard import ResourceEntry, ResourceScoreboard
+from resource_health import resource_health
+from resource_throttle import resource_throttle
+from resource_stats import resource_stats
 
 
 @dataclass
 class ResourceScore:
     """Scoring result for a resource"""
-    resource: PoolResource
+    resource: Union[ResourceEntry, PoolResource]
     total_score: float
     cost_score: float
     performance_score: float
@@ -34,7 +45,7 @@ class SmartRouter:
     
     Scoring Algorithm:
     - Cost (40%): Lower cost = higher score
-    - Performance (30%): Higher success rate = higher score
+    - Performance (30%): Lower recent error rate and p95 latency = higher score
     - Availability (20%): More quota remaining = higher score
     - Load Balancing (10%): Less recent usage = higher score
     """
@@ -45,14 +56,23 @@ class SmartRouter:
     WEIGHT_AVAILABILITY = 0.20
     WEIGHT_LOAD = 0.10
     
+    # Candidates drawn at random (weighted by score) to spread load
+    TOP_CANDIDATES = 3
+    
+    # PoolRouterConfig.strategy values
+    STRATEGIES = ("smart", "lowest_cost", "random", "round_robin")
+    _round_robin = itertools.count()
+    
     @classmethod
     def select_best_resource(
         cls,
         db: Session,
         provider: str,
         model_family: str,
-        required_quota: float = 1.0
-    ) -> Optional[PoolResource]:
+        required_quota: float = 1.0,
+        strategy: str = "smart",
+        exclude: Optional[Set[str]] = None
+    ) -> Optional[ResourceEntry]:
         """
         Select the best available resource for a request
         
@@ -61,48 +81,102 @@ class SmartRouter:
             provider: Provider name (e.g., "openai", "cloudflare")
             model_family: Model family (e.g., "gpt-4", "llama-3.1")
             required_quota: Required quota amount
+            strategy: How to choose among the top candidates (see STRATEGIES)
+            exclude: Resource ids not to use (e.g. already tried for this request)
             
         Returns:
-            Best resource or None if no suitable resource found
-        """
-        # Query all active resources for this provider/model
-        resources = db.query(PoolResource).filter(
-            and_(
-                PoolResource.provider == provider,
-                PoolResource.model_family == model_family,
-                PoolResource.status == PoolResourceStatus.ACTIVE,
-                PoolResource.current_quota >= required_quota
-            )
-        ).all()
-        
-        if not resources:
-            return None
+            Best resource (scoreboard entry) or None if no suitable resource found
         
-        # If only one resource, return it
-        if len(resources) == 1:
-            return resources[0]
-        
-        # Score all resources
-        scored_resources = [cls._score_resource(r, required_quota) for r in resources]
-        
-        # Sort by total score (descending)
-        scored_resources.sort(key=lambda x: x.total_score, reverse=True)
-        
-        # Add some randomness to top 3 to avoid always picking the same one
-        # This helps with load balancing
-        top_candidates = scored_resources[:min(3, len(scored_resources))]
-        if len(top_candidates) > 1:
-            # Weighted random selection from top candidates
-            weights = [c.total_score for c in top_candidates]
-            selected = random.choices(top_candidates, weights=weights, k=1)[0]
-            return selected.resource
-        
-        return scored_resources[0].resource
+        Claiming may wait on Redis (shared rate limits); async callers should
+        use rank_resources() + claim_async() instead.
+        """
+        for entry in cls.rank_resources(db, provider, model_family, required_quota, strategy, exclude):
+            if cls._claim(entry):
+                return entry
+        return None
+    
+    @classmethod
+    def rank_resources(
+        cls,
+        db: Session,
+        provider: str,
+        model_family: str,
+        required_quota: float = 1.0,
+        strategy: str = "smart",
+        exclude: Optional[Set[str]] = None
+    ) -> List[ResourceEntry]:
+        """Top candidates in the order the strategy wants them tried (nothing claimed yet)"""
+        scoreboard.ensure_loaded(db)
+        candidates = scoreboard.top(
+            provider,
+            model_family,
+            cls.TOP_CANDIDATES,
+            accept=cls._routable(required_quota, exclude)
+        )
+        return cls._order(candidates, strategy)
+    
+    @staticmethod
+    def _routable(required_quota: float, exclude: Optional[Set[str]] = None):
+        """Selection filter: enough quota, circuit not open, rate limit not reached"""
+        return lambda entry: (
+            entry.current_quota >= required_quota
+            and not (exclude and entry.id in exclude)
+            and resource_health.available(entry.id)
+            and resource_throttle.has_capacity(entry.id, entry.max_requests_per_minute)
+        )
+    
+    @classmethod
+    def _order(cls, candidates, strategy: str) -> List[ResourceEntry]:
+        """Order in which to try the top candidates (best first on input)"""
+        if strategy == "lowest_cost":
+            # No per-key cost is stored yet, so the best score (which includes cost) wins
+            return [entry for _, entry in candidates]
+        if strategy == "random":
+            entries = [entry for _, entry in candidates]
+            random.shuffle(entries)
+            return entries
+        if strategy == "round_robin":
+            entries = [entry for _, entry in candidates]
+            if not entries:
+                return entries
+            offset = next(cls._round_robin) % len(entries)
+            return entries[offset:] + entries[:offset]
+        # smart: weighted random (load balancing)
+        candidates = list(candidates)
+        ordered = []
+        while candidates:
+            weights = [score for score, _ in candidates]
+            index = random.choices(range(len(candidates)), weights=weights, k=1)[0]
+            ordered.append(candidates.pop(index)[1])
+        return ordered
+    
+    @staticmethod
+    def _claim(entry: ResourceEntry) -> bool:
+        """
+        Claim a ranked key for one request: its circuit breaker (a half-open
+        key only lets a few probes through) and a rate-limit token
+        """
+        if not resource_health.acquire(entry.id):
+            return False
+        if resource_throttle.try_acquire(entry.id, entry.max_requests_per_minute):
+            return True
+        resource_health.release(entry.id)
+        return False
+    
+    @staticmethod
+    async def claim_async(entry: ResourceEntry) -> bool:
+        """_claim() without blocking the event loop on Redis"""
+        if not resource_health.acquire(entry.id):
+            return False
+        if await resource_throttle.try_acquire_async(entry.id, entry.max_requests_per_minute):
+            return True
+        resource_health.release(entry.id)
+        return False
     
     @classmethod
     def _score_resource(
         cls,
-        resource: PoolResource,
+        resource: Union[ResourceEntry, PoolResource],
         required_quota: float
     ) -> ResourceScore:
         """
@@ -115,13 +189,16 @@ class SmartRouter:
         # Lower cost per unit = higher score
         # Normalize to 0-100 range
         # Assume cost ranges from 0 to 1000 credits
-        cost_per_unit = resource.cost_per_unit if hasattr(resource, 'cost_per_unit') else 0.5
+        cost_per_unit = getattr(resource, 'cost_per_unit', 0.5)
         cost_score = max(0, 100 - (cost_per_unit / 10))  # Normalized
         
         # Performance Score (30%)
-        # Based on success rate (0-100%)
-        success_rate = resource.success_rate or 100.0
-        performance_score = success_rate
+        # Recent (EWMA) error rate and p95 latency, lifetime stats until the key is used
+        performance_score = resource_health.performance_score(
+            resource.id,
+            resource.success_rate or 100.0,
+            resource.avg_response_time
+        )
         
         # Availability Score (20%)
         # More quota remaining = higher score
@@ -165,63 +242,69 @@ class SmartRouter:
         cls,
         db: Session,
         provider: str,
-        required_quota: float = 1.0
-    ) -> Optional[PoolResource]:
+        required_quota: float = 1.0,
+        exclude: Optional[Set[str]] = None
+    ) -> Optional[ResourceEntry]:
         """
         Get any available resource from provider (ignoring model family)
         
         Used as fallback when no exact model match is found
         """
-        resources = db.query(PoolResource).filter(
-            and_(
-                PoolResource.provider == provider,
-                PoolResource.status == PoolResourceStatus.ACTIVE,
-                PoolResource.current_quota >= required_quota
-            )
-        ).all()
-        
-        if not resources:
-            return None
-        
-        # Return highest scored resource
-        scored = [cls._score_resource(r, required_quota) for r in resources]
-        scored.sort(key=lambda x: x.total_score, reverse=True)
-        return scored[0].resource
+        for entry in cls.rank_fallback_resources(db, provider, required_quota, exclude):
+            if cls._claim(entry):
+                return entry
+        return None
     
     @classmethod
-    def record_usage(
+    def rank_fallback_resources(
         cls,
         db: Session,
-        resource: PoolResource,
+        provider: str,
+        required_quota: float = 1.0,
+        exclude: Optional[Set[str]] = None
+    ) -> List[ResourceEntry]:
+        """Best candidates of the provider across model families, best first"""
+        scoreboard.ensure_loaded(db)
+        best = scoreboard.top_for_provider(provider, cls.TOP_CANDIDATES, accept=cls._routable(required_quota, exclude))
+        return cls._order(best, "lowest_cost")
+    
+    @classmethod
+    def record_usage(
+        cls,
+        resource: Union[ResourceEntry, PoolResource],
         quota_used: float,
-        success: bool
+        success: bool,
+        latency_ms: Optional[float] = None
     ):
         """
         Record usage and update resource statistics
         
+        Nothing is written to the database here: the key moves on the
+        scoreboard right away and the counters are flushed later as atomic
+        increments (resource_stats.py), which also marks depleted keys.
+        
         Args:
-            db: Database session
             resource: The resource that was used
             quota_used: Amount of quota consumed
             success: Whether the request was successful
+            latency_ms: Upstream response time, feeds the latency trackers
         """
-        # Update quota
-        resource.current_quota = max(0, resource.current_quota - quota_used)
-        
-        # Update request counters
-        resource.total_requests = (resource.total_requests or 0) + 1
-        if success:
-            resource.successful_requests = (resource.successful_requests or 0) + 1
-        
-        # Recalculate success rate
-        if resource.total_requests > 0:
-            resource.success_rate = (resource.successful_requests / resource.total_requests) * 100
+        health = resource_health.record(resource.id, success, latency_ms)
+        resource_stats.add(resource.id, quota_used, success, health.ewma_latency)
         
-        # Check if depleted
-        if resource.current_quota <= 0:
-            resource.status = PoolResourceStatus.DEPLETED
+        def apply(entry: ResourceEntry):
+            entry.current_quota = max(0.0, entry.current_quota - quota_used)
+            entry.total_requests += 1
+            if success:
+                entry.successful_requests += 1
+            else:
+                entry.failed_requests += 1
+            entry.success_rate = entry.successful_requests / entry.total_requests * 100
+            if health.ewma_latency is not None:
+                entry.avg_response_time = health.ewma_latency
         
-        db.commit()
+        # Move the key on its board (dropped once depleted)
+        scoreboard.update(resource.id, apply)
     
     @classmethod
     def get_routing_stats(cls, db: Session) -> Dict[str, Any]:
@@ -244,10 +327,22 @@ class SmartRouter:
             "successful_requests": total_successful,
             "overall_success_rate": (total_successful / total_requests * 100) if total_requests > 0 else 0,
             "providers": len(set(r.provider for r in all_resources)),
-            "model_families": len(set(r.model_family for r in all_resources))
+            "model_families": len(set(r.model_family for r in all_resources)),
+            "scoreboard": scoreboard.stats(),
+            "circuits": resource_health.stats(),
+            "throttle": resource_throttle.stats(),
+            "pending_stats": resource_stats.stats()
         }
 
 
+# 进程内记分板：按 (provider, model_family) 排序，后台定期从数据库刷新
+scoreboard = ResourceScoreboard(
+    score_fn=lambda entry: max(SmartRouter._score_resource(entry, 0).total_score, 0.01),
+    refresh_interval=settings.pool_router_refresh_interval,
+    pending=resource_stats
+)
+
+
 # Example usage
 if __name__ == "__main__":
     # This would typically be called from the API router
@@ -256,14 +351,15 @@ if __name__ == "__main__":
     print("Smart Router - Example Usage")
     print("=" * 60)
     print("\nRouting Algorithm:")
-    print("1. Find all active resources matching provider + model")
-    print("2. Score each resource based on:")
+    print("1. Look up the provider + model board on the in-memory scoreboard")
+    print("2. Boards are kept sorted by score, based on:")
     print(f"   - Cost (40%): Lower cost = higher score")
-    print(f"   - Performance (30%): Higher success rate = higher score")
+    print(f"   - Performance (30%): Lower recent error rate / p95 latency = higher score")
     print(f"   - Availability (20%): More quota = higher score")
     print(f"   - Load Balancing (10%): Less usage = higher score")
-    print("3. Select highest scoring resource (with randomness in top 3)")
-    print("4. Record usage and update statistics")
+    print("3. Skip keys with an open circuit breaker or at their rate limit")
+    print("4. Select highest scoring resource (with randomness in top 3)")
+    print("5. Record usage, latency and failures")
     print("\nBenefits:")
     print("- Automatic cost optimization")
     print("- Performance-based selection")
@@ -0,0 +1,163 @@
+"""
+Tokenizer service
+Loads the tiktoken encoding once, memoizes token counts for repeated message
+contents (system prompts, resent history) and counts large inputs off the
+event loop in a worker thread pool.
+"""
+import asyncio
+import hashlib
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional
+from config import settings
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+
+class TokenizerService:
+    """
+    Token counting with a bounded LRU cache
+
+    Cache keys are content digests so long histories are not kept in memory twice.
+    """
+
+    ENCODING_NAME = "cl100k_base"  # Similar to GPT-3.5/4
+
+    def __init__(self, cache_size: int, offload_chars: int, max_workers: int):
+        self.cache_size = cache_size
+        self.offload_chars = offload_chars
+        self.max_workers = max_workers
+        self._encoding = None
+        self._encoding_loaded = False
+        self._cache: "OrderedDict[bytes, int]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    @property
+    def encoding(self):
+        """Load the encoding once (None if tiktoken is unavailable)"""
+        if not self._encoding_loaded:
+            with self._lock:
+                if not self._encoding_loaded:
+                    try:
+                        self._encoding = tiktoken.get_encoding(self.ENCODING_NAME) if tiktoken else None
+                    except Exception as e:
+                        print(f"⚠️  Tokenizer unavailable ({e}), falling back to character estimate")
+                        self._encoding = None
+                    self._encoding_loaded = True
+        return self._encoding
+
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(
+                        max_workers=self.max_workers,
+                        thread_name_prefix="tokenizer"
+                    )
+        return self._executor
+
+    @staticmethod
+    def _key(text: str) -> bytes:
+        return hashlib.blake2b(text.encode("utf-8", errors="replace"), digest_size=16).digest()
+
+    def _encode(self, text: str) -> int:
+        encoding = self.encoding
+        if encoding is None:
+            # Fallback: rough estimate of 1 token ≈ 4 characters
+            return len(text) // 4
+        try:
+            return len(encoding.encode(text, disallowed_special=()))
+        except Exception:
+            return len(text) // 4
+
+    def _get_cached(self, key: bytes) -> Optional[int]:
+        with self._lock:
+            count = self._cache.get(key)
+            if count is not None:
+                self._cache.move_to_end(key)
+            return count
+
+    def _put_cached(self, key: bytes, count: int):
+        with self._lock:
+            self._cache[key] = count
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def count_tokens(self, text: str, cache: bool = True) -> int:
+        """
+        Count tokens synchronously
+        Use cache=False for one-off fragments (e.g. stream deltas) to keep them out of the LRU
+        """
+        if not text:
+            return 0
+        if not cache:
+            return self._encode(text)
+        key = self._key(text)
+        count = self._get_cached(key)
+        if count is None:
+            count = self._encode(text)
+            self._put_cached(key, count)
+        return count
+
+    async def count_tokens_async(self, text: str) -> int:
+        """Count tokens, encoding large uncached inputs in the worker pool"""
+        return (await self.count_tokens_batch([text]))[0]
+
+    async def count_tokens_batch(self, texts: List[str]) -> List[int]:
+        """
+        Count tokens for many texts at once
+        Cached texts are served immediately; misses above the offload threshold
+        are encoded together in one worker-thread job.
+        """
+        counts: List[Optional[int]] = [None] * len(texts)
+        offload = []
+        for i, text in enumerate(texts):
+            if not text:
+                counts[i] = 0
+                continue
+            key = self._key(text)
+            cached = self._get_cached(key)
+            if cached is not None:
+                counts[i] = cached
+            elif len(text) >= self.offload_chars:
+                offload.append((i, key, text))
+            else:
+                counts[i] = self._encode(text)
+                self._put_cached(key, counts[i])
+
+        if offload:
+            loop = asyncio.get_running_loop()
+            results = await loop.run_in_executor(
+                self.executor,
+                lambda: [self._encode(text) for _, _, text in offload]
+            )
+            for (i, key, _), count in zip(offload, results):
+                counts[i] = count
+                self._put_cached(key, count)
+
+        return counts
+
+    def shutdown(self):
+        """Stop the worker pool (called at application shutdown)"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+    def cache_info(self) -> dict:
+        with self._lock:
+            return {"size": len(self._cache), "max_size": self.cache_size}
+
+
+# Application-wide tokenizer
+tokenizer_service = TokenizerService(
+    cache_size=settings.tokenizer_cache_size,
+    offload_chars=settings.tokenizer_offload_chars,
+    max_workers=settings.tokenizer_workers
+)
@@ -0,0 +1,362 @@
+"""
+Write-behind usage logging
+
+Chat requests enqueue UsageLog rows instead of committing them on the
+response path. A background task flushes them as one multi-row INSERT when
+the batch is full or the flush interval passes.
+
+Crash safety: records are appended to a spool segment file by a background
+writer thread shortly after they are enqueued (one write and flush per
+burst, never on the event loop), and any still unwritten are written before
+their batch is taken. A crash can lose only the records enqueued since the
+last spool write. A segment is deleted only after its batch is committed;
+leftover segments are replayed (skipping rows already inserted) on the next
+startup.
+Workers share the spool directory, so each holds an exclusive lock on its
+segments until they are deleted and recovery skips locked ones (a live
+worker's); the OS drops the locks of a worker that died.
+
+A batch that fails for good (a constraint or data error rather than a lost
+connection) is retried without the rows that already exist, and if it still
+fails it is moved to the spool's rejected/ directory so later logs keep
+flowing.
+
+Each batch also updates usage_daily_rollups in the same transaction.
+"""
+import asyncio
+import glob
+import json
+import os
+import threading
+import uuid
+from datetime import datetime
+from typing import Dict, List, Optional
+from sqlalchemy import insert, select
+from sqlalchemy.exc import DataError, IntegrityError
+from config import settings
+from database import async_engine
+from models import UsageLog
+from usage_rollups import apply_usage_rollups
+
+
+# Segment locks need fcntl (POSIX); elsewhere run a single worker per spool directory
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+DEFAULT_SPOOL_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "usage_spool")
+REJECTED_DIR = "rejected"
+
+# Errors that retrying the same rows can never fix
+PERMANENT_ERRORS = (IntegrityError, DataError)
+
+# Every row in a multi-row INSERT needs the same keys, so missing fields
+# are filled from the column's scalar default up front
+USAGE_LOG_DEFAULTS = {
+    c.name: c.default.arg if c.default is not None and c.default.is_scalar else None
+    for c in UsageLog.__table__.columns
+}
+
+
+class _Batch:
+    """Records taken from the buffer together with their (still locked) spool segment"""
+
+    def __init__(self, records: List[Dict], segment_path: Optional[str], segment_file=None):
+        self.records = records
+        self.segment_path = segment_path
+        self.segment_file = segment_file
+
+    def discard_segment(self):
+        """Delete the segment, then release its lock"""
+        if self.segment_path:
+            try:
+                os.remove(self.segment_path)
+            except OSError:
+                pass
+        if self.segment_file is not None:
+            self.segment_file.close()
+            self.segment_file = None
+
+
+def _lock_segment(f) -> bool:
+    """Exclusive non-blocking lock on an open segment; False if another worker holds it"""
+    if fcntl is None:
+        return True
+    try:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        return True
+    except OSError:
+        return False
+
+
+class UsageLogQueue:
+    """In-process queue of usage records with batched inserts and a file spool"""
+
+    def __init__(self, batch_size: int, flush_interval: float, spool_dir: str):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.spool_dir = spool_dir
+        self._buffer: List[Dict] = []
+        self._unspooled: List[str] = []  # Serialized records not yet in the spool segment
+        self._pending: List[_Batch] = []  # Batches whose insert failed, retried first
+        self._lock = threading.Lock()
+        self._spool_lock = threading.Lock()  # Serializes segment writes and detaching
+        self._segment_path: Optional[str] = None
+        self._segment_file = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._spool_wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._spool_task: Optional[asyncio.Task] = None
+        self._flush_lock: Optional[asyncio.Lock] = None
+        self._stopping = False
+
+    # ---------- spool ----------
+
+    def _open_segment(self):
+        os.makedirs(self.spool_dir, exist_ok=True)
+        name = f"{datetime.utcnow().strftime('%Y%m%d%H%M%S')}-{uuid.uuid4().hex[:8]}.jsonl"
+        self._segment_path = os.path.join(self.spool_dir, name)
+        self._segment_file = open(self._segment_path, "a", encoding="utf-8")
+        _lock_segment(self._segment_file)  # New unique file, nobody else has it
+
+    def _detach_segment(self):
+        """Stop writing to the current segment; returns (path, file) with the lock still held"""
+        segment = (self._segment_path, self._segment_file)
+        self._segment_file = None
+        self._segment_path = None
+        return segment
+
+    def _write_lines(self, lines: List[str]):
+        """Append serialized records to the current segment (caller holds _spool_lock)"""
+        if not lines:
+            return
+        try:
+            if self._segment_file is None:
+                self._open_segment()
+            self._segment_file.write("".join(line + "\n" for line in lines))
+            self._segment_file.flush()
+        except OSError as e:
+            print(f"⚠️  Usage spool write failed ({len(lines)} records kept in memory only): {e}")
+
+    def _write_spool(self):
+        """Write every record enqueued since the last spool write (runs in a worker thread)"""
+        with self._spool_lock:
+            with self._lock:
+                lines, self._unspooled = self._unspooled, []
+            self._write_lines(lines)
+
+    @staticmethod
+    def _serialize(record: Dict) -> str:
+        return json.dumps(
+            {k: v.isoformat() if isinstance(v, datetime) else v for k, v in record.items()},
+            ensure_ascii=False
+        )
+
+    @staticmethod
+    def _deserialize(line: str) -> Dict:
+        record = json.loads(line)
+        if record.get("timestamp"):
+            record["timestamp"] = datetime.fromisoformat(record["timestamp"])
+        return record
+
+    # ---------- producer side ----------
+
+    def enqueue(self, **fields) -> str:
+        """
+        Accept a usage record without touching the database or the disk
+        Returns the usage log id (usable as a reference before the row is written)
+        """
+        record = {k: fields.get(k, default) for k, default in USAGE_LOG_DEFAULTS.items()}
+        record["id"] = record["id"] or str(uuid.uuid4())
+        record["timestamp"] = record["timestamp"] or datetime.utcnow()
+        line = self._serialize(record)
+
+        with self._lock:
+            self._buffer.append(record)
+            self._unspooled.append(line)
+            buffered = len(self._buffer)
+
+        if self._spool_wakeup is not None:
+            self._spool_wakeup.set()
+        if buffered >= self.batch_size and self._wakeup is not None:
+            self._wakeup.set()
+        return record["id"]
+
+    # ---------- consumer side ----------
+
+    def _take_batch(self) -> Optional[_Batch]:
+        """Take the buffer with its segment, spooling any records not written yet (worker thread)"""
+        with self._spool_lock:
+            with self._lock:
+                if not self._buffer:
+                    return None
+                records, self._buffer = self._buffer, []
+                lines, self._unspooled = self._unspooled, []
+            self._write_lines(lines)
+            return _Batch(records, *self._detach_segment())
+
+    @staticmethod
+    async def _insert(records: List[Dict]):
+        """One multi-row INSERT plus the rollup upsert in a single transaction"""
+        async with async_engine.begin() as conn:
+            await conn.execute(insert(UsageLog.__table__), records)
+            await apply_usage_rollups(conn, records)
+
+    @staticmethod
+    async def _insert_missing(records: List[Dict]) -> int:
+        """Insert only the records whose id is not in usage_logs yet; returns how many"""
+        async with async_engine.begin() as conn:
+            ids = [r["id"] for r in records]
+            existing = set((await conn.execute(
+                select(UsageLog.id).where(UsageLog.id.in_(ids))
+            )).scalars().all())
+            missing = [{**USAGE_LOG_DEFAULTS, **r} for r in records if r["id"] not in existing]
+            if missing:
+                await conn.execute(insert(UsageLog.__table__), missing)
+                await apply_usage_rollups(conn, missing)
+        return len(missing)
+
+    def _reject(self, records: List[Dict], error: Exception):
+        """Set aside records that can never be inserted (kept for manual inspection)"""
+        name = f"{datetime.utcnow().strftime('%Y%m%d%H%M%S')}-{uuid.uuid4().hex[:8]}.jsonl"
+        path = os.path.join(self.spool_dir, REJECTED_DIR, name)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "w", encoding="utf-8") as f:
+                for record in records:
+                    f.write(self._serialize(record) + "\n")
+            print(f"❌ Moved {len(records)} usage logs to {path}: {error}")
+        except OSError as e:
+            print(f"❌ Dropped {len(records)} usage logs ({error}); could not write {path}: {e}")
+
+    async def flush(self) -> int:
+        """Write all buffered records; returns the number of rows inserted"""
+        if self._flush_lock is None:
+            self._flush_lock = asyncio.Lock()
+
+        async with self._flush_lock:
+            batch = await asyncio.to_thread(self._take_batch)
+            if batch is not None:
+                self._pending.append(batch)
+
+            inserted = 0
+            while self._pending:
+                batch = self._pending[0]
+                try:
+                    try:
+                        await self._insert(batch.records)
+                        inserted += len(batch.records)
+                    except PERMANENT_ERRORS:
+                        # e.g. rows another process already replayed: insert the rest
+                        inserted += await self._insert_missing(batch.records)
+                except PERMANENT_ERRORS as e:
+                    self._reject(batch.records, e)
+                except Exception as e:
+                    print(f"⚠️  Usage log flush failed ({len(batch.records)} records kept for retry): {e}")
+                    break
+                self._pending.pop(0)
+                batch.discard_segment()
+            return inserted
+
+    async def _run(self):
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    async def _run_spool_writer(self):
+        while True:
+            await self._spool_wakeup.wait()
+            self._spool_wakeup.clear()
+            await asyncio.to_thread(self._write_spool)
+
+    async def recover(self) -> int:
+        """Replay spool segments left over from a previous run"""
+        current = self._segment_path
+        segments = sorted(
+            path for path in glob.glob(os.path.join(self.spool_dir, "*.jsonl"))
+            if path != current
+        )
+        recovered = 0
+        for path in segments:
+            try:
+                f = open(path, "r", encoding="utf-8")
+            except OSError:
+                continue  # Deleted by its owner meanwhile
+            batch = _Batch([], path, f)
+            try:
+                if not _lock_segment(f):
+                    f.close()  # Segment of a live worker
+                    continue
+                # A crash mid-write can leave a truncated last line
+                for line in f:
+                    try:
+                        batch.records.append(self._deserialize(line))
+                    except ValueError:
+                        continue
+
+                if batch.records:
+                    try:
+                        recovered += await self._insert_missing(batch.records)
+                    except PERMANENT_ERRORS as e:
+                        self._reject(batch.records, e)
+                batch.discard_segment()
+            except Exception as e:
+                f.close()
+                print(f"⚠️  Failed to replay usage spool {path}: {e}")
+
+        if recovered:
+            print(f"♻️  Recovered {recovered} usage logs from spool")
+        return recovered
+
+    async def start(self):
+        """Replay the spool and start the background flusher (startup hook)"""
+        if self._task is not None:
+            return
+        self._wakeup = asyncio.Event()
+        self._spool_wakeup = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._stopping = False
+        await self.recover()
+        self._task = asyncio.create_task(self._run())
+        self._spool_task = asyncio.create_task(self._run_spool_writer())
+        print(f"✅ Usage log queue started (batch {self.batch_size}, every {self.flush_interval}s)")
+
+    async def stop(self):
+        """Stop the flusher and drain everything still buffered (shutdown hook)"""
+        if self._task is not None:
+            # Let an in-flight flush finish instead of cancelling it mid-insert
+            self._stopping = True
+            self._wakeup.set()
+            await self._task
+            self._task = None
+        if self._spool_task is not None:
+            self._spool_task.cancel()
+            try:
+                await self._spool_task
+            except asyncio.CancelledError:
+                pass
+            self._spool_task = None
+            self._spool_wakeup = None
+        inserted = await self.flush()
+        if inserted:
+            print(f"✅ Drained {inserted} usage logs")
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "buffered": len(self._buffer),
+                "pending_retry": sum(len(b.records) for b in self._pending),
+            }
+
+
+# Application-wide usage log queue
+usage_log_queue = UsageLogQueue(
+    batch_size=settings.usage_log_batch_size,
+    flush_interval=settings.usage_log_flush_interval,
+    spool_dir=settings.usage_log_spool_dir or DEFAULT_SPOOL_DIR
+)
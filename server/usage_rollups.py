@@ -0,0 +1,97 @@
+"""
+Usage rollups
+
+Keeps usage_daily_rollups in step with usage_logs: every batch of usage
+logs written by the usage log queue is folded into per (user, UTC day,
+model, task) sums with an INSERT ... ON CONFLICT DO UPDATE in the same
+transaction. Dashboards read the rollups instead of the raw log.
+
+Databases without ON CONFLICT support (anything but PostgreSQL and SQLite)
+get a portable path: a relative UPDATE per row, and an INSERT under a
+savepoint when the row does not exist yet (retried as an UPDATE if a
+concurrent batch inserted it first).
+"""
+import uuid
+from datetime import datetime
+from typing import Dict, List, Tuple
+from sqlalchemy import and_, insert, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
+from models import UsageDailyRollup
+
+ROLLUP_KEY = ["user_id", "day", "model_name", "task_type"]
+ROLLUP_SUMS = ["requests", "input_tokens", "output_tokens", "total_tokens"]
+UPSERT_DIALECTS = ("postgresql", "sqlite")
+
+
+def aggregate_usage(records: List[Dict]) -> List[Dict]:
+    """Fold usage log records into one rollup row per key"""
+    rows: Dict[Tuple, Dict] = {}
+    for record in records:
+        timestamp = record.get("timestamp") or datetime.utcnow()
+        key = (
+            record["user_id"],
+            timestamp.date(),
+            record["model_name"],
+            record.get("task_type") or "text-generation",
+        )
+        row = rows.get(key)
+        if row is None:
+            row = rows[key] = {
+                "id": str(uuid.uuid4()),
+                **dict(zip(ROLLUP_KEY, key)),
+                **{name: 0 for name in ROLLUP_SUMS},
+            }
+        row["requests"] += 1
+        row["input_tokens"] += record.get("input_tokens") or 0
+        row["output_tokens"] += record.get("output_tokens") or 0
+        row["total_tokens"] += record.get("total_tokens") or 0
+    return list(rows.values())
+
+
+def rollup_upsert(dialect_name: str, rows: List[Dict]):
+    """INSERT ... ON CONFLICT (key) DO UPDATE SET sum = sum + excluded.sum"""
+    if dialect_name == "postgresql":
+        stmt = postgresql.insert(UsageDailyRollup).values(rows)
+    elif dialect_name == "sqlite":
+        stmt = sqlite.insert(UsageDailyRollup).values(rows)
+    else:
+        raise ValueError(f"No ON CONFLICT upsert on {dialect_name}, use apply_usage_rollups")
+
+    table = UsageDailyRollup.__table__
+    return stmt.on_conflict_do_update(
+        index_elements=ROLLUP_KEY,
+        set_={name: table.c[name] + stmt.excluded[name] for name in ROLLUP_SUMS}
+    )
+
+
+def rollup_increment(row: Dict):
+    """UPDATE ... SET sum = sum + :sum for one existing rollup row"""
+    table = UsageDailyRollup.__table__
+    return update(table).where(
+        and_(*[table.c[name] == row[name] for name in ROLLUP_KEY])
+    ).values({name: table.c[name] + row[name] for name in ROLLUP_SUMS})
+
+
+async def _apply_portable(conn, rows: List[Dict]):
+    """Rollup upsert for databases without ON CONFLICT"""
+    for row in rows:
+        if (await conn.execute(rollup_increment(row))).rowcount:
+            continue
+        try:
+            async with conn.begin_nested():
+                await conn.execute(insert(UsageDailyRollup.__table__).values(row))
+        except IntegrityError:
+            # Another batch created the row between our UPDATE and INSERT
+            await conn.execute(rollup_increment(row))
+
+
+async def apply_usage_rollups(conn, records: List[Dict]):
+    """Add a batch of usage logs to the rollups (on an open AsyncConnection transaction)"""
+    rows = aggregate_usage(records)
+    if not rows:
+        return
+    if conn.dialect.name in UPSERT_DIALECTS:
+        await conn.execute(rollup_upsert(conn.dialect.name, rows))
+    else:
+        await _apply_portable(conn, rows)
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""
+Streaming chat test: a client that disconnects mid-stream is still billed
+
+Drives the StreamingResponse of POST /ai/chat/stream (chat_stream) over
+ASGI with a fake upstream that sends one token and then stalls. The client
+disconnects after the first chunk, which cancels the response task group.
+The partial stream must still leave a usage log row and a credit debit.
+
+    python tests/test_chat_stream_disconnect.py
+    pytest tests/test_chat_stream_disconnect.py
+"""
+import asyncio
+import os
+import sys
+import tempfile
+
+SERVER_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "server")
+sys.path.insert(0, SERVER_DIR)
+
+MODEL_ID = "@cf/meta/llama-3.1-8b-instruct"
+BALANCE = 100.0
+
+
+def setup_environment(database_url: str):
+    """Server settings needed to import the models (no external calls are made)"""
+    os.environ["DATABASE_URL"] = database_url
+    os.environ.setdefault("JWT_SECRET_KEY", "stream-test")
+    os.environ.setdefault("CLOUDFLARE_API_KEY", "stream-test")
+    os.environ.setdefault("CLOUDFLARE_ACCOUNT_ID", "stream-test")
+
+
+async def fake_upstream(messages, model, temperature=0.7, max_tokens=2048):
+    """One delta, then an upstream that never finishes"""
+    yield {"token": "Hello", "output_tokens": 1}
+    await asyncio.sleep(3600)
+
+
+async def stream_and_disconnect(async_url: str, user_id: str, spool_dir: str):
+    """Run chat_stream until the first chunk is sent, then disconnect; returns the chunks"""
+    from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+    from models import User
+    from schemas import ChatRequest, ChatMessage
+    from routers import ai_router
+    import usage_log_queue as queue_module
+
+    engine = create_async_engine(async_url)
+    Session = async_sessionmaker(engine, expire_on_commit=False)
+    queue = queue_module.UsageLogQueue(batch_size=100, flush_interval=60, spool_dir=spool_dir)
+
+    # Route the stream at the fake upstream and this test's database
+    originals = (ai_router.stream_cloudflare_ai, ai_router.usage_log_queue, queue_module.async_engine)
+    ai_router.stream_cloudflare_ai = fake_upstream
+    ai_router.usage_log_queue = queue
+    queue_module.async_engine = engine
+
+    chunks = []
+    disconnected = asyncio.Event()
+
+    async def receive():
+        await disconnected.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        if message["type"] == "http.response.body" and message.get("body"):
+            chunks.append(message["body"].decode())
+            disconnected.set()
+
+    try:
+        async with Session() as db:
+            user = await db.get(User, user_id)
+            request = ChatRequest(messages=[ChatMessage(role="user", content="Say hello")], model=MODEL_ID)
+            response = await ai_router.chat_stream(request, current_user=user, db=db)
+            scope = {"type": "http", "method": "POST", "path": "/ai/chat/stream", "headers": []}
+            await asyncio.wait_for(response(scope, receive, send), timeout=30)
+        await queue.flush()
+    finally:
+        ai_router.stream_cloudflare_ai, ai_router.usage_log_queue, queue_module.async_engine = originals
+        await engine.dispose()
+    return chunks
+
+
+def run_test(db_path: str, spool_dir: str) -> bool:
+    database_url = f"sqlite:///{db_path}"
+    setup_environment(database_url)
+
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import sessionmaker
+    from database import Base
+    from models import User, UsageLog
+    from models_credit import UserCredit, CreditTransaction, ModelPricing
+
+    engine = create_engine(database_url)
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    Session = sessionmaker(bind=engine)
+
+    with Session() as db:
+        user = User(username="stream_user", email="stream@test.local", password_hash="x", api_key="st_user")
+        db.add(user)
+        db.flush()
+        db.add(UserCredit(user_id=user.id, balance=BALANCE, total_deposited=BALANCE))
+        db.add(ModelPricing(model_id=MODEL_ID, model_name="Llama 3.1 8B", provider="Meta", tier="small",
+                            credits_per_1k_input=1.0, credits_per_1k_output=1.0))
+        db.commit()
+        user_id = user.id
+
+    chunks = asyncio.run(stream_and_disconnect(f"sqlite+aiosqlite:///{db_path}", user_id, spool_dir))
+
+    with Session() as db:
+        logs = db.query(UsageLog).filter(UsageLog.user_id == user_id).all()
+        debits = db.query(CreditTransaction).filter(CreditTransaction.user_id == user_id).all()
+        balance = db.query(UserCredit.balance).filter(UserCredit.user_id == user_id).scalar()
+    engine.dispose()
+
+    print(f"📡 {len(chunks)} chunk(s) before the disconnect, {len(logs)} usage log(s), {len(debits)} debit(s)")
+    checks = [
+        ("client got the first token", len(chunks) == 1 and "Hello" in chunks[0]),
+        ("usage log written for the partial stream", len(logs) == 1 and logs[0].output_tokens == 1),
+        ("partial stream debited", len(logs) == 1 and len(debits) == 1 and debits[0].reference_id == logs[0].id),
+        ("balance lowered by the debit", len(debits) == 1 and debits[0].amount < 0
+         and abs(balance - (BALANCE + debits[0].amount)) < 1e-9),
+    ]
+    passed = True
+    for name, ok in checks:
+        print(f"   {'✅' if ok else '❌'} {name}")
+        passed = passed and ok
+    return passed
+
+
+def test_disconnect_mid_stream_is_billed():
+    with tempfile.TemporaryDirectory() as tmp:
+        assert run_test(os.path.join(tmp, "stream.db"), os.path.join(tmp, "spool"))
+
+
+if __name__ == "__main__":
+    with tempfile.TemporaryDirectory() as tmp:
+        ok = run_test(os.path.join(tmp, "stream.db"), os.path.join(tmp, "spool"))
+    sys.exit(0 if ok else 1)
@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+"""
+Keyset pagination test: rows created in the same second
+
+Creates several pool usage logs within one second and follows
+X-Next-Cursor through GET /api/resource-pool/admin/usage-logs
+(admin_get_usage_logs) page by page. Every row must come back exactly
+once and the walk must end. Covers both rows written by the ORM and rows
+left by the old second-precision server default (after
+add_pagination_indexes.py normalizes them).
+
+Also walks GET /api/usage/logs (get_usage_logs) and
+GET /api/credits/transactions (get_my_transactions), which build their
+pages on the legacy Query API: first without a cursor, then from an
+offset, then following X-Next-Cursor to the end.
+
+    python tests/test_pagination_cursor.py
+    pytest tests/test_pagination_cursor.py
+"""
+import asyncio
+import os
+import sys
+import tempfile
+from datetime import datetime
+
+SERVER_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "server")
+sys.path.insert(0, SERVER_DIR)
+
+ROWS = 5
+PAGE_SIZE = 2
+
+
+def setup_environment(database_url: str):
+    """Server settings needed to import the models (no external calls are made)"""
+    os.environ["DATABASE_URL"] = database_url
+    os.environ.setdefault("JWT_SECRET_KEY", "pagination-test")
+    os.environ.setdefault("CLOUDFLARE_API_KEY", "pagination-test")
+    os.environ.setdefault("CLOUDFLARE_ACCOUNT_ID", "pagination-test")
+
+
+async def walk_pages(async_url: str, admin_id: str):
+    """Follow X-Next-Cursor until it disappears; returns the ids of every page"""
+    from fastapi import Response
+    from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+    from models import User
+    from routers.resource_pool_router import admin_get_usage_logs
+
+    engine = create_async_engine(async_url)
+    Session = async_sessionmaker(engine, expire_on_commit=False)
+    pages, cursor = [], None
+    async with Session() as db:
+        admin = await db.get(User, admin_id)
+        for _ in range(ROWS + 2):  # More pages than rows means the cursor is stuck
+            response = Response()
+            logs = await admin_get_usage_logs(
+                response, limit=PAGE_SIZE, offset=0, cursor=cursor, current_user=admin, db=db
+            )
+            pages.append([log["id"] for log in logs])
+            cursor = response.headers.get("X-Next-Cursor")
+            if not cursor:
+                break
+    await engine.dispose()
+    return pages, cursor
+
+
+def run_test(db_path: str, legacy_timestamps: bool) -> bool:
+    database_url = f"sqlite:///{db_path}"
+    setup_environment(database_url)
+
+    from sqlalchemy import create_engine, text
+    from sqlalchemy.orm import sessionmaker
+    from database import Base
+    from models import User
+    from models_resource_pool import PoolResource, PoolUsageLog
+    from add_pagination_indexes import normalize_pool_usage_timestamps
+
+    engine = create_engine(database_url)
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    Session = sessionmaker(bind=engine)
+
+    same_second = datetime.utcnow().replace(microsecond=0)  # Legacy variant only
+    with Session() as db:
+        admin = User(username="pagination_admin", email="admin@pagination.local", password_hash="x",
+                     api_key="pg_admin", is_admin=True)
+        db.add(admin)
+        db.flush()
+        resource = PoolResource(owner_id=admin.id, provider="openai", api_key_encrypted="x",
+                                original_quota=10.0, current_quota=10.0)
+        db.add(resource)
+        db.flush()
+        for i in range(ROWS):
+            db.add(PoolUsageLog(user_id=admin.id, resource_id=resource.id, resource_owner_id=admin.id,
+                                model="gpt-4", provider="openai", credits_charged=0.0))
+        db.commit()
+        admin_id = admin.id
+        expected = {log_id for (log_id,) in db.query(PoolUsageLog.id)}
+
+    with engine.connect() as conn:
+        seconds = conn.execute(text("SELECT COUNT(DISTINCT substr(created_at, 1, 19)) FROM pool_usage_logs")).scalar()
+    if seconds != 1 and not legacy_timestamps:
+        print("⚠️  Rows straddled a second boundary, retrying")
+        return run_test(db_path, legacy_timestamps)
+
+    if legacy_timestamps:
+        # What the old server_default=func.now() stored: whole seconds, no fraction
+        with engine.begin() as conn:
+            conn.execute(text("UPDATE pool_usage_logs SET created_at = :ts"),
+                         {"ts": same_second.strftime("%Y-%m-%d %H:%M:%S")})
+        normalize_pool_usage_timestamps(engine)
+    engine.dispose()
+
+    pages, cursor = asyncio.run(walk_pages(f"sqlite+aiosqlite:///{db_path}", admin_id))
+    seen = [log_id for page in pages for log_id in page]
+
+    label = "legacy second-precision rows" if legacy_timestamps else "ORM rows"
+    print(f"📄 {label}: {ROWS} rows in one second, pages of {PAGE_SIZE}: {[len(p) for p in pages]}")
+    checks = [
+        ("walk ends (no repeating cursor)", cursor is None),
+        ("no row returned twice", len(seen) == len(set(seen))),
+        ("every row returned", set(seen) == expected),
+    ]
+    passed = True
+    for name, ok in checks:
+        print(f"   {'✅' if ok else '❌'} {name}")
+        passed = passed and ok
+    return passed
+
+
+def walk_sync_pages(handler, **kwargs):
+    """Follow X-Next-Cursor through a sync list endpoint; returns the ids of every page"""
+    from fastapi import Response
+
+    pages, cursor = [], None
+    for _ in range(ROWS + 2):  # More pages than rows means the cursor is stuck
+        response = Response()
+        rows = handler(response, limit=PAGE_SIZE, offset=0, cursor=cursor, **kwargs)
+        pages.append([row.id for row in rows])
+        cursor = response.headers.get("X-Next-Cursor")
+        if not cursor:
+            break
+    return pages, cursor
+
+
+def run_legacy_query_test(db_path: str) -> bool:
+    database_url = f"sqlite:///{db_path}"
+    setup_environment(database_url)
+
+    from fastapi import Response
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import sessionmaker
+    from database import Base
+    from models import User, UsageLog
+    from models_credit import UserCredit, CreditTransaction
+    from routers.usage_router import get_usage_logs
+    from routers.credit_router import get_my_transactions
+
+    engine = create_engine(database_url)
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    Session = sessionmaker(bind=engine)
+
+    passed = True
+    with Session() as db:
+        user = User(username="pagination_user", email="user@pagination.local", password_hash="x",
+                    api_key="pg_user")
+        db.add(user)
+        db.flush()
+        credit = UserCredit(user_id=user.id, balance=0.0)
+        db.add(credit)
+        db.flush()
+        for i in range(ROWS):
+            db.add(UsageLog(user_id=user.id, model_name="test-model"))
+            db.add(CreditTransaction(user_credit_id=credit.id, user_id=user.id, type="bonus",
+                                     amount=1.0, balance_before=float(i), balance_after=float(i + 1)))
+        db.commit()
+
+        endpoints = [
+            ("GET /api/usage/logs", get_usage_logs, UsageLog, UsageLog.timestamp),
+            ("GET /api/credits/transactions", get_my_transactions, CreditTransaction, CreditTransaction.created_at),
+        ]
+        for label, handler, model, timestamp in endpoints:
+            newest_first = [row_id for (row_id,) in
+                            db.query(model.id).order_by(timestamp.desc(), model.id.desc())]
+            first = handler(Response(), limit=PAGE_SIZE, offset=0, cursor=None, current_user=user, db=db)
+            skipped = handler(Response(), limit=PAGE_SIZE, offset=1, cursor=None, current_user=user, db=db)
+            pages, cursor = walk_sync_pages(handler, current_user=user, db=db)
+            seen = [row_id for page in pages for row_id in page]
+
+            print(f"📄 {label}: {ROWS} rows, pages of {PAGE_SIZE}: {[len(p) for p in pages]}")
+            checks = [
+                ("first page without cursor", [row.id for row in first] == newest_first[:PAGE_SIZE]),
+                ("offset skips rows", [row.id for row in skipped] == newest_first[1:1 + PAGE_SIZE]),
+                ("walk ends (no repeating cursor)", cursor is None),
+                ("cursor walk returns every row once, newest first", seen == newest_first),
+            ]
+            for name, ok in checks:
+                print(f"   {'✅' if ok else '❌'} {name}")
+                passed = passed and ok
+    engine.dispose()
+    return passed
+
+
+def test_same_second_rows():
+    with tempfile.TemporaryDirectory() as tmp:
+        assert run_test(os.path.join(tmp, "orm.db"), legacy_timestamps=False)
+
+
+def test_same_second_legacy_rows():
+    with tempfile.TemporaryDirectory() as tmp:
+        assert run_test(os.path.join(tmp, "legacy.db"), legacy_timestamps=True)
+
+
+def test_legacy_query_endpoints():
+    with tempfile.TemporaryDirectory() as tmp:
+        assert run_legacy_query_test(os.path.join(tmp, "query.db"))
+
+
+if __name__ == "__main__":
+    with tempfile.TemporaryDirectory() as tmp:
+        ok = run_test(os.path.join(tmp, "orm.db"), False)
+        ok = run_test(os.path.join(tmp, "legacy.db"), True) and ok
+        ok = run_legacy_query_test(os.path.join(tmp, "query.db")) and ok
+    sys.exit(0 if ok else 1)
@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+"""
+Pool request executor test: retry, failover and hedging
+
+Drives PoolRequestExecutor.execute with a fake upstream call against pool
+keys on a throwaway SQLite database and checks which key answered and the
+routing_reason written to pool_usage_logs for every attempt:
+
+- retry: the primary key fails, the next key of the family answers
+- failover: the only key of the family fails, a key of another family
+  of the same provider answers
+- hedge: the primary key is slow, the hedged duplicate answers first and
+  the primary is cancelled
+
+    python tests/test_pool_executor.py
+    pytest tests/test_pool_executor.py
+"""
+import asyncio
+import os
+import sys
+import tempfile
+
+SERVER_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "server")
+sys.path.insert(0, SERVER_DIR)
+
+PROVIDER = "openai"
+FAMILY = "gpt-4"
+MAX_RETRY_ATTEMPTS = 2
+
+
+def setup_environment(database_url: str):
+    """Server settings needed to import the models (no external calls are made)"""
+    os.environ["DATABASE_URL"] = database_url
+    os.environ.setdefault("JWT_SECRET_KEY", "pool-test")
+    os.environ.setdefault("CLOUDFLARE_API_KEY", "pool-test")
+    os.environ.setdefault("CLOUDFLARE_ACCOUNT_ID", "pool-test")
+
+
+def create_pool(database_url: str, keys):
+    """
+    One PoolResource per (name, model_family, total_requests); returns {name: id}
+    Fewer past requests scores higher, so keys are tried in the given order.
+    """
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import sessionmaker
+    from database import Base
+    from models import User
+    from models_resource_pool import PoolResource, PoolRouterConfig
+    from smart_router import scoreboard
+
+    engine = create_engine(database_url)
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    Session = sessionmaker(bind=engine)
+
+    with Session() as db:
+        owner = User(username="pool_owner", email="owner@pool.local", password_hash="x", api_key="pool_owner")
+        db.add(owner)
+        db.flush()
+        # lowest_cost tries the candidates best score first (no random ordering)
+        db.add(PoolRouterConfig(name="test", strategy="lowest_cost",
+                                max_retry_attempts=MAX_RETRY_ATTEMPTS, failover_enabled=True))
+        ids = {}
+        for name, family, total_requests in keys:
+            resource = PoolResource(owner_id=owner.id, provider=PROVIDER, model_family=family,
+                                    api_key_encrypted=name, original_quota=10.0, current_quota=10.0,
+                                    total_requests=total_requests, successful_requests=total_requests)
+            db.add(resource)
+            db.flush()
+            ids[name] = resource.id
+        db.commit()
+        scoreboard.load(db)  # Replace whatever an earlier scenario left on the scoreboard
+    engine.dispose()
+    return ids
+
+
+async def execute(async_url: str, call, hedge_after_ms: float = 0.0):
+    """Run one request through a fresh executor; returns (winning key name, routing reasons by key name)"""
+    from sqlalchemy import select
+    from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+    from models_resource_pool import PoolUsageLog
+    from pool_executor import PoolRequestExecutor
+
+    engine = create_async_engine(async_url)
+    Session = async_sessionmaker(engine, expire_on_commit=False)
+    executor = PoolRequestExecutor(attempt_timeout=5.0, hedge_after_ms=hedge_after_ms, policy_ttl=0.0)
+    try:
+        async with Session() as db:
+            execution = await executor.execute(db, user_id="pool-user", provider=PROVIDER,
+                                               model_family=FAMILY, model="gpt-4", call=call)
+            logs = (await db.execute(select(PoolUsageLog))).scalars().all()
+    finally:
+        await engine.dispose()
+    # api_key_encrypted holds the key name in these tests
+    names = {attempt.resource.id: attempt.resource.api_key_encrypted for attempt in execution.attempts}
+    reasons = {names[log.resource_id]: log.routing_reason for log in logs}
+    return execution.resource.api_key_encrypted, reasons
+
+
+def report(label: str, winner: str, reasons: dict, checks) -> bool:
+    print(f"🔀 {label}: answered by {winner}")
+    for name, reason in sorted(reasons.items()):
+        print(f"   {name}: {reason}")
+    passed = True
+    for name, ok in checks:
+        print(f"   {'✅' if ok else '❌'} {name}")
+        passed = passed and ok
+    return passed
+
+
+def run_retry_test(db_path: str) -> bool:
+    database_url = f"sqlite:///{db_path}"
+    setup_environment(database_url)
+    from pool_executor import PoolCallError, PoolCallResult
+
+    create_pool(database_url, [("key-a", FAMILY, 0), ("key-b", FAMILY, 5000)])
+
+    async def call(entry):
+        if entry.api_key_encrypted == "key-a":
+            raise PoolCallError("upstream 500")
+        return PoolCallResult(response="ok", cost_amount=0.1)
+
+    winner, reasons = asyncio.run(execute(f"sqlite+aiosqlite:///{db_path}", call))
+    budget = MAX_RETRY_ATTEMPTS + 1
+    return report("retry", winner, reasons, [
+        ("next key of the family answered", winner == "key-b"),
+        ("failing primary logged as error",
+         reasons.get("key-a", "").startswith(f"lowest_cost primary attempt 1/{budget}: error")),
+        ("retry logged as success",
+         reasons.get("key-b", "").startswith(f"lowest_cost retry attempt 2/{budget}: success")),
+    ])
+
+
+def run_failover_test(db_path: str) -> bool:
+    database_url = f"sqlite:///{db_path}"
+    setup_environment(database_url)
+    from pool_executor import PoolCallError, PoolCallResult
+
+    create_pool(database_url, [("key-a", FAMILY, 0), ("key-c", "gpt-3.5", 0)])
+
+    async def call(entry):
+        if entry.api_key_encrypted == "key-a":
+            raise PoolCallError("upstream 500")
+        return PoolCallResult(response="ok", cost_amount=0.1)
+
+    winner, reasons = asyncio.run(execute(f"sqlite+aiosqlite:///{db_path}", call))
+    budget = MAX_RETRY_ATTEMPTS + 1
+    return report("failover", winner, reasons, [
+        ("key of another family answered", winner == "key-c"),
+        ("failing primary logged as error",
+         reasons.get("key-a", "").startswith(f"lowest_cost primary attempt 1/{budget}: error")),
+        ("failover retry logged as success",
+         reasons.get("key-c", "").startswith(f"lowest_cost retry:failover attempt 2/{budget}: success")),
+    ])
+
+
+def run_hedge_test(db_path: str) -> bool:
+    database_url = f"sqlite:///{db_path}"
+    setup_environment(database_url)
+    from pool_executor import PoolCallResult
+
+    create_pool(database_url, [("key-a", FAMILY, 0), ("key-b", FAMILY, 5000)])
+
+    async def call(entry):
+        if entry.api_key_encrypted == "key-a":
+            await asyncio.sleep(3)  # Slow primary, well past the hedge delay
+        return PoolCallResult(response="ok", cost_amount=0.1)
+
+    winner, reasons = asyncio.run(execute(f"sqlite+aiosqlite:///{db_path}", call, hedge_after_ms=50))
+    budget = MAX_RETRY_ATTEMPTS + 1
+    return report("hedge", winner, reasons, [
+        ("hedged key answered", winner == "key-b"),
+        ("slow primary logged as cancelled",
+         reasons.get("key-a", "").startswith(f"lowest_cost primary attempt 1/{budget}: cancelled")),
+        ("hedge logged as success",
+         reasons.get("key-b", "").startswith(f"lowest_cost hedge attempt 2/{budget}: success")),
+    ])
+
+
+def test_retry_on_next_key():
+    with tempfile.TemporaryDirectory() as tmp:
+        assert run_retry_test(os.path.join(tmp, "retry.db"))
+
+
+def test_failover_to_other_family():
+    with tempfile.TemporaryDirectory() as tmp:
+        assert run_failover_test(os.path.join(tmp, "failover.db"))
+
+
+def test_hedge_wins_over_slow_primary():
+    with tempfile.TemporaryDirectory() as tmp:
+        assert run_hedge_test(os.path.join(tmp, "hedge.db"))
+
+
+if __name__ == "__main__":
+    with tempfile.TemporaryDirectory() as tmp:
+        ok = run_retry_test(os.path.join(tmp, "retry.db"))
+        ok = run_failover_test(os.path.join(tmp, "failover.db")) and ok
+        ok = run_hedge_test(os.path.join(tmp, "hedge.db")) and ok
+    sys.exit(0 if ok else 1)